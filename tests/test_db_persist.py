@@ -0,0 +1,134 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ttb.cfg.config import OverrideConfig
+from ttb.db.db_persist import DBPersister, SQLiteBackend, PNL, EVENTS
+
+
+class FlakyBackend:
+    """
+    Backend failing its first `failures` inserts before handing them to the wrapped backend. With
+    write_then_fail the failing inserts are written first, as a DB timing out after the write would.
+    """
+
+    def __init__(self, backend, failures: int, write_then_fail: bool = False):
+        self.backend = backend
+        self.failures = failures
+        self.write_then_fail = write_then_fail
+        self.calls = 0
+
+    def insert_many(self, collection, docs):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            if self.write_then_fail:
+                self.backend.insert_many(collection, docs)
+            raise ConnectionError('DB unreachable')
+        self.backend.insert_many(collection, docs)
+
+    def close(self):
+        self.backend.close()
+
+
+class DBPersisterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.spill_dir = os.path.join(self.tmp_dir, 'spill')
+        self.db_path = os.path.join(self.tmp_dir, 'trading.db')
+        self.conf = OverrideConfig(db_backend='sqlite', db_sqlite_path=self.db_path)
+        self.sqlite = None
+        self.persister = None
+
+    def tearDown(self):
+        if self.persister:
+            self.persister.close()
+        if self.sqlite:
+            self.sqlite.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def new_persister(self, backend=None, max_retries: int = 2):
+        ## flushed by the tests only, the background thread never wakes up on its own
+        self.persister = DBPersister(self.conf, backend=backend, batch_size=10000, flush_interval_seconds=3600,
+                                     spill_dir=self.spill_dir, max_retries=max_retries, backoff_seconds=0.5)
+        return self.persister
+
+    def flaky(self, failures: int, write_then_fail: bool = False):
+        self.sqlite = SQLiteBackend(self.db_path)
+        return FlakyBackend(self.sqlite, failures, write_then_fail)
+
+    def spill_file(self, collection):
+        return os.path.join(self.spill_dir, f'{collection}.jsonl')
+
+    def test_insert_retried_with_backoff(self):
+        backend = self.flaky(failures=2)
+        persister = self.new_persister(backend, max_retries=2)
+        for i in range(3):
+            persister.insert_pnl({'ticker': f'T{i}', 'qty': i})
+
+        with mock.patch('ttb.db.db_persist.time.sleep') as sleep:
+            persister.flush()
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.5, 1.0])
+        self.assertEqual(backend.calls, 3)
+        self.assertEqual([d['ticker'] for d in self.sqlite.find(PNL)], ['T0', 'T1', 'T2'])
+        self.assertEqual(persister.stats(), dict(pending=0, inserted=3, spilled=0, retries=2))
+        self.assertFalse(os.path.exists(self.spill_file(PNL)))
+
+    def test_spilled_after_retries_and_replayed_on_next_flush(self):
+        ## 3 attempts for each of the 2 collections
+        backend = self.flaky(failures=6)
+        persister = self.new_persister(backend, max_retries=2)
+        persister.insert_pnl({'ticker': 'AAPL', 'qty': 10})
+        persister.insert_event({'ticker': 'AAPL', 'event': 'BUY'})
+
+        with mock.patch('ttb.db.db_persist.time.sleep'):
+            persister.flush()
+        self.assertEqual(self.sqlite.find(PNL), [])
+        with open(self.spill_file(PNL), 'r') as f:
+            self.assertEqual([json.loads(line)['ticker'] for line in f], ['AAPL'])
+        self.assertEqual(persister.stats()['spilled'], 2)
+
+        ## the DB is back: the spill is replayed, then the new docs inserted
+        persister.insert_pnl({'ticker': 'MSFT', 'qty': 5})
+        persister.flush()
+        self.assertEqual([d['ticker'] for d in self.sqlite.find(PNL)], ['AAPL', 'MSFT'])
+        self.assertEqual([d['event'] for d in self.sqlite.find(EVENTS)], ['BUY'])
+        self.assertFalse(os.path.exists(self.spill_file(PNL)))
+        self.assertFalse(os.path.exists(self.spill_file(EVENTS)))
+
+    def test_replay_of_written_docs_not_duplicated(self):
+        ## every attempt writes the batch but reports a failure, the spill holds docs already in the DB
+        backend = self.flaky(failures=3, write_then_fail=True)
+        persister = self.new_persister(backend, max_retries=2)
+        persister.insert_pnl({'ticker': 'AAPL', 'qty': 10})
+        persister.insert_pnl({'ticker': 'MSFT', 'qty': 5})
+
+        with mock.patch('ttb.db.db_persist.time.sleep'):
+            persister.flush()
+        self.assertTrue(os.path.exists(self.spill_file(PNL)))
+        persister.flush()
+        docs = self.sqlite.find(PNL)
+        self.assertEqual([d['ticker'] for d in docs], ['AAPL', 'MSFT'])
+        self.assertEqual(len({d['_id'] for d in docs}), 2)
+
+    def test_backend_created_lazily_spills_until_reachable(self):
+        persister = self.new_persister()
+        persister.insert_pnl({'ticker': 'AAPL', 'qty': 10})
+
+        with mock.patch('ttb.db.db_persist.create_backend', side_effect=ConnectionError('DB unreachable')):
+            persister.flush()
+        self.assertTrue(os.path.exists(self.spill_file(PNL)))
+        self.assertEqual(persister.stats()['spilled'], 1)
+
+        persister.flush()
+        self.sqlite = SQLiteBackend(self.db_path)
+        self.assertEqual([d['ticker'] for d in self.sqlite.find(PNL)], ['AAPL'])
+        self.assertFalse(os.path.exists(self.spill_file(PNL)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ttb.mktdata.hist.hist_store import HistStore
+
+
+def bars(ts, close=None):
+    close = close or [float(t) for t in ts]
+    return dict(ts=ts, open=close, high=close, low=close, close=close, volume=[1.0] * len(ts))
+
+
+class HistStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.store = HistStore(self.root_dir, initial_capacity=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def test_append_sorts_and_dedupes_the_batch(self):
+        self.assertEqual(self.store.append('AAPL', bars([3, 1, 2, 2], close=[3.0, 1.0, 2.0, 2.5])), 3)
+        got = self.store.bars('AAPL')
+        self.assertEqual(list(got['ts']), [1, 2, 3])
+        self.assertEqual(list(got['close']), [1.0, 2.5, 3.0])
+
+    def test_append_keeps_only_bars_newer_than_stored(self):
+        self.store.append('AAPL', bars([1, 2, 3]))
+        self.assertEqual(self.store.append('AAPL', bars([5, 2, 4, 3])), 2)
+        self.assertEqual(list(self.store.bars('AAPL')['ts']), [1, 2, 3, 4, 5])
+        self.assertEqual(list(self.store.bars('AAPL', start_ts=2, end_ts=4)['ts']), [2, 3, 4])
+        self.assertEqual(self.store.append('AAPL', bars([])), 0)
+
+    def test_symbol_with_path_separator(self):
+        self.store.append('BRK/B', bars([1, 2]))
+        self.assertEqual(os.listdir(self.root_dir), ['BRK%2FB'])
+        self.assertEqual(self.store.symbols(), ['BRK/B'])
+        self.assertEqual(self.store.last_ts('BRK/B'), 2)
+        with self.assertRaises(ValueError):
+            self.store.append('..', bars([1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import time
+import unittest
+
+from ttb.mktdata.market_data import MarketDataService
+from ttb.mktdata.transport import LocalQuoteFeed, SocketTransport
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class MarketDataServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.feed = LocalQuoteFeed().start()
+        self.service = MarketDataService(SocketTransport(self.feed.host, self.feed.port), depth=4,
+                                         max_age_seconds=5, reconnect_seconds=0.1)
+
+    def tearDown(self):
+        self.service.stop()
+        self.feed.stop()
+
+    def test_subscribed_before_start_streams_on_connect(self):
+        self.service.subscribe(['AAPL'])
+        self.service.start()
+        self.assertTrue(wait_for(lambda: self.feed.subscribers('AAPL') == 1))
+
+        self.feed.publish('AAPL', 150.5)
+        self.feed.publish('MSFT', 300.0)  ## not subscribed, never sent
+        self.assertTrue(wait_for(lambda: self.service.last_price('AAPL') == 150.5))
+        self.assertIsNone(self.service.last_price('MSFT'))
+
+    def test_ring_buffer_keeps_the_latest_ticks(self):
+        self.service.start()
+        self.service.subscribe(['AAPL'])
+        self.assertTrue(wait_for(lambda: self.feed.subscribers('AAPL') == 1))
+
+        now = time.time()
+        for i in range(6):
+            self.feed.publish('AAPL', 100.0 + i, now + i * 0.001)
+        self.assertTrue(wait_for(lambda: self.service.last_price('AAPL') == 105.0))
+        times, prices = self.service.buffer.ticks('AAPL')
+        self.assertEqual(list(prices), [102.0, 103.0, 104.0, 105.0])
+        self.assertEqual(list(times), sorted(times))
+
+    def test_stale_tick_is_a_miss(self):
+        self.service.subscribe(['AAPL', 'MSFT'])
+        self.service.start()
+        self.assertTrue(wait_for(lambda: self.feed.subscribers('MSFT') == 1))
+
+        self.feed.publish('AAPL', 150.0, time.time() - 60)
+        self.feed.publish('MSFT', 300.0)
+        self.assertTrue(wait_for(lambda: self.service.last_price('MSFT') == 300.0))
+        self.assertTrue(wait_for(lambda: self.service.buffer.last('AAPL') is not None))
+
+        misses = self.service.misses
+        self.assertIsNone(self.service.last_price('AAPL'))
+        self.assertEqual(self.service.last_price('AAPL', max_age_seconds=120), 150.0)
+        self.assertEqual(self.service.last_prices(['AAPL', 'MSFT']), {'MSFT': 300.0})
+        self.assertEqual(self.service.misses, misses + 2)
+
+    def test_unsubscribed_symbol_stops_streaming(self):
+        self.service.subscribe(['AAPL'])
+        self.service.start()
+        self.assertTrue(wait_for(lambda: self.feed.subscribers('AAPL') == 1))
+
+        self.service.unsubscribe(['AAPL'])
+        self.assertTrue(wait_for(lambda: self.feed.subscribers('AAPL') == 0))
+        self.feed.publish('AAPL', 150.0)
+        time.sleep(0.1)
+        self.assertIsNone(self.service.buffer.last('AAPL'))
+
+
+if __name__ == '__main__':
+    unittest.main()
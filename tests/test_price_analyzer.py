@@ -0,0 +1,44 @@
+import unittest
+
+from ttb.mkt_analyzer.price_analyzer import PriceAnalyzer
+
+
+class PriceAnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.polled = []
+        self.analyzer = PriceAnalyzer(self.quote, poll_seconds=60)
+        self.analyzer.track('V1', 'AAPL', 100.0)
+        self.analyzer.track('V2', 'AAPL', 110.0)
+        self.analyzer.track('V1', 'MSFT', 300.0)
+
+    def quote(self, symbols):
+        self.polled.append(sorted(symbols))
+        return {s: {'lastPrice': 120.0, 'totalVolume': 1000} for s in symbols}
+
+    def test_update_samples_every_position_of_a_symbol(self):
+        self.analyzer.update({'AAPL': {'lastPrice': 105.0, 'totalVolume': 500}, 'TSLA': 700.0})
+        ind = self.analyzer.indicators()
+        self.assertEqual(ind[('V1', 'AAPL')]['chg_from_entry_pct'], 5.0)
+        self.assertEqual(ind[('V2', 'AAPL')]['price'], 105.0)
+        self.assertNotIn(('V1', 'TSLA'), ind)
+
+    def test_poll_skips_symbols_sampled_by_the_bot(self):
+        self.analyzer.update({'AAPL': 105.0})
+        self.assertEqual(self.analyzer.stale_symbols(60), ['MSFT'])
+        self.analyzer.refresh()
+        self.assertEqual(self.polled, [['MSFT']])
+
+        self.analyzer.refresh()
+        self.assertEqual(self.polled, [['MSFT']])
+        self.assertEqual(sorted(self.analyzer.stale_symbols(0)), ['AAPL', 'MSFT'])
+
+    def test_new_position_of_a_sampled_symbol_is_polled(self):
+        self.analyzer.update({'AAPL': 105.0, 'MSFT': 310.0})
+        self.analyzer.untrack('V2', 'AAPL')
+        self.analyzer.track('V3', 'AAPL', 104.0)
+        self.assertEqual(self.analyzer.stale_symbols(60), ['AAPL'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import unittest
+
+from ttb.trading.quote_cache import QuoteCache
+from ttb.trading.request_scheduler import Priority
+
+
+class BlockingSource:
+    """
+    Quote source whose fetches at the given priorities block until released.
+    """
+
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def get_quotes(self, symbols, priority=Priority.TRADE):
+        self.calls.append((tuple(symbols), priority))
+        if priority in self.blocked:
+            self.started.set()
+            self.release.wait(5)
+        return {s: {'symbol': s, 'lastPrice': 10.0} for s in symbols}
+
+
+class QuoteCacheTest(unittest.TestCase):
+
+    def start_fetch(self, cache, symbols, priority):
+        t = threading.Thread(target=cache.get_quotes, args=(symbols,), kwargs=dict(priority=priority), daemon=True)
+        t.start()
+        return t
+
+    def test_trade_does_not_wait_for_less_urgent_fetch(self):
+        source = BlockingSource(blocked=[Priority.INDICATORS])
+        cache = QuoteCache(source.get_quotes, wait_timeout_seconds=5)
+        t = self.start_fetch(cache, ['AAPL'], Priority.INDICATORS)
+        source.started.wait(5)
+
+        self.assertIn('AAPL', cache.get_quotes(['AAPL'], priority=Priority.TRADE))
+        self.assertEqual(source.calls[-1], (('AAPL',), Priority.TRADE))
+        self.assertEqual(cache.coalesced, 0)
+        source.release.set()
+        t.join(5)
+
+    def test_less_urgent_request_coalesces(self):
+        source = BlockingSource(blocked=[Priority.TRADE])
+        cache = QuoteCache(source.get_quotes, wait_timeout_seconds=5)
+        t = self.start_fetch(cache, ['AAPL'], Priority.TRADE)
+        source.started.wait(5)
+        threading.Timer(0.1, source.release.set).start()
+
+        self.assertIn('AAPL', cache.get_quotes(['AAPL'], priority=Priority.EOD))
+        self.assertEqual(len(source.calls), 1)
+        self.assertEqual(cache.coalesced, 1)
+        t.join(5)
+
+    def test_timed_out_wait_fetches_directly(self):
+        source = BlockingSource(blocked=[Priority.TRADE])
+        cache = QuoteCache(source.get_quotes, wait_timeout_seconds=0.1)
+        t = self.start_fetch(cache, ['AAPL'], Priority.TRADE)
+        source.started.wait(5)
+        source.blocked.clear()
+
+        self.assertIn('AAPL', cache.get_quotes(['AAPL'], priority=Priority.TRADE))
+        self.assertEqual(len(source.calls), 2)
+        source.release.set()
+        t.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from ttb.trading.request_scheduler import RequestScheduler
+from ttb.trading.td_session import TDSession
+
+
+class StubTDServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the TD REST API: the token endpoint hands out a new access token per refresh, any other
+    path answers 401 unless called with the current token. Records the client ports it was called from.
+    """
+    daemon_threads = True
+
+    def __init__(self, expires_in: int = 1800):
+        super().__init__(('127.0.0.1', 0), StubTDHandler)
+        self.expires_in = expires_in
+        self.access_token = 'token-0'
+        self.refreshes = 0
+        self.unauthorized = 0
+        self.client_ports = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+
+class StubTDHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  ## keep-alive, so pooled connections are reused
+
+    def log_message(self, format, *args):
+        pass
+
+    def __reply(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        server = self.server
+        with server.lock:
+            server.client_ports.append(self.client_address[1])
+            if self.path != '/v1/oauth2/token' or form.get('grant_type') != ['refresh_token']:
+                return self.__reply(400, {'error': 'bad request'})
+            server.refreshes += 1
+            server.access_token = f'token-{server.refreshes}'
+            return self.__reply(200, {'access_token': server.access_token, 'expires_in': server.expires_in})
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.client_ports.append(self.client_address[1])
+            if self.headers.get('Authorization') != f'Bearer {server.access_token}':
+                server.unauthorized += 1
+                return self.__reply(401, {'error': 'unauthorized'})
+        return self.__reply(200, {'path': self.path})
+
+
+class TDSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubTDServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.credentials_path = os.path.join(self.tmp_dir, 'cred.json')
+        self.session = None
+
+    def tearDown(self):
+        if self.session:
+            self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def new_session(self, access_token_expires_in: float = 1800, refresh_margin_seconds: int = 300):
+        now = time.time()
+        with open(self.credentials_path, 'w') as f:
+            json.dump({'access_token': self.server.access_token, 'refresh_token': 'refresh',
+                       'access_token_expires_at': now + access_token_expires_in,
+                       'refresh_token_expires_at': now + 86400}, f)
+        self.session = TDSession('CLIENT', 'https://localhost', self.credentials_path, api_url=self.server.url,
+                                 refresh_margin_seconds=refresh_margin_seconds, pool_size=2, timeout_seconds=5,
+                                 scheduler=RequestScheduler(rate_per_minute=6000, burst=100))
+        return self.session
+
+    def test_connections_are_pooled(self):
+        session = self.new_session()
+        for i in range(10):
+            self.assertEqual(session.get('marketdata/quotes', params={'symbol': 'AAPL'}),
+                             {'path': '/v1/marketdata/quotes?symbol=AAPL'})
+        self.assertEqual(len(self.server.client_ports), 10)
+        self.assertEqual(len(set(self.server.client_ports)), 1)
+
+    def test_unauthorized_refreshes_and_retries(self):
+        session = self.new_session()
+        session.login()
+        self.server.access_token = 'revoked'
+
+        self.assertEqual(session.get('accounts'), {'path': '/v1/accounts'})
+        self.assertEqual(self.server.unauthorized, 1)
+        self.assertEqual(self.server.refreshes, 1)
+        with open(self.credentials_path, 'r') as f:
+            self.assertEqual(json.load(f)['access_token'], 'token-1')
+
+    def test_token_refreshed_before_expiry(self):
+        ## the refresh thread wakes up 1 second before the margin is reached
+        session = self.new_session(access_token_expires_in=301, refresh_margin_seconds=300)
+        session.login()
+        self.assertEqual(self.server.refreshes, 0)
+
+        deadline = time.time() + 10
+        while session.access_token_expires_in < 1000 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.server.refreshes, 1)
+        self.assertGreater(session.access_token_expires_in, 1000)
+        self.assertEqual(session.get('accounts'), {'path': '/v1/accounts'})
+        self.assertEqual(self.server.unauthorized, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
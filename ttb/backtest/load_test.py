@@ -0,0 +1,97 @@
+import argparse
+import cProfile
+import datetime
+import io
+import logging
+import pstats
+import random
+import time
+
+import numpy as np
+
+from ttb.backtest.replay import parse_overrides
+from ttb.cfg.config import OverrideConfig
+from ttb.main.bot_manager_RPA import BotManager
+from ttb.util import timeit
+
+logger = logging.getLogger(__name__)
+
+## the broker is simulated, neither the client nor the simulated server throttle unless asked to
+LOAD_TEST_SETTINGS = dict(broker='sim', mktdata_transport=None, td_rate_limit_per_minute=10 ** 9,
+                          td_rate_limit_burst=10 ** 6, sim_rate_limit_per_minute=10 ** 9)
+
+
+def synthetic_alerts(n: int, universe: int = 500, basket: int = 3, versions=('V5.4', 'V6.0'), seed: int = 1):
+    """
+    :return: n alerts (symbols, action, version, ts), buys and sells of random baskets of the universe
+    """
+    rnd = random.Random(seed)
+    symbols = [f'SIM{i:04d}' for i in range(universe)]
+    now = datetime.datetime.now()
+    return [(rnd.sample(symbols, basket), rnd.choice(('BUY', 'SELL')), rnd.choice(versions),
+             (now + datetime.timedelta(milliseconds=i)).isoformat()) for i in range(n)]
+
+
+def run(conf, alerts: list, rate: float = 0, profile: bool = False):
+    """
+    Push the alerts through BotManager.on_event against the simulated broker.
+
+    :param rate: alerts per second to offer, 0 for as fast as possible
+    :return: dict of throughput, per alert latency percentiles and, with instrumentation_enabled, the
+             per stage histograms
+    """
+    bot = BotManager(conf, sinks={})
+    latencies = np.zeros(len(alerts))
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    started = time.perf_counter()
+    for i, alert in enumerate(alerts):
+        if rate:
+            wait = started + i / rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        t = time.perf_counter()
+        bot.on_event(alert)
+        latencies[i] = time.perf_counter() - t
+    elapsed = time.perf_counter() - started
+    bot.eod_process()
+    if profiler:
+        profiler.disable()
+    bot.close()
+
+    ms = 1000 * latencies
+    rs = dict(alerts=len(alerts), elapsed=round(elapsed, 3), alerts_per_sec=round(len(alerts) / elapsed, 1),
+              p50_ms=round(float(np.percentile(ms, 50)), 3), p95_ms=round(float(np.percentile(ms, 95)), 3),
+              p99_ms=round(float(np.percentile(ms, 99)), 3), max_ms=round(float(ms.max()), 3),
+              trades=bot.get_pnl().summary()['total']['count'])
+    if timeit.enabled():
+        rs['stages'] = timeit.stats()
+    if profiler:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        rs['profile'] = out.getvalue()
+    return rs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='load test the RPA bot against the simulated broker')
+    parser.add_argument('--alerts', type=int, default=5000)
+    parser.add_argument('--rate', type=float, default=0, help='alerts per second, 0 for as fast as possible')
+    parser.add_argument('--universe', type=int, default=500)
+    parser.add_argument('--basket', type=int, default=3)
+    parser.add_argument('--latency', default='fixed:0', help='sim_latency, e.g. lognormal:40:15')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help='config override')
+    parser.add_argument('--profile', action='store_true', help='print where the time goes')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    conf = OverrideConfig(**dict(LOAD_TEST_SETTINGS, sim_latency=args.latency, sim_error_rate=args.error_rate,
+                                 **parse_overrides(args.set)))
+    result = run(conf, synthetic_alerts(args.alerts, args.universe, args.basket), args.rate, args.profile)
+    profile = result.pop('profile', None)
+    print(result)
+    if profile:
+        print(profile)
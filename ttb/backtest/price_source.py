@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+
+import dateutil.parser
+import numpy as np
+
+from ttb.mktdata.hist.hist_store import HistStore
+from ttb.util.clock import Clock
+
+logger = logging.getLogger(__name__)
+
+
+def to_epoch(ts):
+    """
+    :param ts: epoch seconds, epoch millis or a date time string
+    """
+    if isinstance(ts, (int, float)):
+        return ts / 1000.0 if ts > 1e11 else float(ts)
+    return dateutil.parser.parse(ts).timestamp()
+
+
+class RecordedQuotes:
+    """
+    Prices from recorded quotes, JSON lines of {"ts": ..., "symbol": ..., "lastPrice": ...}.
+
+    The price of a symbol at time t is the last quote recorded at or before t.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__ts = {}
+        self.__prices = {}
+        files = [f'{path}{os.sep}{f}' for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        rows = {}
+        for file in files:
+            with open(file, 'r') as f:
+                for line in f:
+                    try:
+                        q = json.loads(line)
+                        rows.setdefault(q['symbol'], []).append((to_epoch(q['ts']), float(q['lastPrice'])))
+                    except (ValueError, KeyError):
+                        logger.warning(f'skipped invalid quote in {file}: {line.rstrip()}')
+        for symbol, quotes in rows.items():
+            quotes.sort()
+            self.__ts[symbol] = np.fromiter((q[0] for q in quotes), dtype=np.float64, count=len(quotes))
+            self.__prices[symbol] = np.fromiter((q[1] for q in quotes), dtype=np.float64, count=len(quotes))
+        logger.info(f'{sum(len(v) for v in self.__ts.values())} quotes of {len(self.__ts)} symbols loaded')
+
+    def price(self, symbol: str, t: float):
+        ts = self.__ts.get(symbol)
+        if ts is None:
+            return None
+        i = int(np.searchsorted(ts, t, side='right')) - 1
+        return float(self.__prices[symbol][i]) if i >= 0 else None
+
+
+class HistBarPrices:
+    """
+    Prices from the OHLCV bars of a HistStore: at time t the open of the last bar started at or before t,
+    so the replay never sees a price from after t.
+    """
+
+    def __init__(self, store: HistStore):
+        self.store = store
+        self.__bars = {}
+
+    def price(self, symbol: str, t: float):
+        bars = self.__bars.get(symbol)
+        if bars is None:
+            bars = self.store.bars(symbol)
+            self.__bars[symbol] = bars
+        i = int(np.searchsorted(bars['ts'], int(t * 1000), side='right')) - 1
+        return float(bars['open'][i]) if i >= 0 else None
+
+
+class ReplayTrader:
+    """
+    Broker stand-in for replays, quotes come from a price source at the replay clock's time.
+    """
+
+    def __init__(self, source, clock: Clock):
+        self.source = source
+        self.clock = clock
+        self.requests = 0
+
+    def get_quotes(self, instruments: list, priority=None):
+        self.requests += 1
+        t = self.clock.time()
+        quotes = {}
+        for symbol in instruments:
+            p = self.source.price(symbol, t)
+            if p is not None:
+                quotes[symbol] = {'symbol': symbol, 'lastPrice': p}
+        return quotes
+
+    def get_price_history(self, symbol, priority=None, start_ts=None):
+        return None
+
+    def request_stats(self):
+        return dict(requests=self.requests)
+
+    def close(self):
+        pass
@@ -0,0 +1,138 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import time
+from queue import Queue, Empty
+
+import dateutil.parser
+
+from ttb.backtest.price_source import HistBarPrices, RecordedQuotes, ReplayTrader
+from ttb.cfg.config import Config, OverrideConfig
+from ttb.event.inbound.rpa_alert_reader import AlertReader
+from ttb.main.bot_manager_RPA import BotManager
+from ttb.mktdata.hist.hist_store import HistStore
+from ttb.util import timeutil
+from ttb.util.clock import SimClock
+
+logger = logging.getLogger(__name__)
+
+## replays price from the simulated time, nothing may be served from the live quote cache or stream
+REPLAY_SETTINGS = dict(quote_cache_ttl_seconds=0, mktdata_transport=None)
+
+
+def local_time(ts: str):
+    try:
+        dt = datetime.datetime.fromisoformat(ts)
+    except ValueError:
+        dt = dateutil.parser.parse(ts)
+    return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def discover_days(conf: Config, start: str = None, end: str = None):
+    """
+    :return: cob dates within [start, end] that have an alert file
+    """
+    return [d for d in timeutil.cob_dates(conf.gdrive_path, start, end)
+            if os.path.exists(OverrideConfig(conf, date_today=d).alert_file_path)]
+
+
+class Replay:
+    """
+    Re-runs recorded days through the RPA BotManager: the day's alert file is read and filtered by the
+    AlertReader, every alert goes through on_event/trade on a simulated clock set to the alert's time stamp,
+    then eod_process prices what is still held. Quotes come from a price source (RecordedQuotes, HistBarPrices),
+    nothing is journaled or persisted.
+    """
+
+    def __init__(self, price_source, base: Config = None, **overrides):
+        self.price_source = price_source
+        self.base = base or Config()
+        self.overrides = overrides
+
+    def run_day(self, cob_date: str):
+        conf = OverrideConfig(self.base, date_today=cob_date, **dict(REPLAY_SETTINGS, **self.overrides))
+        clock = SimClock(timeutil.parse_time(conf.trade_start_time, cob_date))
+        trader = ReplayTrader(self.price_source, clock)
+        bot = BotManager(conf, trader=trader, clock=clock, sinks={})
+
+        alerts = Queue()
+        AlertReader(conf, alerts).get_alert()
+        events = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                event = alerts.get_nowait()
+            except Empty:
+                break
+            clock.set(local_time(event[3]))
+            bot.on_event(event)
+            events += 1
+        clock.set(bot.trading_end_time)
+        bot.eod_process()
+        bot.close()
+        elapsed = time.perf_counter() - started
+
+        summary = bot.get_pnl().summary()
+        return dict(cob_date=cob_date, events=events, elapsed=elapsed,
+                    events_per_sec=events / elapsed if elapsed else 0.0, quotes=trader.requests,
+                    total=summary['total'], by_version=summary['by_version'])
+
+    def run(self, days: list):
+        results = []
+        started = time.perf_counter()
+        for cob_date in days:
+            rs = self.run_day(cob_date)
+            logger.info(f"{cob_date}: {rs['events']} events, {rs['events_per_sec']:.0f} events/s, "
+                        f"pnl {rs['total']['gross_pnl']}")
+            results.append(rs)
+        elapsed = time.perf_counter() - started
+        events = sum(rs['events'] for rs in results)
+        logger.info(f'{len(results)} days, {events} events in {elapsed:.2f}s, '
+                    f'{events / elapsed if elapsed else 0:.0f} events/s')
+        return results
+
+
+def create_price_source(quotes: str = None, hist_dir: str = None):
+    if quotes:
+        return RecordedQuotes(quotes)
+    return HistBarPrices(HistStore(hist_dir or Config().hist_dir))
+
+
+def parse_overrides(settings: list):
+    """
+    :param settings: ['name=value', ...], values parsed as JSON when possible
+    """
+    overrides = {}
+    for s in settings or []:
+        name, value = s.split('=', 1)
+        try:
+            overrides[name] = json.loads(value)
+        except ValueError:
+            overrides[name] = value
+    return overrides
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='replay recorded alert days through the RPA bot')
+    parser.add_argument('--start', help='first cob date YYYYMMDD')
+    parser.add_argument('--end', help='last cob date YYYYMMDD')
+    parser.add_argument('--alert-root', help='folder of the <YYYYMMDD> alert folders (config gdrive_path)')
+    parser.add_argument('--quotes', help='recorded quotes, a JSON lines file or a folder of them')
+    parser.add_argument('--hist-dir', help='HistStore folder, used when no recorded quotes are given')
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help='config override')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    ## the replay progress is shown whatever level the bot logs at
+    logger.setLevel(logging.INFO)
+    overrides = parse_overrides(args.set)
+    if args.alert_root:
+        overrides['gdrive_path'] = args.alert_root
+    replay = Replay(create_price_source(args.quotes, args.hist_dir), **overrides)
+    results = replay.run(discover_days(OverrideConfig(**overrides), args.start, args.end))
+    for rs in results:
+        print(f"{rs['cob_date']}  events {rs['events']:6d}  {rs['events_per_sec']:8.0f}/s  "
+              f"trades {rs['total']['count']:5d}  pnl {rs['total']['gross_pnl']:12.2f}")
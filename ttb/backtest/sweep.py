@@ -0,0 +1,122 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from ttb.backtest.replay import Replay, create_price_source, discover_days, parse_overrides
+from ttb.cfg.config import OverrideConfig
+
+logger = logging.getLogger(__name__)
+
+## one price source per worker process, loaded by the pool initializer
+_price_source = None
+## settings only applied when enforce_trade_limits is on
+LIMIT_SETTINGS = ('per_trade_amt_limit', 'daily_trade_amt_limit')
+
+
+def expand_grid(grid: dict):
+    """
+    :param grid: setting -> list of values, e.g. {'trade_default_qty': [50, 100], 'trade_versions': [None, ['V5.4']]}
+    :return: list of override dicts, one per combination
+    """
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def _init_worker(quotes, hist_dir, log_level):
+    global _price_source
+    logging.getLogger().setLevel(log_level)
+    _price_source = create_price_source(quotes, hist_dir)
+
+
+def _run(base_overrides: dict, params: dict, cob_date: str):
+    rs = Replay(_price_source, **dict(base_overrides, **params)).run_day(cob_date)
+    return dict(cob_date=cob_date, events=rs['events'], elapsed=rs['elapsed'], **rs['total'])
+
+
+def rank(params: list, results: list):
+    """
+    Merge the per (parameter set, day) results into one row per parameter set, best PnL first.
+    """
+    df = pd.DataFrame(results)
+    if df.empty:
+        return df
+    g = df.groupby('param_set')
+    table = g.agg(days=('cob_date', 'nunique'), events=('events', 'sum'), trades=('count', 'sum'),
+                  wins=('wins', 'sum'), losses=('losses', 'sum'), pnl=('gross_pnl', 'sum'),
+                  transc_amt=('transc_amt', 'sum'), worst_day=('gross_pnl', 'min'), best_day=('gross_pnl', 'max'))
+    table['win_rate'] = (table['wins'] / table['trades']).where(table['trades'] > 0, 0.0)
+    table['return_pct'] = (100 * table['pnl'] / table['transc_amt']).where(table['transc_amt'] > 0, 0.0)
+    table['params'] = [json.dumps(params[i]) for i in table.index]
+    return table.sort_values('pnl', ascending=False).reset_index(drop=True)
+
+
+def sweep(grid: dict, days: list, quotes: str = None, hist_dir: str = None, workers: int = None,
+          log_level: str = 'WARNING', **base_overrides):
+    """
+    Replay every day with every parameter set of the grid, fanned out over a process pool.
+
+    :return: ranked DataFrame, one row per parameter set
+    """
+    limits = [name for name in LIMIT_SETTINGS if name in grid]
+    if limits and 'enforce_trade_limits' not in grid:
+        if base_overrides.get('enforce_trade_limits', True) is False:
+            raise ValueError(f'{limits} have no effect with enforce_trade_limits off')
+        ## sweeping a limit means trading with it
+        base_overrides = dict(base_overrides, enforce_trade_limits=True)
+    params = expand_grid(grid)
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(quotes, hist_dir, log_level)) as pool:
+        futures = {pool.submit(_run, base_overrides, p, d): i for i, p in enumerate(params) for d in days}
+        for f in as_completed(futures):
+            try:
+                results.append(dict(f.result(), param_set=futures[f]))
+            except Exception:
+                logger.exception(f'replay failed for {params[futures[f]]}')
+    elapsed = time.perf_counter() - started
+    events = sum(rs['events'] for rs in results)
+    logger.info(f'{len(params)} parameter sets x {len(days)} days in {elapsed:.2f}s, '
+                f'{events / elapsed if elapsed else 0:.0f} events/s')
+    return rank(params, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='replay alert days for every combination of a config grid')
+    parser.add_argument('grid', help='JSON file or string: {"setting": [values, ...], ...}')
+    parser.add_argument('--start', help='first cob date YYYYMMDD')
+    parser.add_argument('--end', help='last cob date YYYYMMDD')
+    parser.add_argument('--alert-root', help='folder of the <YYYYMMDD> alert folders (config gdrive_path)')
+    parser.add_argument('--quotes', help='recorded quotes, a JSON lines file or a folder of them')
+    parser.add_argument('--hist-dir', help='HistStore folder, used when no recorded quotes are given')
+    parser.add_argument('--set', action='append', metavar='NAME=VALUE', help='config override for all runs')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', help='csv file for the ranked table')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    if os.path.exists(args.grid):
+        with open(args.grid, 'r') as f:
+            grid = json.load(f)
+    else:
+        grid = json.loads(args.grid)
+    overrides = parse_overrides(args.set)
+    if args.alert_root:
+        overrides['gdrive_path'] = args.alert_root
+    days = discover_days(OverrideConfig(**overrides), args.start, args.end)
+    ## run through the imported module, workers must unpickle the task function as ttb.backtest.sweep._run
+    from ttb.backtest import sweep as sweep_module
+    ## the sweep summary is shown whatever level the bot logs at
+    sweep_module.logger.setLevel(logging.INFO)
+    table = sweep_module.sweep(grid, days, args.quotes, args.hist_dir, args.workers, args.log_level, **overrides)
+    pd.set_option('display.width', 200)
+    print(table.to_string())
+    if args.out:
+        table.to_csv(args.out, index=False)
@@ -0,0 +1,233 @@
+import os
+import zlib
+from functools import partial
+from queue import Queue
+
+from ttb.bench import generators, legacy
+from ttb.cfg.config import OverrideConfig
+from ttb.event.inbound.event_parser import parse_event
+from ttb.event.inbound.rpa_alert_reader import AlertReader
+from ttb.event.outbound.to_file_event import ToFileEventHandler
+from ttb.main.bot_manager_RPA import BotManager
+from ttb.report.pnl_report import PnlReporter, transform
+
+COB_DATE = '20220513'
+## nothing live: no quote cache, no market data stream, no journal or DB sinks unless the case is about them
+BENCH_SETTINGS = dict(date_today=COB_DATE, quote_cache_ttl_seconds=0, mktdata_transport=None,
+                      journal_async=True, journal_fsync='never', report_formats=('xlsx',))
+
+
+class Case:
+    """
+    One benchmark: `setup(work_dir)` builds the input (not timed), `run(state)` is the timed part and processes
+    `items` items, so results can be compared as items per second.
+    """
+
+    def __init__(self, name: str, setup, run, items: int):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.items = items
+
+
+class StubTrader:
+    """
+    Broker stand-in answering quotes from memory at a fixed price per symbol.
+    """
+
+    def __init__(self):
+        self.requests = 0
+
+    def get_quotes(self, instruments: list, priority=None):
+        self.requests += 1
+        return {s: {'symbol': s, 'lastPrice': 5 + zlib.crc32(s.encode()) % 29500 / 100} for s in instruments}
+
+    def get_price_history(self, symbol, priority=None, start_ts=None):
+        return None
+
+    def request_stats(self):
+        return dict(requests=self.requests)
+
+    def close(self):
+        pass
+
+
+def bench_config(work_dir: str, **overrides):
+    return OverrideConfig(gdrive_path=work_dir, **dict(BENCH_SETTINGS, **overrides))
+
+
+def new_bot(work_dir: str):
+    return BotManager(bench_config(work_dir), trader=StubTrader(), sinks={})
+
+
+def parse_event_case(n: int):
+    def setup(work_dir):
+        return generators.subjects(n)
+
+    def run(subjects):
+        for s in subjects:
+            parse_event(s)
+
+    return setup, run
+
+
+def alert_reader_case(n: int):
+    def setup(work_dir):
+        conf = bench_config(work_dir)
+        generators.write_alert_file(conf.alert_file_path, generators.alert_lines(n, COB_DATE))
+        return AlertReader(conf, Queue())
+
+    def run(reader):
+        reader.get_alert()
+
+    return setup, run
+
+
+def alert_reader_append_case(n: int, backlog: int):
+    """
+    One get_alert pass over n lines appended to an alert file of `backlog` lines already read.
+    """
+    def setup(work_dir):
+        conf = bench_config(work_dir)
+        lines = generators.alert_lines(backlog + n, COB_DATE)
+        generators.write_alert_file(conf.alert_file_path, lines[:backlog])
+        reader = AlertReader(conf, Queue())
+        reader.get_alert()
+        generators.write_alert_file(conf.alert_file_path, lines[backlog:], mode='a')
+        return reader
+
+    def run(reader):
+        reader.get_alert()
+
+    return setup, run
+
+
+def to_file_case(n: int):
+    def setup(work_dir):
+        return ToFileEventHandler(bench_config(work_dir)), generators.events(n)
+
+    def run(state):
+        handler, events = state
+        for e in events:
+            handler.handle_event(e)
+        ## the journal is only written when the writer is drained
+        handler.close()
+
+    return setup, run
+
+
+def trade_case(n: int, size: int):
+    """
+    n baskets bought then sold again (items are baskets), every basket quoted in one request.
+    """
+
+    def setup(work_dir):
+        return new_bot(work_dir), generators.baskets(n, size)
+
+    def run(state):
+        bot, baskets = state
+        for symbols, version in baskets:
+            bot.trade(symbols, 'BUY', version, f'#B4#{version}#', '2022-05-13T10:00:00')
+        for symbols, version in baskets:
+            bot.trade(symbols, 'SELL', version, f'#B4#{version}#', '2022-05-13T11:00:00')
+
+    return setup, run
+
+
+def eod_case(n: int):
+    def setup(work_dir):
+        bot = new_bot(work_dir)
+        basket = generators.symbols(n)
+        bot.trade(basket, 'BUY', 'V6.0', '#B4#V6.0#', '2022-05-13T10:00:00')
+        return bot
+
+    def run(bot):
+        bot.eod_process()
+
+    return setup, run
+
+
+def transform_case(n: int, columns: bool = True):
+    """
+    :param columns: fed PnlLedger.columns() as by the bot, else a list of PNL dicts
+    """
+    def setup(work_dir):
+        return generators.pnl_columns(n) if columns else generators.pnl_rows(n)
+
+    def run(data):
+        transform(data)
+
+    return setup, run
+
+
+def transform_rows_case(n: int):
+    def setup(work_dir):
+        return generators.pnl_rows(n)
+
+    def run(rows):
+        legacy.transform_rows(rows)
+
+    return setup, run
+
+
+def legacy_report_case(n: int):
+    """
+    The former row by row transform and pandas Excel writer, the baseline of pnl_gen_report_xlsx.
+    """
+    def setup(work_dir):
+        return f'{work_dir}{os.sep}legacy.xlsx', generators.pnl_rows(n)
+
+    def run(state):
+        out_file, rows = state
+        legacy.write_excel(out_file, legacy.transform_rows(rows))
+
+    return setup, run
+
+
+def gen_report_case(n: int, formats: tuple):
+    def setup(work_dir):
+        return PnlReporter(bench_config(work_dir)), generators.pnl_columns(n)
+
+    def run(state):
+        reporter, rows = state
+        reporter.gen_report(rows, formats)
+
+    return setup, run
+
+
+## name, builder of (setup, run) for n items, n, n of a quick run (None: skipped, the name gives the size)
+CASES = [
+    ('parse_event', parse_event_case, 10000, 1000),
+    ('alert_reader_1k', alert_reader_case, 1000, 1000),
+    ('alert_reader_10k', alert_reader_case, 10000, 10000),
+    ('alert_reader_100k', alert_reader_case, 100000, None),
+    ('alert_reader_append_1k_to_100k', partial(alert_reader_append_case, backlog=100000), 1000, None),
+    ('alert_reader_append_1k_to_10k', partial(alert_reader_append_case, backlog=10000), 1000, 1000),
+    ('to_file_handle_event', to_file_case, 20000, 2000),
+    ('trade_basket_5', partial(trade_case, size=5), 400, 100),
+    ('trade_basket_20', partial(trade_case, size=20), 100, 25),
+    ('eod_process_500', eod_case, 500, 200),
+    ('pnl_transform', transform_case, 100000, 10000),
+    ('pnl_transform_dicts', partial(transform_case, columns=False), 100000, 10000),
+    ('pnl_transform_rows', transform_rows_case, 100000, 10000),
+    ('pnl_gen_report_legacy', legacy_report_case, 20000, 2000),
+    ('pnl_gen_report_xlsx', partial(gen_report_case, formats=('xlsx',)), 20000, 2000),
+    ('pnl_gen_report_legacy_100k', legacy_report_case, 100000, None),
+    ('pnl_gen_report_xlsx_100k', partial(gen_report_case, formats=('xlsx',)), 100000, None),
+    ('pnl_gen_report_csv', partial(gen_report_case, formats=('csv',)), 20000, 2000),
+]
+
+
+def all_cases(quick: bool = False, only: list = None):
+    """
+    :param quick: smaller inputs, for a smoke run
+    :param only: substrings of the case names to run
+    """
+    cases = []
+    for name, build, items, quick_items in CASES:
+        if (only and not any(o in name for o in only)) or (quick and quick_items is None):
+            continue
+        n = quick_items if quick else items
+        setup, run = build(n)
+        cases.append(Case(name, setup, run, n))
+    return cases
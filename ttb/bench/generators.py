@@ -0,0 +1,120 @@
+import datetime
+import json
+import os
+import random
+
+import numpy as np
+
+from ttb.data.event_type import EventType
+from ttb.report.pnl_ledger import PnlLedger
+
+VERSIONS = ('V5.3.1', 'V5.4', 'V6.0', 'V6.1')
+SIDES = ('BUY', 'SELL')
+
+
+def symbols(n: int):
+    return [f'S{i:04d}' for i in range(n)]
+
+
+def subject(rnd: random.Random, universe: list, clauses: int = 2, basket: int = 6):
+    """
+    :return: an alert e-mail subject of `clauses` added/removed clauses, e.g.
+             'Alert: New symbols: HYD, ME, TFI were added to #B4#[BUY]#V5.3.1#. Symbols: SEAT, ZI were removed ...'
+    """
+    parts = []
+    for c in range(clauses):
+        tickers = rnd.sample(universe, rnd.randint(1, basket))
+        side, version = rnd.choice(SIDES), rnd.choice(VERSIONS)
+        plural = len(tickers) > 1
+        if rnd.random() < 0.5:
+            lead = 'Alert: New symbols' if plural else 'Alert: New symbol'
+            verb = 'were added to' if plural else 'was added to'
+        else:
+            lead = 'Symbols' if plural else 'Symbol'
+            verb = 'were removed from' if plural else 'was removed from'
+        if c and lead.startswith('Alert: '):
+            lead = lead[len('Alert: '):]
+        parts.append(f'{lead}: {", ".join(tickers)} {verb} #B4#[{side}]#{version}#')
+    return '. '.join(parts) + '.'
+
+
+def subjects(n: int, clauses: int = 3, universe: int = 500, seed: int = 1):
+    rnd = random.Random(seed)
+    tickers = symbols(universe)
+    return [subject(rnd, tickers, rnd.randint(1, clauses)) for _ in range(n)]
+
+
+def alert_lines(n: int, cob_date: str, start: str = '09:31', universe: int = 500, basket: int = 4, seed: int = 1):
+    """
+    :return: n RPA alert file lines of the cob date, one every 100 ms from `start`
+    """
+    rnd = random.Random(seed)
+    tickers = symbols(universe)
+    t0 = datetime.datetime.strptime(f'{cob_date} {start}', '%Y%m%d %H:%M')
+    return [json.dumps(dict(symbols=rnd.sample(tickers, rnd.randint(1, basket)), action=rnd.choice(SIDES),
+                            version=rnd.choice(VERSIONS),
+                            ts=(t0 + datetime.timedelta(milliseconds=100 * i)).isoformat(timespec='milliseconds')))
+            for i in range(n)]
+
+
+def write_alert_file(path: str, lines: list, mode: str = 'w'):
+    """
+    :param mode: 'a' to append to the file, as the scanner does during the day
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode) as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+def events(n: int, seed: int = 1):
+    """
+    :return: a journal mix of n alert, trade and PnL events
+    """
+    rnd = random.Random(seed)
+    tickers = symbols(500)
+    rows = pnl_rows(n, seed)
+    rs = []
+    for i, pnl in enumerate(rows):
+        kind = i % 3
+        if kind == 0:
+            rs.append(dict(event_type=EventType.RPA_ALERT, tickers=rnd.sample(tickers, 3), action=rnd.choice(SIDES),
+                           version=pnl['version'], ts='2022-05-13T10:01:59.000'))
+        elif kind == 1:
+            rs.append(dict(event_type=EventType.TRADE, ticker=pnl['ticker'], version=pnl['version'],
+                           price=pnl['price_bought'], qty=pnl['qty'], side='BUY', exec_time='2022-05-13T10:02:00.000',
+                           alert_buy_ts='2022-05-13T10:01:59.000', strategy=pnl['buy_strategy']))
+        else:
+            rs.append(dict(pnl, event_type=EventType.PNL))
+    return rs
+
+
+def baskets(n: int, size: int, universe: int = 2000, seed: int = 1):
+    rnd = random.Random(seed)
+    tickers = symbols(universe)
+    return [(rnd.sample(tickers, size), rnd.choice(VERSIONS)) for _ in range(n)]
+
+
+def pnl_rows(n: int, seed: int = 0):
+    """
+    :return: n PnL journal rows of one day, prices drawn around a 0 return
+    """
+    rng = np.random.default_rng(seed)
+    price_b = rng.uniform(5, 300, n).round(2)
+    price_s = (price_b * rng.normal(1, 0.02, n)).round(2)
+    versions = np.array(['V5.4', 'V5.5', 'V6.0', 'V6.1'])[rng.integers(0, 4, n)]
+    return [dict(ticker=f'T{i % 2000}', price_bought=float(price_b[i]), price_sold=float(price_s[i]), qty=100,
+                 price_chg_pct=round(100 * (price_s[i] - price_b[i]) / price_b[i], 4), time_bought='09:31:00',
+                 time_sold='10:02:00', alert_buy_ts='09:30:59', alert_sell_ts='10:01:59',
+                 buy_strategy=f'#B4#{versions[i]}#', sell_strategy=f'#B4#{versions[i]}#', version=str(versions[i]),
+                 pnl_type='REALIZED') for i in range(n)]
+
+
+def pnl_columns(n: int, seed: int = 0):
+    """
+    :return: the pnl_rows as the bot hands them to the report, PnlLedger.columns()
+    """
+    ledger = PnlLedger()
+    for row in pnl_rows(n, seed):
+        ledger.append(row)
+    return ledger.columns()
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from ttb.report.pnl_report import PNL_RPT_HEADER
+
+
+def transform_rows(data: list):
+    """
+    The former row by row PnL report transform, the baseline of the pnl_transform benchmark.
+
+    :return: version -> list of PNL_RPT_HEADER rows
+    """
+    rs = {}
+    for r in data:
+        price_b = float(r['price_bought'])
+        price_s = float(r['price_sold'])
+        qty = float(r['qty'])
+        version = r.get('version') or 'UNKOWN'
+        rs.setdefault(version, list()).append([
+            r['ticker'],
+            price_b,
+            price_s,
+            qty,
+            r['price_chg_pct'],
+            (price_s - price_b) * qty,
+            price_b * qty,
+            r['time_bought'],
+            r['time_sold'],
+            r['alert_buy_ts'],
+            r['alert_sell_ts'],
+            r['buy_strategy'],
+            r['sell_strategy'],
+            r['pnl_type'],
+            1 if r['price_chg_pct'] > 0 else -1 if r['price_chg_pct'] < 0 else 0
+        ])
+    return rs
+
+
+def write_excel(out_file: str, rows: dict):
+    """
+    The former report writer, one DataFrame per version written through pandas.
+    """
+    with pd.ExcelWriter(out_file) as writer:
+        for version, v_data in rows.items():
+            pd.DataFrame(v_data, columns=PNL_RPT_HEADER).to_excel(writer, sheet_name=f'{version}')
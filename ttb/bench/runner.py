@@ -0,0 +1,149 @@
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from ttb.bench.cases import Case, all_cases
+from ttb.cfg.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def measure(case: Case, repeat: int = 5, warmup: int = 1):
+    """
+    Run the case warmup + repeat times, each on a fresh setup in its own work folder; only `run` is timed.
+
+    :return: dict of items, timings (seconds) and items per second of the median run
+    """
+    timings = []
+    for i in range(warmup + repeat):
+        with tempfile.TemporaryDirectory(prefix='ttb_bench_') as work_dir:
+            state = case.setup(work_dir)
+            gc.collect()
+            ## parse_event prints every match, keep that off the console but still pay for it
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                t = time.perf_counter()
+                case.run(state)
+                elapsed = time.perf_counter() - t
+            if i >= warmup:
+                timings.append(elapsed)
+    median = statistics.median(timings)
+    return dict(items=case.items, repeat=repeat, min=min(timings), median=median, mean=statistics.mean(timings),
+                max=max(timings), items_per_sec=case.items / median if median else 0.0)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(cases: list, repeat: int = 5, warmup: int = 1):
+    """
+    :return: results document: meta (time, revision, python, machine) and the measurements by case name
+    """
+    results = {}
+    for case in cases:
+        rs = measure(case, repeat, warmup)
+        logger.info(f"{case.name:30s} {rs['items']:8d} items  median {1000 * rs['median']:10.2f} ms  "
+                    f"{rs['items_per_sec']:12.0f} items/s")
+        results[case.name] = rs
+    meta = dict(time=datetime.datetime.now().isoformat(timespec='seconds'), revision=git_revision(),
+                python=platform.python_version(), machine=platform.machine(), processor=platform.processor(),
+                cpus=os.cpu_count())
+    return dict(meta=meta, cases=results)
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2):
+    """
+    Compare the median of every case against the baseline; cases whose input size changed are not compared.
+
+    :param threshold: relative slowdown flagged as a regression, 0.2 = 20% slower
+    :return: list of dicts (case, baseline, current, ratio, status), status one of ok, faster, regression, new,
+             size changed
+    """
+    rows = []
+    for name, rs in results['cases'].items():
+        base = baseline.get('cases', {}).get(name)
+        if base is None:
+            rows.append(dict(case=name, baseline=None, current=rs['median'], ratio=None, status='new'))
+            continue
+        if base['items'] != rs['items']:
+            rows.append(dict(case=name, baseline=base['median'], current=rs['median'], ratio=None,
+                             status='size changed'))
+            continue
+        ratio = rs['median'] / base['median'] if base['median'] else 1.0
+        status = 'regression' if ratio > 1 + threshold else 'faster' if ratio < 1 / (1 + threshold) else 'ok'
+        rows.append(dict(case=name, baseline=base['median'], current=rs['median'], ratio=ratio, status=status))
+    return rows
+
+
+def load(path: str):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save(path: str, results: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def print_comparison(rows: list):
+    for r in rows:
+        base = f"{1000 * r['baseline']:10.2f} ms" if r['baseline'] is not None else ' ' * 13
+        ratio = f"{r['ratio']:6.2f}x" if r['ratio'] is not None else ' ' * 7
+        print(f"{r['case']:30s} {base}  {1000 * r['current']:10.2f} ms  {ratio}  {r['status']}")
+
+
+if __name__ == "__main__":
+    conf = Config()
+    parser = argparse.ArgumentParser(description='benchmark the hot paths of the bot on synthetic data')
+    parser.add_argument('cases', nargs='*', help='run only the cases whose name contains one of these')
+    parser.add_argument('--quick', action='store_true', help='smaller inputs')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--out', help='results file, by default <bench_dir>/bench_<time>.json')
+    parser.add_argument('--baseline', default=f'{conf.bench_dir}{os.sep}baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=conf.bench_regression_threshold)
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    ## the measurements are shown, the logs of the code under test are not
+    logger.setLevel(logging.INFO)
+    cases = all_cases(args.quick, args.cases)
+    if args.list:
+        for case in cases:
+            print(f'{case.name:30s} {case.items:8d} items')
+        sys.exit(0)
+
+    results = run(cases, args.repeat, args.warmup)
+    results['meta']['quick'] = args.quick
+    out = args.out or f"{conf.bench_dir}{os.sep}bench_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    save(out, results)
+    print(f'results written to {out}')
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        rows = compare(results, load(args.baseline), args.threshold)
+        print_comparison(rows)
+        regressions = [r['case'] for r in rows if r['status'] == 'regression']
+        if regressions:
+            print(f'REGRESSIONS (> {100 * args.threshold:.0f}% slower than {args.baseline}): {regressions}')
+    if args.save_baseline:
+        save(args.baseline, results)
+        print(f'baseline saved to {args.baseline}')
+    sys.exit(1 if regressions else 0)
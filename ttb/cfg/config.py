@@ -7,6 +7,7 @@ fmt_Ymd = "%Y%m%d"
 CLIENT_ID = '686FJCQ81PSSX5HEOCPZYQU0JM8RRNUR0BQ'
 CALL_BACK_URL = 'https://localhost'
 CRED_PATH = '../auth/cred.json'
+DEFAULT_ACCT = 'default'
 
 
 class Config(metaclass=Singleton):
@@ -17,12 +18,84 @@ class Config(metaclass=Singleton):
     def date_today(self):
         return datetime.now().strftime(fmt_Ymd)
 
+    @property
+    def default_acct(self):
+        return DEFAULT_ACCT
+
+    @property
+    def long_watch_list_name(self):
+        return "long_positions"
+
     def mongo_url(self):
         return 'localhost:27017'
 
     def mongo_db(self):
         return 'trading'
 
+    ## 'mongo' or 'sqlite' (embedded, db_sqlite_path)
+    @property
+    def db_backend(self):
+        return 'mongo'
+
+    @property
+    def db_sqlite_path(self):
+        return '../../data/trading.db'
+
+    ## DB writes are buffered per collection and bulk inserted every db_batch_size docs or
+    ## db_flush_interval_seconds, batches failing db_max_retries times are spilled to db_spill_dir
+    @property
+    def db_batch_size(self):
+        return 500
+
+    @property
+    def db_flush_interval_seconds(self):
+        return 1.0
+
+    @property
+    def db_max_retries(self):
+        return 3
+
+    @property
+    def db_retry_backoff_seconds(self):
+        return 0.5
+
+    @property
+    def db_spill_dir(self):
+        return '../../data/db_spill'
+
+    ## multi-day trades/PnL store, filled from the journal files (python -m ttb.db.trade_store)
+    @property
+    def trade_store_path(self):
+        return '../../data/trade_store.db'
+
+    ## 'td' or 'sim' (simulated broker, see the sim_* settings)
+    @property
+    def broker(self):
+        return 'td'
+
+    ## simulated broker: response time distribution ('fixed:ms', 'uniform:lo:hi', 'normal:mean:sd',
+    ## 'lognormal:mean:sd'), share of requests failing with HTTP 500, server side rate limit (HTTP 429),
+    ## seed and annual volatility of the deterministic price paths
+    @property
+    def sim_latency(self):
+        return 'lognormal:40:15'
+
+    @property
+    def sim_error_rate(self):
+        return 0.0
+
+    @property
+    def sim_rate_limit_per_minute(self):
+        return 120
+
+    @property
+    def sim_seed(self):
+        return 7
+
+    @property
+    def sim_volatility(self):
+        return 0.4
+
     @property
     def td_client_id(self):
         return CLIENT_ID
@@ -35,6 +108,28 @@ class Config(metaclass=Singleton):
     def td_credentials_path(self):
         return CRED_PATH
 
+    @property
+    def td_api_url(self):
+        return 'https://api.tdameritrade.com/v1'
+
+    ## refresh the access token this many seconds before it expires
+    @property
+    def td_token_refresh_margin_seconds(self):
+        return 300
+
+    @property
+    def td_http_pool_size(self):
+        return 10
+
+    ## broker API throttling (requests per minute, max burst)
+    @property
+    def td_rate_limit_per_minute(self):
+        return 120
+
+    @property
+    def td_rate_limit_burst(self):
+        return 10
+
     @property
     def mail_alert_sender(self):
         return "alerts@thinkorswim.com"
@@ -57,6 +152,12 @@ class Config(metaclass=Singleton):
     def alert_pull_interval_seconds(self):
         return 10
 
+    ## rpa alert ingest mode: 'inotify' wakes up on alert file changes (falls back to polling where
+    ## not supported), 'poll' reads the file every alert_pull_interval_seconds
+    @property
+    def alert_watch_mode(self):
+        return 'inotify'
+
     @property
     def watchlist_pull_interval_seconds(self):
         return 20
@@ -85,6 +186,26 @@ class Config(metaclass=Singleton):
     def report_out_dir(self):
         return self.gdrive_path
 
+    ## any of 'xlsx' (streamed, one sheet per version + summary), 'csv', 'parquet' (needs pyarrow)
+    @property
+    def report_formats(self):
+        return ('xlsx',)
+
+    ## per-day aggregates of python -m ttb.report.period_report
+    @property
+    def period_report_cache_dir(self):
+        return '../../data/period_cache'
+
+    ## results of python -m ttb.bench.runner, the saved baseline is <bench_dir>/baseline.json
+    @property
+    def bench_dir(self):
+        return '../../data/bench'
+
+    ## a benchmark is flagged as a regression when its median is this much slower than the baseline (0.2 = 20%)
+    @property
+    def bench_regression_threshold(self):
+        return 0.2
+
     @property
     def gdrive_token_path(self):
         return "../auth/token.json"
@@ -118,10 +239,126 @@ class Config(metaclass=Singleton):
     def open_positions_journal(self):
         return "open_positions"
 
+    ## positions are journaled as deltas, compacted into the open_positions snapshot
+    ## every positions_snapshot_every deltas or positions_snapshot_interval_seconds
+    @property
+    def open_positions_delta_journal(self):
+        return "open_positions_delta"
+
+    @property
+    def positions_snapshot_every(self):
+        return 100
+
+    @property
+    def positions_snapshot_interval_seconds(self):
+        return 60
+
+    @property
+    def eod_prices_file(self):
+        return "eod_prices"
+
+    ## per stage latency histograms (ingest, parse, quote, trade, publish, persist, queue waits), logged every
+    ## instrumentation_dump_seconds (0: at EOD only) and written to the latency journal at EOD
+    @property
+    def instrumentation_enabled(self):
+        return False
+
+    @property
+    def instrumentation_dump_seconds(self):
+        return 0
+
+    @property
+    def latency_journal(self):
+        return "latency"
+
+    ## per execution alert -> execution stage time stamps and latency breakdown (ms), see ttb.util.trace
+    @property
+    def trace_journal(self):
+        return "trace"
+
+    ## every event sink (file journal, DB) has its own queue, when full: 'block', 'drop_new' or 'drop_oldest';
+    ## dropped events are lost for that sink (trades, PnL), only drop where the sink may miss events
+    @property
+    def event_sink_queue_size(self):
+        return 10000
+
+    @property
+    def event_sink_overflow(self):
+        return 'block'
+
+    @property
+    def db_sink_overflow(self):
+        return 'block'
+
+    ## journal files are written by a background thread, flushed every journal_flush_bytes or
+    ## journal_flush_interval_seconds; fsync policy: 'never', 'batch' (every flush) or 'close'
+    @property
+    def journal_async(self):
+        return True
+
+    @property
+    def journal_flush_bytes(self):
+        return 64 * 1024
+
+    @property
+    def journal_flush_interval_seconds(self):
+        return 1.0
+
+    @property
+    def journal_fsync(self):
+        return 'never'
+
     @property
     def price_poll_freq(self):
         return 180
 
+    ## max # of symbols per quote request
+    @property
+    def quote_batch_size(self):
+        return 100
+
+    ## quotes younger than this are served from the quote cache
+    @property
+    def quote_cache_ttl_seconds(self):
+        return 1.0
+
+    @property
+    def quote_cache_size(self):
+        return 2000
+
+    ## streaming quotes: None (disabled, REST quotes only) or 'socket'
+    @property
+    def mktdata_transport(self):
+        return None
+
+    @property
+    def mktdata_host(self):
+        return 'localhost'
+
+    @property
+    def mktdata_port(self):
+        return 9100
+
+    ## # of ticks kept per symbol
+    @property
+    def mktdata_depth(self):
+        return 256
+
+    ## streamed prices older than this fall back to REST quotes
+    @property
+    def mktdata_max_age_seconds(self):
+        return 2
+
+    ## local (not synced) dir of the historical price store
+    @property
+    def hist_dir(self):
+        return "../../data/hist"
+
+    ## price history is served from the hist store, the bars missing on disk are fetched at most this often per symbol
+    @property
+    def hist_sync_interval_seconds(self):
+        return 300
+
     @property
     def alert_timeout_seconds(self):
         return 300
@@ -141,6 +378,16 @@ class Config(metaclass=Singleton):
     def daily_trade_amt_limit(self):
         return 300000
 
+    ## cap buy qty by per_trade_amt_limit and what is left of daily_trade_amt_limit
+    @property
+    def enforce_trade_limits(self):
+        return False
+
+    ## scanner versions to trade, None for all
+    @property
+    def trade_versions(self):
+        return None
+
     @property
     def alert_dir(self):
         return f'{self.gdrive_path}{os.sep}{self.date_today}'
@@ -149,3 +396,34 @@ class Config(metaclass=Singleton):
     @property
     def alert_file_path(self):
         return f'{self.alert_dir}{os.sep}scanner_alerts_{self.date_today}.json'
+
+
+class OverrideConfig:
+    """
+    A Config with some settings replaced, e.g. OverrideConfig(date_today='20220513', trade_default_qty=50).
+
+    Config is a singleton, this wraps it instead. Properties not overridden are evaluated against the wrapper,
+    so derived settings (alert_file_path from date_today, ...) follow the overrides.
+    """
+
+    def __init__(self, base: Config = None, **overrides):
+        if isinstance(base, OverrideConfig):
+            overrides = dict(base.overrides, **overrides)
+            base = base.base
+        self.base = base or Config()
+        for name in overrides:
+            if not hasattr(type(self.base), name):
+                raise AttributeError(f'unknown config setting: {name}')
+        self.overrides = overrides
+
+    def __getattr__(self, name):
+        ## only reached for names not set on the instance: before __init__ (copy, pickle) overrides and base are
+        ## missing, and special methods are looked up by protocols, neither must recurse or hit the base config
+        if name in ('overrides', 'base') or (name.startswith('__') and name.endswith('__')):
+            raise AttributeError(name)
+        if name in self.overrides:
+            return self.overrides[name]
+        attr = getattr(type(self.base), name, None)
+        if attr is not None and hasattr(attr, '__get__'):
+            return attr.__get__(self, type(self.base))
+        return getattr(self.base, name)
@@ -8,4 +8,4 @@ class EventType(Enum):
     POSITIONS = 4
     RPA_ALERT = 5
     EOD_PRICE = 6
-
+    TRACE = 7
@@ -0,0 +1,141 @@
+class Position:
+    __slots__ = ('ticker', 'version', 'strategy', 'price', 'qty', 'exec_time', 'alert_buy_ts')
+
+    def __init__(self, ticker: str, version: str, strategy: str, price: float, qty: float, exec_time: str,
+                 alert_buy_ts: str = None):
+        self.ticker = ticker
+        self.version = version
+        self.strategy = strategy
+        self.price = price
+        self.qty = qty
+        self.exec_time = exec_time
+        self.alert_buy_ts = alert_buy_ts
+
+    @property
+    def cost(self):
+        return self.price * self.qty
+
+    def to_dict(self, strategy_key: str = 'strategy'):
+        """
+        :param strategy_key: 'strategy' (RPA journal) or 'scanner' (e-mail journal), PositionBook.load reads both
+        """
+        return {'price': self.price, 'qty': self.qty, 'exec_time': self.exec_time, 'alert_buy_ts': self.alert_buy_ts,
+                strategy_key: self.strategy}
+
+    def __repr__(self):
+        return f'Position({self.version}, {self.ticker}, price={self.price}, qty={self.qty}, ' \
+               f'exec_time={self.exec_time}, strategy={self.strategy})'
+
+
+class PositionBook:
+    """
+    Open long positions, one per (version, ticker), indexed by ticker, version and strategy.
+
+    Cost basis totals are maintained per index on add/remove, so holding checks, per-index lookups and
+    exposure queries do not scan the book.
+    """
+
+    def __init__(self):
+        self.__positions = {}  ## (version, ticker) -> Position
+        self.__by_ticker = {}  ## ticker -> {version: Position}
+        self.__by_version = {}  ## version -> {ticker: Position}
+        self.__by_strategy = {}  ## strategy -> {(version, ticker): Position}
+        self.__cost_by_ticker = {}
+        self.__cost_by_version = {}
+        self.__cost_by_strategy = {}
+        self.total_cost = 0.0
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def __iter__(self):
+        return iter(list(self.__positions.values()))
+
+    def add(self, pos: Position):
+        self.remove(pos.version, pos.ticker)
+        key = (pos.version, pos.ticker)
+        self.__positions[key] = pos
+        self.__index_add(self.__by_ticker, self.__cost_by_ticker, pos.ticker, pos.version, pos)
+        self.__index_add(self.__by_version, self.__cost_by_version, pos.version, pos.ticker, pos)
+        self.__index_add(self.__by_strategy, self.__cost_by_strategy, pos.strategy, key, pos)
+        self.total_cost += pos.cost
+
+    def remove(self, version: str, ticker: str):
+        """
+        :return: the removed Position, None if not held
+        """
+        pos = self.__positions.pop((version, ticker), None)
+        if pos is None:
+            return None
+        self.__index_remove(self.__by_ticker, self.__cost_by_ticker, ticker, version, pos)
+        self.__index_remove(self.__by_version, self.__cost_by_version, version, ticker, pos)
+        self.__index_remove(self.__by_strategy, self.__cost_by_strategy, pos.strategy, (version, ticker), pos)
+        self.total_cost = self.total_cost - pos.cost if self.__positions else 0.0
+        return pos
+
+    @staticmethod
+    def __index_add(index, totals, key, sub_key, pos):
+        index.setdefault(key, {})[sub_key] = pos
+        totals[key] = totals.get(key, 0.0) + pos.cost
+
+    @staticmethod
+    def __index_remove(index, totals, key, sub_key, pos):
+        entries = index[key]
+        entries.pop(sub_key)
+        if entries:
+            totals[key] -= pos.cost
+        else:
+            index.pop(key)
+            totals.pop(key)
+
+    def get(self, version: str, ticker: str):
+        return self.__positions.get((version, ticker))
+
+    def holds(self, version: str, ticker: str):
+        return (version, ticker) in self.__positions
+
+    def is_held(self, ticker: str):
+        return ticker in self.__by_ticker
+
+    def versions_holding(self, ticker: str):
+        return list(self.__by_ticker.get(ticker, {}).keys())
+
+    def by_ticker(self, ticker: str):
+        return dict(self.__by_ticker.get(ticker, {}))
+
+    def by_version(self, version: str):
+        return dict(self.__by_version.get(version, {}))
+
+    def by_strategy(self, strategy: str):
+        return list(self.__by_strategy.get(strategy, {}).values())
+
+    def tickers(self):
+        return list(self.__by_ticker.keys())
+
+    def versions(self):
+        return list(self.__by_version.keys())
+
+    def cost_of_ticker(self, ticker: str):
+        return self.__cost_by_ticker.get(ticker, 0.0)
+
+    def cost_of_version(self, version: str):
+        return self.__cost_by_version.get(version, 0.0)
+
+    def cost_of_strategy(self, strategy: str):
+        return self.__cost_by_strategy.get(strategy, 0.0)
+
+    def to_dict(self, strategy_key: str = 'strategy'):
+        """
+        :return: {version: {ticker: position dict}}, the layout of the positions journal
+        """
+        return {version: {ticker: pos.to_dict(strategy_key) for ticker, pos in positions.items()}
+                for version, positions in self.__by_version.items()}
+
+    def load(self, positions: dict):
+        """
+        Add positions given as {version: {ticker: position dict}}.
+        """
+        for version, tickers in positions.items():
+            for ticker, p in tickers.items():
+                self.add(Position(ticker, version, p.get('strategy') or p.get('scanner'), float(p['price']),
+                                  p['qty'], p['exec_time'], p.get('alert_buy_ts')))
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from enum import Enum
+
+from ttb.cfg.config import Config
+from ttb.util import timeit
+
+logger = logging.getLogger(__name__)
+
+EVENTS = 'events'
+EXECUTIONS = 'executions'
+PNL = 'pnl'
+EOD_PRICES = 'eod_prices'
+COLLECTIONS = (EVENTS, EXECUTIONS, PNL, EOD_PRICES)
+DUPLICATE_KEY = 11000
+
+
+def normalize(doc: dict):
+    """
+    :return: a copy of doc that the backends can store (enums by name)
+    """
+    return {k: v.name if isinstance(v, Enum) else v for k, v in doc.items()}
+
+
+class MongoBackend:
+    def __init__(self, url: str, db: str):
+        from pymongo import MongoClient
+        self.__client = MongoClient(url, serverSelectionTimeoutMS=5000)
+        self.__db = self.__client[db]
+
+    def insert_many(self, collection: str, docs: list):
+        """
+        Documents carry their _id, so a retried batch only adds what the failed attempt did not write: the
+        duplicate key errors of the documents already written count as success.
+        """
+        from pymongo.errors import BulkWriteError
+        try:
+            self.__db[collection].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failed = [err for err in e.details.get('writeErrors', []) if err.get('code') != DUPLICATE_KEY]
+            if failed or e.details.get('writeConcernErrors'):
+                raise
+
+    def close(self):
+        self.__client.close()
+
+
+class SQLiteBackend:
+    """
+    Embedded stand-in for Mongo, one table per collection holding the documents as JSON.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        for c in COLLECTIONS:
+            self.__conn.execute(f'CREATE TABLE IF NOT EXISTS {c} (id INTEGER PRIMARY KEY, doc_id TEXT UNIQUE, '
+                                f'cob_date TEXT, account TEXT, doc TEXT)')
+        self.__conn.commit()
+
+    def insert_many(self, collection: str, docs: list):
+        ## like Mongo's _id, a document replayed from the spill file after it was written is not added twice
+        with self.__conn:
+            self.__conn.executemany(f'INSERT OR IGNORE INTO {collection} (doc_id, cob_date, account, doc) '
+                                    f'VALUES (?, ?, ?, ?)',
+                                    [(d.get('_id'), d.get('cob_date'), d.get('account'), json.dumps(d, default=str))
+                                     for d in docs])
+
+    def find(self, collection: str):
+        return [json.loads(row[0]) for row in self.__conn.execute(f'SELECT doc FROM {collection} ORDER BY id')]
+
+    def close(self):
+        self.__conn.close()
+
+
+def create_backend(conf: Config):
+    if conf.db_backend == 'sqlite':
+        return SQLiteBackend(conf.db_sqlite_path)
+    return MongoBackend(conf.mongo_url(), conf.mongo_db())
+
+
+class DBPersister:
+    """
+    Write-behind persister: inserts only buffer the document, a background thread bulk inserts each collection's
+    buffer when it reaches `batch_size` documents or every `flush_interval_seconds`.
+
+    A failed bulk insert is retried with exponential backoff, after `max_retries` the batch is spilled to
+    <spill_dir>/<collection>.jsonl and replayed on the next successful flush. Every document gets its _id when
+    buffered, so a batch the DB partly wrote is not duplicated by the retry or the replay.
+    """
+
+    def __init__(self, config: Config = None, backend=None, batch_size: int = None,
+                 flush_interval_seconds: float = None, spill_dir: str = None, max_retries: int = None,
+                 backoff_seconds: float = None):
+        conf = config or Config()
+        self.batch_size = batch_size or conf.db_batch_size
+        self.flush_interval_seconds = flush_interval_seconds or conf.db_flush_interval_seconds
+        self.spill_dir = spill_dir or conf.db_spill_dir
+        self.max_retries = conf.db_max_retries if max_retries is None else max_retries
+        self.backoff_seconds = conf.db_retry_backoff_seconds if backoff_seconds is None else backoff_seconds
+        self.__backend = backend
+        self.__conf = conf
+        self.__buffers = {c: [] for c in COLLECTIONS}
+        self.__lock = threading.Lock()
+        self.__wakeup = threading.Event()
+        self.__stopped = False
+        self.inserted = 0
+        self.spilled = 0
+        self.retries = 0
+        if not os.path.exists(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        self.__thread = threading.Thread(target=self.__run, name='db-persister', daemon=True)
+        self.__thread.start()
+
+    def insert_event(self, event: dict):
+        self.__add(EVENTS, event)
+
+    def insert_execution(self, execution: dict):
+        self.__add(EXECUTIONS, execution)
+
+    def insert_pnl(self, pnl: dict):
+        self.__add(PNL, pnl)
+
+    def insert_eod_prices(self, eod_prices: dict):
+        self.__add(EOD_PRICES, eod_prices)
+
+    def __add(self, collection, doc):
+        doc = normalize(doc)
+        ## a stable id from the start, retries and spill replays must not insert a document twice
+        doc.setdefault('_id', uuid.uuid4().hex)
+        with self.__lock:
+            buffer = self.__buffers[collection]
+            buffer.append(doc)
+            full = len(buffer) >= self.batch_size
+        if full:
+            self.__wakeup.set()
+
+    def __run(self):
+        while not self.__stopped:
+            self.__wakeup.wait(self.flush_interval_seconds)
+            self.__wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """
+        Bulk insert everything buffered, replaying spilled batches first once the DB is reachable.
+        """
+        with self.__lock:
+            batches = {c: docs for c, docs in self.__buffers.items() if docs}
+            self.__buffers = {c: [] for c in COLLECTIONS}
+        if not batches and not self.__has_spill():
+            return
+        if self.__backend is None:
+            try:
+                self.__backend = create_backend(self.__conf)
+            except Exception:
+                logger.exception('failed to connect to the DB')
+                for c, docs in batches.items():
+                    self.__spill(c, docs)
+                return
+        if self.__has_spill() and not self.__replay():
+            for c, docs in batches.items():
+                self.__spill(c, docs)
+            return
+        for c, docs in batches.items():
+            if not self.__insert(c, docs):
+                self.__spill(c, docs)
+
+    def __insert(self, collection, docs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.__insert_many(collection, docs)
+                self.inserted += len(docs)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f'failed to insert {len(docs)} docs into {collection}: {e}')
+                    break
+                self.retries += 1
+                delay = self.backoff_seconds * 2 ** attempt
+                logger.warning(f'insert into {collection} failed ({e}), retry in {delay:.1f} seconds')
+                time.sleep(delay)
+        return False
+
+    ## only the backend call is timed, the persist stage excludes the retry backoff
+    @timeit.stage('persist')
+    def __insert_many(self, collection, docs):
+        self.__backend.insert_many(collection, docs)
+
+    def __spill_file(self, collection):
+        return f'{self.spill_dir}{os.sep}{collection}.jsonl'
+
+    def __has_spill(self):
+        return any(os.path.exists(self.__spill_file(c)) for c in COLLECTIONS)
+
+    def __spill(self, collection, docs):
+        with open(self.__spill_file(collection), 'a') as f:
+            for d in docs:
+                f.write(f'{json.dumps(d, default=str)}\n')
+        self.spilled += len(docs)
+        logger.warning(f'{len(docs)} {collection} docs spilled to {self.__spill_file(collection)}')
+
+    def __replay(self):
+        for c in COLLECTIONS:
+            path = self.__spill_file(c)
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r') as f:
+                docs = [json.loads(line) for line in f if line.strip()]
+            if docs and not self.__insert(c, docs):
+                return False
+            os.remove(path)
+            logger.info(f'{len(docs)} spilled {c} docs replayed')
+        return True
+
+    def stats(self):
+        with self.__lock:
+            pending = sum(len(docs) for docs in self.__buffers.values())
+        return dict(pending=pending, inserted=self.inserted, spilled=self.spilled, retries=self.retries)
+
+    def close(self):
+        self.__stopped = True
+        self.__wakeup.set()
+        self.__thread.join()
+        self.flush()
+        if self.__backend:
+            self.__backend.close()
+        logger.info(f'db persister stats: {self.stats()}')
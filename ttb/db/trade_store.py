@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from ttb.cfg.config import Config
+from ttb.util import timeutil
+from ttb.util.strategy import version_of
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY, cob_date TEXT, account TEXT, version TEXT, ticker TEXT, strategy TEXT, side TEXT,
+    price REAL, qty REAL, exec_time TEXT, alert_ts TEXT, source TEXT);
+CREATE TABLE IF NOT EXISTS pnl (
+    id INTEGER PRIMARY KEY, cob_date TEXT, account TEXT, version TEXT, ticker TEXT, strategy TEXT,
+    sell_strategy TEXT, price_bought REAL, price_sold REAL, qty REAL, price_chg_pct REAL, pnl REAL, transc_amt REAL,
+    time_bought TEXT, time_sold TEXT, alert_buy_ts TEXT, alert_sell_ts TEXT, pnl_type TEXT, source TEXT);
+CREATE TABLE IF NOT EXISTS eod_prices (
+    cob_date TEXT, account TEXT, ticker TEXT, price REAL, source TEXT, PRIMARY KEY (cob_date, account, ticker));
+CREATE TABLE IF NOT EXISTS imported_files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL);
+'''
+INDEXED = ('cob_date', 'account', 'version', 'ticker', 'strategy')
+FILTERS = ('account', 'version', 'ticker', 'strategy')
+
+TRADE_COLUMNS = ('cob_date', 'account', 'version', 'ticker', 'strategy', 'side', 'price', 'qty', 'exec_time',
+                 'alert_ts', 'source')
+PNL_COLUMNS = ('cob_date', 'account', 'version', 'ticker', 'strategy', 'sell_strategy', 'price_bought', 'price_sold',
+               'qty', 'price_chg_pct', 'pnl', 'transc_amt', 'time_bought', 'time_sold', 'alert_buy_ts',
+               'alert_sell_ts', 'pnl_type', 'source')
+EOD_COLUMNS = ('cob_date', 'account', 'ticker', 'price', 'source')
+
+
+class TradeStore:
+    """
+    Multi-day trades, PnLs and EOD prices in one SQLite file, indexed on cob_date, account, version, ticker
+    and strategy. Queries return pandas DataFrames.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__conn = sqlite3.connect(path)
+        self.__conn.executescript(SCHEMA)
+        for table in ('trades', 'pnl'):
+            for col in INDEXED:
+                self.__conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_{col} ON {table} ({col})')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS ix_eod_prices_ticker ON eod_prices (ticker)')
+        self.__conn.commit()
+
+    def close(self):
+        self.__conn.close()
+
+    def insert_trades(self, cob_date: str, trades: list, account: str = None, source: str = None):
+        self.__insert(*self.__trade_rows(cob_date, trades, account, source))
+
+    def insert_pnl(self, cob_date: str, pnls: list, account: str = None, source: str = None):
+        self.__insert(*self.__pnl_rows(cob_date, pnls, account, source))
+
+    def insert_eod_prices(self, cob_date: str, prices: dict, account: str = None, source: str = None):
+        self.__insert(*self.__eod_rows(cob_date, [dict(eod_prices=prices)], account, source))
+
+    @staticmethod
+    def __trade_rows(cob_date, trades, account, source):
+        rows = [(cob_date, t.get('account') or account, version_of(t), t['ticker'],
+                 t.get('strategy') or t.get('scanner'), t.get('side'), float(t['price']), float(t['qty']),
+                 t.get('exec_time'), t.get('alert_buy_ts') or t.get('alerts_sell_ts') or t.get('alert_sell_ts'),
+                 source) for t in trades]
+        return 'INSERT', 'trades', TRADE_COLUMNS, rows
+
+    @staticmethod
+    def __pnl_rows(cob_date, pnls, account, source):
+        rows = []
+        for p in pnls:
+            price_b = float(p['price_bought'])
+            price_s = float(p['price_sold'])
+            qty = float(p['qty'])
+            rows.append((cob_date, p.get('account') or account, p.get('version') or 'UNKOWN', p['ticker'],
+                         p.get('buy_strategy') or p.get('buy_scanner'),
+                         p.get('sell_strategy') or p.get('sell_scanner'), price_b, price_s, qty,
+                         float(p['price_chg_pct']), (price_s - price_b) * qty, price_b * qty, p.get('time_bought'),
+                         p.get('time_sold'), p.get('alert_buy_ts'), p.get('alert_sell_ts'), p.get('pnl_type'),
+                         source))
+        return 'INSERT', 'pnl', PNL_COLUMNS, rows
+
+    @staticmethod
+    def __eod_rows(cob_date, events, account, source):
+        """
+        :param events: eod prices events, dicts with eod_prices (ticker -> price) and optionally account
+        """
+        rows = [(cob_date, e.get('account') or account or '', t, float(p), source)
+                for e in events for t, p in (e.get('eod_prices') or {}).items()]
+        return 'INSERT OR REPLACE', 'eod_prices', EOD_COLUMNS, rows
+
+    def __insert(self, verb, table, columns, rows):
+        with self.__conn:
+            self.__write(verb, table, columns, rows)
+
+    def __write(self, verb, table, columns, rows):
+        if rows:
+            self.__conn.executemany(f'{verb} INTO {table} ({", ".join(columns)}) '
+                                    f'VALUES ({", ".join("?" * len(columns))})', rows)
+
+    def import_journal(self, journal_dir: str, account: str = None, conf: Config = None):
+        """
+        Load the journal files of every <journal_dir>/<YYYYMMDD> folder. Files already imported and unchanged
+        are skipped, changed ones replace what was imported from them before.
+
+        :return: # of files imported
+        """
+        conf = conf or Config()
+        kinds = {conf.trades_journal: self.__trade_rows, conf.pnl_journal: self.__pnl_rows,
+                 conf.eod_prices_file: self.__eod_rows}
+        imported = 0
+        for cob_date in timeutil.cob_dates(journal_dir):
+            for name, to_rows in kinds.items():
+                path = f'{journal_dir}{os.sep}{cob_date}{os.sep}{name}_{cob_date}.json'
+                if os.path.exists(path) and self.__import_file(path, cob_date, to_rows, account):
+                    imported += 1
+        logger.info(f'{imported} journal files imported into {self.path}')
+        return imported
+
+    def __import_file(self, path, cob_date, to_rows, account):
+        stat = os.stat(path)
+        seen = self.__conn.execute('SELECT size, mtime FROM imported_files WHERE path = ?', (path,)).fetchone()
+        if seen == (stat.st_size, stat.st_mtime):
+            return False
+        docs = []
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    docs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f'skipped invalid line in {path}: {line.rstrip()}')
+        rows = to_rows(cob_date, docs, account, path)
+        ## what was imported from the file before is only replaced if the whole file imports
+        with self.__conn:
+            for table in ('trades', 'pnl', 'eod_prices'):
+                self.__conn.execute(f'DELETE FROM {table} WHERE source = ?', (path,))
+            self.__write(*rows)
+            self.__conn.execute('INSERT OR REPLACE INTO imported_files VALUES (?, ?, ?)',
+                                (path, stat.st_size, stat.st_mtime))
+        return True
+
+    def __where(self, start=None, end=None, **filters):
+        clauses, params = [], []
+        if start:
+            clauses.append('cob_date >= ?')
+            params.append(start)
+        if end:
+            clauses.append('cob_date <= ?')
+            params.append(end)
+        for col, value in filters.items():
+            if value is None:
+                continue
+            if col not in FILTERS:
+                raise ValueError(f'unknown filter: {col}')
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f'{col} IN ({", ".join("?" * len(values))})')
+            params.extend(values)
+        return (f' WHERE {" AND ".join(clauses)}' if clauses else ''), params
+
+    def query_trades(self, start: str = None, end: str = None, **filters):
+        """
+        :param start: first cob date (YYYYMMDD), inclusive
+        :param end: last cob date, inclusive
+        :param filters: account, version, ticker, strategy - a value or a list of values
+        """
+        where, params = self.__where(start, end, **filters)
+        return pd.read_sql_query(f'SELECT * FROM trades{where} ORDER BY cob_date, id', self.__conn, params=params)
+
+    def query_pnl(self, start: str = None, end: str = None, **filters):
+        where, params = self.__where(start, end, **filters)
+        return pd.read_sql_query(f'SELECT * FROM pnl{where} ORDER BY cob_date, id', self.__conn, params=params)
+
+    def pnl_summary(self, by=('version',), start: str = None, end: str = None, **filters):
+        """
+        PnL aggregated in SQL, e.g. pnl_summary(by=('version', 'cob_date'), start='20220301', version='V5.4')
+        """
+        for col in by:
+            if col not in INDEXED + ('pnl_type',):
+                raise ValueError(f'cannot group by {col}')
+        where, params = self.__where(start, end, **filters)
+        keys = ', '.join(by)
+        sql = f'SELECT {keys}, COUNT(*) AS count, SUM(price_chg_pct > 0) AS wins, SUM(price_chg_pct < 0) AS losses, ' \
+              f'SUM(pnl) AS pnl, SUM(transc_amt) AS transc_amt, AVG(price_chg_pct) AS avg_pct ' \
+              f'FROM pnl{where} GROUP BY {keys} ORDER BY {keys}'
+        return pd.read_sql_query(sql, self.__conn, params=params)
+
+    def query_eod_prices(self, start: str = None, end: str = None, ticker=None):
+        where, params = self.__where(start, end, ticker=ticker)
+        return pd.read_sql_query(f'SELECT cob_date, account, ticker, price FROM eod_prices{where} '
+                                 f'ORDER BY cob_date, ticker', self.__conn, params=params)
+
+
+if __name__ == "__main__":
+    ## python -m ttb.db.trade_store [journal_dir] [store_path]
+    conf = Config()
+    store = TradeStore(sys.argv[2] if len(sys.argv) > 2 else conf.trade_store_path)
+    store.import_journal(sys.argv[1] if len(sys.argv) > 1 else conf.journal_dir)
+    print(store.pnl_summary(by=('version',)))
+    store.close()
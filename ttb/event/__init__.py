@@ -1,3 +1,6 @@
 class EventHandler:
     def handle_event(self, event):
+        pass
+
+    def close(self):
         pass
\ No newline at end of file
@@ -0,0 +1,65 @@
+import datetime
+import logging
+import time
+from queue import Queue, Empty
+
+from ttb.util import timeit
+
+logger = logging.getLogger(__name__)
+
+
+class TimedQueue(Queue):
+    """
+    Queue that remembers when each item was put.
+
+    Producers use it like a plain Queue, `get()` returns a tuple (enqueue_time, item).
+    """
+
+    def _put(self, item):
+        self.queue.append((time.time(), item))
+
+
+class EventDispatcher:
+    """
+    Delivers events from a TimedQueue to a handler as soon as they arrive, until a deadline.
+
+    The consumer blocks on the queue instead of sleeping, the wait is bounded by the time left to the deadline,
+    so the loop returns on time for EOD processing even when no event comes in.
+    """
+
+    def __init__(self, event_q: TimedQueue, handler, deadline: datetime.datetime):
+        self.event_q = event_q
+        self.handler = handler
+        self.deadline = deadline
+        self.event_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def run(self):
+        while True:
+            remaining = self.deadline.timestamp() - time.time()
+            if remaining <= 0:
+                break
+            try:
+                enqueued_at, event = self.event_q.get(timeout=remaining)
+            except Empty:
+                continue
+            self.__record_wait(time.time() - enqueued_at)
+            try:
+                self.handler(event)
+            except Exception:
+                logger.exception(f'error handling event {event}')
+        self.log_stats()
+
+    def __record_wait(self, wait: float):
+        self.event_count += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        timeit.record('queue_wait', wait)
+        logger.info(f'event queue wait: {wait * 1000:.1f} ms')
+
+    def log_stats(self):
+        if self.event_count:
+            logger.info(f'event queue wait: count = {self.event_count}, '
+                        f'avg = {1000 * self.wait_total / self.event_count:.1f} ms, '
+                        f'max = {1000 * self.wait_max:.1f} ms')
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from queue import Empty, Full
+
+from ttb.event import EventHandler
+from ttb.event.dispatcher import TimedQueue
+from ttb.util import timeit
+
+logger = logging.getLogger(__name__)
+
+BLOCK = 'block'
+DROP_NEW = 'drop_new'
+DROP_OLDEST = 'drop_oldest'
+
+_STOP = object()
+
+
+class _Sink:
+    def __init__(self, name, handler: EventHandler, maxsize, overflow):
+        self.name = name
+        self.handler = handler
+        self.overflow = overflow
+        self.q = TimedQueue(maxsize=maxsize)
+        self.thread = None
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+    def stats(self):
+        return dict(depth=self.q.qsize(), delivered=self.delivered, dropped=self.dropped, errors=self.errors,
+                    lag_avg_ms=round(1000 * self.lag_total / self.delivered, 3) if self.delivered else 0.0,
+                    lag_max_ms=round(1000 * self.lag_max, 3))
+
+
+class EventBus(EventHandler):
+    """
+    Fans every published event out to the registered sinks.
+
+    Each sink has its own bounded queue and worker thread, publishing only enqueues, so a slow sink (Drive sync,
+    Mongo) never delays the trading thread. When a sink's queue is full the overflow policy applies: 'block' waits
+    for room, 'drop_new' discards the event, 'drop_oldest' discards the oldest queued one. Per sink the queue depth,
+    drops and the lag between publish and delivery are tracked.
+    """
+
+    def __init__(self):
+        self.__sinks = {}
+        self.__closed = False
+
+    def register(self, name: str, handler: EventHandler, maxsize: int = 10000, overflow: str = BLOCK):
+        if overflow not in (BLOCK, DROP_NEW, DROP_OLDEST):
+            raise ValueError(f'unknown overflow policy: {overflow}')
+        sink = _Sink(name, handler, maxsize, overflow)
+        sink.thread = threading.Thread(target=self.__run, args=(sink,), name=f'event-sink-{name}', daemon=True)
+        self.__sinks[name] = sink
+        sink.thread.start()
+        logger.info(f'event sink {name} registered, queue size {maxsize}, overflow {overflow}')
+
+    def handle_event(self, event: dict):
+        self.publish(event)
+
+    def publish(self, event: dict):
+        if self.__closed:
+            logger.warning(f'event bus closed, event dropped: {event}')
+            return
+        for sink in self.__sinks.values():
+            ## each sink gets its own copy, sinks may enrich the event
+            self.__offer(sink, dict(event))
+
+    @staticmethod
+    def __offer(sink: _Sink, event):
+        if sink.overflow == BLOCK:
+            sink.q.put(event)
+            return
+        while True:
+            try:
+                sink.q.put_nowait(event)
+                return
+            except Full:
+                if sink.overflow == DROP_NEW:
+                    sink.dropped += 1
+                    logger.error(f'event sink {sink.name} full, event dropped ({sink.dropped} so far): {event}')
+                    return
+            try:
+                _, dropped = sink.q.get_nowait()
+                sink.dropped += 1
+                logger.error(f'event sink {sink.name} full, oldest event dropped ({sink.dropped} so far): {dropped}')
+            except Empty:
+                pass
+
+    @staticmethod
+    def __run(sink: _Sink):
+        while True:
+            enqueued_at, event = sink.q.get()
+            if event is _STOP:
+                break
+            lag = time.time() - enqueued_at
+            sink.lag_total += lag
+            sink.lag_max = max(sink.lag_max, lag)
+            timeit.record(f'bus_lag.{sink.name}', lag)
+            try:
+                sink.handler.handle_event(event)
+                sink.delivered += 1
+            except Exception:
+                sink.errors += 1
+                logger.exception(f'event sink {sink.name} failed to handle event {event}')
+
+    def stats(self):
+        return {name: sink.stats() for name, sink in self.__sinks.items()}
+
+    def close(self, timeout: float = None):
+        """
+        Deliver what is queued, stop the workers and close the sinks.
+        """
+        self.__closed = True
+        for sink in self.__sinks.values():
+            sink.q.put(_STOP)
+        for sink in self.__sinks.values():
+            sink.thread.join(timeout)
+            if sink.thread.is_alive():
+                logger.warning(f'event sink {sink.name} did not drain in time, {sink.q.qsize()} events left')
+            try:
+                sink.handler.close()
+            except Exception:
+                logger.exception(f'failed to close event sink {sink.name}')
+        for sink in self.__sinks.values():
+            if sink.dropped:
+                logger.error(f'event sink {sink.name} dropped {sink.dropped} events')
+        logger.info(f'event bus stats: {self.stats()}')
@@ -24,7 +24,8 @@ import dateutil.parser
 
 import logging
 
-from ttb.util import timeutil
+from ttb.util import timeit, timeutil, trace
+from ttb.util.trace import TraceContext
 
 
 class GmailReader:
@@ -101,6 +102,7 @@ class GmailReader:
             return False
 
     def __process_mails(self, payloads):
+        picked_up = time.time()
         for payload in payloads:
             if self.persister:
                 self.persister.insert_event(payload)
@@ -108,8 +110,10 @@ class GmailReader:
             ts = payload["ts"]
             if self.valid_alert(payload):
                 events = parse_event(subject)
+                alert_time = dateutil.parser.parse(ts).timestamp()
                 for event in events:
-                    self.event_q.put((event[0], event[1], event[2], event[3], ts))
+                    ctx = TraceContext(ts).mark(trace.ALERT, alert_time).mark(trace.PICKUP, picked_up)
+                    self.event_q.put((event[0], event[1], event[2], event[3], ts, ctx.mark(trace.ENQUEUE)))
 
     def valid_alert(self, content):
         sender = content["sender"]
@@ -118,6 +122,7 @@ class GmailReader:
         dt = datetime.datetime.fromtimestamp(dateutil.parser.parse(ts).timestamp())
         return sender == self.alert_sender and "Alert" in subject and dt.timestamp() > self.trade_start_time.timestamp()
 
+    @timeit.stage('ingest')
     def get_mails(self):
         payloads = []
         try:
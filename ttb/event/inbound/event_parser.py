@@ -2,8 +2,11 @@ import re
 
 import logging
 
+from ttb.util import timeit
+
 logger = logging.getLogger(__name__)
 
+@timeit.stage('parse')
 def parse_event(event):
     ## Alert: New symbol: CROX was added to #B4-Scan#[BUY]
     ## Alert: New symbols: BILI, DDOG, IQ, LVS, NTES, ZM were added to #B4-Scan#[SELL]
@@ -0,0 +1,74 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class FileTailer:
+    """
+    Incrementally reads lines appended to a file.
+
+    Keeps the byte offset of the last complete line read, so every call only reads what was appended since.
+    A trailing line without a newline is buffered until it is completed. If the file is replaced (inode change,
+    or different leading bytes for file systems that reuse inodes) or truncated (size below our offset) reading
+    restarts from the beginning.
+    """
+    HEAD_BYTES = 64
+
+    def __init__(self, file_path: str, encoding: str = 'utf-8'):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.offset = 0
+        self.inode = None
+        self.mtime = None
+        self.__head = b''
+        self.__partial = b''
+
+    def reset(self):
+        self.offset = 0
+        self.inode = None
+        self.__head = b''
+        self.__partial = b''
+
+    def read_lines(self):
+        """
+        :return: list of new complete lines (without line terminators), empty if nothing new
+        """
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            return []
+
+        if self.inode is not None and st.st_ino != self.inode:
+            logger.info(f'{self.file_path} was replaced (inode {self.inode} -> {st.st_ino}), reading from start')
+            self.reset()
+        elif st.st_size < self.offset:
+            logger.info(f'{self.file_path} was truncated ({st.st_size} < {self.offset}), reading from start')
+            self.reset()
+        self.inode = st.st_ino
+        self.mtime = st.st_mtime
+
+        if st.st_size == self.offset:
+            return []
+
+        with open(self.file_path, 'rb') as f:
+            if self.__head:
+                head = f.read(len(self.__head))
+                if head != self.__head:
+                    logger.info(f'{self.file_path} was rewritten, reading from start')
+                    self.reset()
+                    self.inode = st.st_ino
+            f.seek(self.offset)
+            chunk = f.read()
+            self.offset += len(chunk)
+            if len(self.__head) < self.HEAD_BYTES:
+                f.seek(0)
+                self.__head = f.read(min(self.offset, self.HEAD_BYTES))
+
+        data = self.__partial + chunk
+        complete, sep, self.__partial = data.rpartition(b'\n')
+        if not sep:
+            # no line terminator yet, keep everything buffered
+            self.__partial = data
+            return []
+        return [line.decode(self.encoding).rstrip('\r') for line in complete.split(b'\n') if line.strip()]
@@ -0,0 +1,102 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HDR = struct.Struct('iIII')
+
+
+class FileWatcher:
+    """
+    Waits for changes of a single file using inotify (Linux only).
+
+    The parent directory is watched rather than the file itself, so the watch survives the file being
+    created later in the day or replaced by a sync client. Use `available()` to check whether inotify could
+    be set up; callers are expected to fall back to polling when it is not.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.dir_name = os.path.dirname(os.path.abspath(file_path))
+        self.file_name = os.path.basename(file_path).encode()
+        self.__libc = None
+        self.__fd = -1
+        self.__wd = -1
+        if sys.platform.startswith('linux'):
+            try:
+                self.__libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                self.__fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            except (OSError, AttributeError):
+                logger.exception('inotify not supported')
+            if self.__fd < 0:
+                self.__libc = None
+
+    def available(self):
+        return self.__libc is not None
+
+    def __add_watch(self):
+        if self.__wd >= 0:
+            return True
+        if not os.path.isdir(self.dir_name):
+            return False
+        wd = self.__libc.inotify_add_watch(self.__fd, self.dir_name.encode(),
+                                           IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            logger.error(f'inotify_add_watch failed for {self.dir_name}, errno = {ctypes.get_errno()}')
+            return False
+        logger.info(f'watching {self.dir_name} for changes of {self.file_name.decode()}')
+        self.__wd = wd
+        return True
+
+    def wait(self, timeout: float):
+        """
+        Block until the watched file changes or `timeout` seconds elapse.
+
+        :return: True if the file changed
+        """
+        if not self.available() or not self.__add_watch():
+            # directory does not exist yet, the caller will poll again after the timeout
+            select.select([], [], [], max(timeout, 0))
+            return False
+        readable, _, _ = select.select([self.__fd], [], [], max(timeout, 0))
+        if not readable:
+            return False
+        return self.__drain()
+
+    def __drain(self):
+        changed = False
+        while True:
+            try:
+                buf = os.read(self.__fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not buf:
+                break
+            i = 0
+            while i + _EVENT_HDR.size <= len(buf):
+                wd, mask, cookie, name_len = _EVENT_HDR.unpack_from(buf, i)
+                i += _EVENT_HDR.size
+                name = buf[i:i + name_len].rstrip(b'\0')
+                i += name_len
+                if name == self.file_name:
+                    changed = True
+        return changed
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+            self.__wd = -1
+            self.__libc = None
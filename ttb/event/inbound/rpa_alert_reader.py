@@ -10,7 +10,10 @@ import schedule
 
 from ttb.cfg.config import Config
 from ttb.db.db_persist import DBPersister
-from ttb.util import timeutil
+from ttb.event.inbound.file_tailer import FileTailer
+from ttb.event.inbound.file_watcher import FileWatcher
+from ttb.util import timeit, timeutil, trace
+from ttb.util.trace import TraceContext
 
 logger = logging.getLogger(__name__)
 
@@ -24,15 +27,31 @@ class AlertReader:
         self.persister = persister
         self.alert_pull_interval_seconds = self.conf.alert_pull_interval_seconds
         self.cut_off_time_str = self.conf.trade_end_time
-        self.cut_off_time = timeutil.parse_time(self.conf.trade_end_time)
-        self.trade_start_time = timeutil.parse_time(self.conf.trade_start_time)
-        self.buy_start_time = timeutil.parse_time(self.conf.buy_start_time)
-        self.buy_end_time = timeutil.parse_time(self.conf.buy_end_time)
+        cob_date = self.conf.date_today
+        self.cut_off_time = timeutil.parse_time(self.conf.trade_end_time, cob_date)
+        self.trade_start_time = timeutil.parse_time(self.conf.trade_start_time, cob_date)
+        self.buy_start_time = timeutil.parse_time(self.conf.buy_start_time, cob_date)
+        self.buy_end_time = timeutil.parse_time(self.conf.buy_end_time, cob_date)
 
         self.alert_last_ts = 0
+        self.__tailer = FileTailer(self.alert_file_path)
+        ## file write -> enqueue latency (seconds), of the lines read on a file change notification only
+        self.ingest_count = 0
+        self.ingest_latency_total = 0.0
+        self.ingest_latency_max = 0.0
 
     def start(self):
         logger.info("getting alert ...")
+        watcher = FileWatcher(self.alert_file_path) if self.conf.alert_watch_mode == 'inotify' else None
+        if watcher and watcher.available():
+            self.__watch(watcher)
+        else:
+            if watcher:
+                logger.warning('file change notification not available, falling back to polling')
+            self.__poll()
+        self.log_ingest_latency()
+
+    def __poll(self):
         schedule.every(self.alert_pull_interval_seconds).seconds.until(self.cut_off_time_str).do(self.get_alert)
         while datetime.datetime.now().timestamp() < self.cut_off_time.timestamp():
             n = schedule.idle_seconds()
@@ -41,38 +60,74 @@ class AlertReader:
                 time.sleep(n)
             schedule.run_pending()
 
-    def get_alert(self):
-        # Reading from file
-        logger.info(f"getting alert from {self.alert_file_path}")
-        if not path.exists(self.alert_file_path):
-            logger.info(f"File {self.alert_file_path} not exist ... ")
-        else:
-            alert_file = open(self.alert_file_path, "r")
-            lines = alert_file.readlines()
-            logger.info(f'Total records in file: {len(lines)}')
-            i=1
-            new_alert_c = 0
-            for line in lines:
-                #logger.info(f'processing line {i}')
+    def __watch(self, watcher: FileWatcher):
+        # still read every alert_pull_interval_seconds in case a sync client writes without notifying
+        try:
+            self.get_alert()
+            while True:
+                remaining = self.cut_off_time.timestamp() - datetime.datetime.now().timestamp()
+                if remaining <= 0:
+                    break
+                changed = watcher.wait(min(remaining, self.alert_pull_interval_seconds))
+                self.get_alert(notified=changed)
+        finally:
+            watcher.close()
+
+    @timeit.stage('ingest')
+    def get_alert(self, notified: bool = False):
+        """
+        :param notified: woken up by a change of the alert file, the lines read were just written (the file mtime
+                         is their write time); False for the initial read of the backlog and timed polls
+        """
+        # Only lines appended since the last poll are read and parsed
+        lines = self.__tailer.read_lines()
+        picked_up = time.time()
+        if not lines:
+            if not path.exists(self.alert_file_path):
+                logger.info(f"File {self.alert_file_path} not exist ... ")
+            return
+        logger.info(f'New records in file: {len(lines)}, offset: {self.__tailer.offset}')
+        new_alert_c = 0
+        for line in lines:
+            try:
                 alert = json.loads(line)
-                ts = alert['ts']
-                dt = dateutil.parser.parse(ts)
-                if self.alert_last_ts == 0 or dt.timestamp() > self.alert_last_ts:
-                    action = alert['action']
-                    if self.good_time_to_action(action, dt):
-                        logger.info(f'==> new alert: {alert}')
-                        symbols = alert['symbols']
-                        version = alert['version']
-                        ts = alert['ts']
-                        self.event_q.put((symbols, action, version, ts))
-                        self.alert_last_ts = max(dt.timestamp(), self.alert_last_ts)
-                    else:
-                        logger.info(f'alert out of time scope. ignored. alert = {alert} ')
-                    new_alert_c += 1
+            except ValueError:
+                logger.warning(f'invalid alert line ignored: {line}')
+                continue
+            ts = alert['ts']
+            dt = dateutil.parser.parse(ts)
+            if self.alert_last_ts == 0 or dt.timestamp() > self.alert_last_ts:
+                action = alert['action']
+                if self.good_time_to_action(action, dt):
+                    logger.info(f'==> new alert: {alert}')
+                    symbols = alert['symbols']
+                    version = alert['version']
+                    ctx = TraceContext(ts).mark(trace.ALERT, dt.timestamp())
+                    if notified:
+                        ctx.mark(trace.FILE_WRITE, self.__tailer.mtime)
+                    ctx.mark(trace.PICKUP, picked_up).mark(trace.ENQUEUE)
+                    self.event_q.put((symbols, action, version, ts, ctx))
+                    if notified:
+                        self.__record_ingest_latency(time.time() - self.__tailer.mtime)
+                    self.alert_last_ts = max(dt.timestamp(), self.alert_last_ts)
+                else:
+                    logger.info(f'alert out of time scope. ignored. alert = {alert} ')
+                new_alert_c += 1
+        logger.info(f'Total new alerts: {new_alert_c}')
+
+    def __record_ingest_latency(self, latency: float):
+        latency = max(latency, 0.0)
+        self.ingest_count += 1
+        self.ingest_latency_total += latency
+        self.ingest_latency_max = max(self.ingest_latency_max, latency)
+        timeit.record('ingest_latency', latency)
+        logger.info(f'alert ingest latency: {latency * 1000:.1f} ms')
 
-                i+=1
-            alert_file.close()
-            logger.info(f'Total new alerts: {new_alert_c}')
+    def log_ingest_latency(self):
+        if self.ingest_count:
+            logger.info(f'alert ingest latency: count = {self.ingest_count}, '
+                        f'avg = {1000 * self.ingest_latency_total / self.ingest_count:.1f} ms, '
+                        f'max = {1000 * self.ingest_latency_max:.1f} ms')
 
     def good_time_to_action(self, action, dt: datetime):
         return self.within_trading_hours(dt) and (action != "BUY" or self.good_time_to_buy(dt))
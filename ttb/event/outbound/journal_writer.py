@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import threading
+import time
+from queue import Queue, Empty
+
+from ttb.util import timeit
+
+logger = logging.getLogger(__name__)
+
+FSYNC_NEVER = 'never'
+FSYNC_BATCH = 'batch'
+FSYNC_CLOSE = 'close'
+
+
+class JournalWriter:
+    """
+    Writes JSON records to journal files, keeping one open handle per file.
+
+    In async mode callers only enqueue, a writer thread serializes and writes the records in batches and flushes
+    when `flush_bytes` are pending or `flush_interval_seconds` passed. Otherwise records are written and flushed
+    in the caller's thread. fsync policy: 'never' (left to the OS), 'batch' (after every flush) or 'close'.
+    """
+
+    def __init__(self, async_mode: bool = True, flush_bytes: int = 64 * 1024, flush_interval_seconds: float = 1.0,
+                 fsync: str = FSYNC_NEVER, batch_size: int = 512):
+        self.async_mode = async_mode
+        self.flush_bytes = flush_bytes
+        self.flush_interval_seconds = flush_interval_seconds
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.__files = {}
+        self.__pending_bytes = 0
+        self.__last_flush = time.monotonic()
+        self.__q = Queue()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        if async_mode:
+            self.__thread = threading.Thread(target=self.__run, name='journal-writer', daemon=True)
+            self.__thread.start()
+
+    def append(self, path: str, record):
+        self.__submit(('a', path, record))
+
+    def replace(self, path: str, record):
+        """
+        Truncate the file and write `record` as its only line.
+        """
+        self.__submit(('w', path, record))
+
+    def replace_atomic(self, path: str, record):
+        """
+        Write `record` to a temp file and rename it over `path`, readers never see a partial file.
+        """
+        self.__submit(('atomic', path, record))
+
+    def __submit(self, op):
+        if self.async_mode:
+            self.__q.put(op)
+        else:
+            with self.__lock:
+                self.__apply(op)
+                self.__flush()
+
+    def drain(self, timeout: float = None):
+        """
+        Block until everything submitted so far is written and flushed.
+        """
+        if self.async_mode:
+            done = threading.Event()
+            self.__q.put(('drain', None, done))
+            done.wait(timeout)
+
+    def close(self):
+        if self.async_mode and self.__thread:
+            self.__q.put(('stop', None, None))
+            self.__thread.join()
+            self.__thread = None
+        with self.__lock:
+            self.__flush(closing=True)
+            for fw in self.__files.values():
+                fw.close()
+            self.__files.clear()
+
+    def __run(self):
+        while True:
+            try:
+                op = self.__q.get(timeout=self.flush_interval_seconds)
+            except Empty:
+                op = None
+            batch = [op] if op else []
+            while op and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__q.get_nowait())
+                except Empty:
+                    break
+            stop = False
+            with self.__lock:
+                for op in batch:
+                    if op[0] == 'drain':
+                        self.__flush()
+                        op[2].set()
+                    elif op[0] == 'stop':
+                        stop = True
+                    else:
+                        try:
+                            self.__apply(op)
+                        except Exception:
+                            logger.exception(f'failed to write journal {op[1]}')
+                if self.__pending_bytes >= self.flush_bytes or \
+                        time.monotonic() - self.__last_flush >= self.flush_interval_seconds:
+                    self.__flush()
+            if stop:
+                break
+
+    @timeit.stage('journal')
+    def __apply(self, op):
+        mode, path, record = op
+        line = f'{json.dumps(record)}\n'
+        logger.info(f'publishing event: {line.rstrip()}')
+        if mode == 'atomic':
+            self.__close_file(path)
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as fw:
+                fw.write(line)
+                fw.flush()
+                if self.fsync != FSYNC_NEVER:
+                    os.fsync(fw.fileno())
+            os.replace(tmp, path)
+            return
+        if mode == 'w':
+            self.__close_file(path)
+        fw = self.__files.get(path)
+        if fw is None:
+            fw = open(path, mode=mode)
+            self.__files[path] = fw
+        fw.write(line)
+        self.__pending_bytes += len(line)
+
+    def __close_file(self, path):
+        fw = self.__files.pop(path, None)
+        if fw:
+            fw.close()
+
+    def __flush(self, closing: bool = False):
+        sync = self.fsync == FSYNC_BATCH or (closing and self.fsync != FSYNC_NEVER)
+        if self.__pending_bytes or closing:
+            for fw in self.__files.values():
+                fw.flush()
+                if sync:
+                    os.fsync(fw.fileno())
+        self.__pending_bytes = 0
+        self.__last_flush = time.monotonic()
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import time
+
+from ttb.data.position_book import PositionBook
+from ttb.event.outbound.journal_writer import JournalWriter
+
+logger = logging.getLogger(__name__)
+
+OP_ADD = 'add'
+OP_REMOVE = 'remove'
+
+
+def read_positions(snapshot_file: str, delta_file: str):
+    """
+    Rebuild the open positions from the latest snapshot and the deltas written after it.
+
+    :return: (last seq, {version: {ticker: position dict}})
+    """
+    seq = 0
+    positions = {}
+    if os.path.exists(snapshot_file):
+        with open(snapshot_file, 'r') as f:
+            snapshot = json.loads(f.readline() or '{}')
+        seq = snapshot.get('seq', 0)
+        positions = snapshot.get('positions') or {}
+    if os.path.exists(delta_file):
+        with open(delta_file, 'r') as f:
+            for line in f:
+                try:
+                    delta = json.loads(line)
+                except json.JSONDecodeError:
+                    ## a crash can leave the last line half written
+                    logger.warning(f'skipped invalid delta in {delta_file}: {line.rstrip()}')
+                    continue
+                if delta.get('seq', 0) <= seq:
+                    continue
+                seq = delta['seq']
+                apply_delta(positions, delta)
+    return seq, positions
+
+
+def apply_delta(positions: dict, delta: dict):
+    op = delta.get('op')
+    if op == OP_ADD:
+        positions.setdefault(delta['version'], {})[delta['ticker']] = delta['position']
+    elif op == OP_REMOVE:
+        tickers = positions.get(delta['version'], {})
+        tickers.pop(delta['ticker'], None)
+        if not tickers:
+            positions.pop(delta['version'], None)
+
+
+def load_book(snapshot_file: str, delta_file: str):
+    """
+    :return: PositionBook as of the last delta written
+    """
+    book = PositionBook()
+    book.load(read_positions(snapshot_file, delta_file)[1])
+    return book
+
+
+class PositionsJournal:
+    """
+    Open positions journal kept as a snapshot file plus a delta file.
+
+    Every add/remove appends one small delta with a sequence #. After `snapshot_every` deltas or
+    `snapshot_interval_seconds` the whole book is written to the snapshot file by atomic rename, then the delta
+    file is truncated. A crash between the two steps is harmless: deltas not newer than the snapshot are skipped
+    on load.
+    """
+
+    def __init__(self, writer: JournalWriter, snapshot_file: str, delta_file: str, snapshot_every: int = 100,
+                 snapshot_interval_seconds: float = 60):
+        self.__writer = writer
+        self.snapshot_file = snapshot_file
+        self.delta_file = delta_file
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        ## pick up where a restarted bot left off
+        self.seq, self.__positions = read_positions(snapshot_file, delta_file)
+        self.__since_snapshot = 0
+        self.__last_snapshot = time.monotonic()
+
+    def add(self, version: str, ticker: str, position: dict):
+        self.apply(dict(op=OP_ADD, version=version, ticker=ticker, position=position))
+
+    def remove(self, version: str, ticker: str):
+        self.apply(dict(op=OP_REMOVE, version=version, ticker=ticker))
+
+    def apply(self, delta: dict):
+        self.seq += 1
+        delta = dict(delta, seq=self.seq)
+        apply_delta(self.__positions, delta)
+        self.__writer.append(self.delta_file, delta)
+        self.__since_snapshot += 1
+        if self.__since_snapshot >= self.snapshot_every or \
+                time.monotonic() - self.__last_snapshot >= self.snapshot_interval_seconds:
+            self.snapshot()
+
+    def snapshot(self):
+        ## the writer serializes later on its own thread, hand over a copy of the book
+        positions = {version: dict(tickers) for version, tickers in self.__positions.items()}
+        self.__writer.replace_atomic(self.snapshot_file, dict(event_type='POSITIONS', seq=self.seq,
+                                                              positions=positions))
+        self.__writer.replace(self.delta_file, dict(op='snapshot', seq=self.seq))
+        self.__since_snapshot = 0
+        self.__last_snapshot = time.monotonic()
+
+    def positions(self):
+        return {version: dict(tickers) for version, tickers in self.__positions.items()}
@@ -0,0 +1,31 @@
+import logging
+
+from ttb.data.event_type import EventType
+from ttb.event import EventHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ToDBEventHandler(EventHandler):
+    """
+    Persists trades, PnLs and EOD prices through a DBPersister, enriched with cob date and account.
+    """
+
+    def __init__(self, persister, cob_date: str, account: str):
+        self.__persister = persister
+        self.__cob_date = cob_date
+        self.__account = account
+
+    def handle_event(self, event: dict):
+        eventType = event['event_type']
+        if eventType == EventType.TRADE:
+            self.__persister.insert_execution(self.__enrich(event))
+        elif eventType == EventType.PNL:
+            self.__persister.insert_pnl(self.__enrich(event))
+        elif eventType == EventType.EOD_PRICE:
+            self.__persister.insert_eod_prices(self.__enrich(event))
+
+    def __enrich(self, data: dict):
+        data['cob_date'] = self.__cob_date
+        data['account'] = self.__account
+        return data
@@ -1,10 +1,12 @@
-import datetime
-import json
 import os
+import time
 
 from ttb.cfg.config import Config
 from ttb.data.event_type import EventType
 from ttb.event import EventHandler
+from ttb.event.outbound.journal_writer import JournalWriter
+from ttb.event.outbound.positions_journal import PositionsJournal
+from ttb.util import trace
 import logging
 
 logger = logging.getLogger("ToFileEventHandler")
@@ -12,27 +14,66 @@ logger = logging.getLogger("ToFileEventHandler")
 d_fmt = "%Y%m%d"
 
 
+def journal_file(conf: Config, name: str):
+    """
+    :return: path of the journal file `name` of the cob date
+    """
+    return f'{conf.journal_dir}{os.sep}{conf.date_today}{os.sep}{name}_{conf.date_today}.json'
+
+
+def positions_files(conf: Config):
+    """
+    :return: (snapshot, delta) files of the open positions journal, see PositionsJournal / load_book
+    """
+    return journal_file(conf, conf.open_positions_journal), journal_file(conf, conf.open_positions_delta_journal)
+
+
 class ToFileEventHandler(EventHandler):
-    def __init__(self, conf: Config):
+    def __init__(self, conf: Config, writer: JournalWriter = None):
+        self.__conf = conf
         self.__trade_file = conf.trades_journal
         self.__event_file = conf.events_journal
         self.__pnl_file = conf.pnl_journal
         self.__positions_file = conf.open_positions_journal
         self.__eod_price_file = conf.eod_prices_file
+        self.__trace_file = conf.trace_journal
         self.__today = conf.date_today
         self.__target_dir = f'{conf.journal_dir}{os.sep}{self.__today}'
         if not os.path.exists(self.__target_dir):
             os.makedirs(self.__target_dir)
+        self.__writer = writer or JournalWriter(async_mode=conf.journal_async,
+                                                flush_bytes=conf.journal_flush_bytes,
+                                                flush_interval_seconds=conf.journal_flush_interval_seconds,
+                                                fsync=conf.journal_fsync)
+        snapshot_file, delta_file = positions_files(conf)
+        self.__positions = PositionsJournal(self.__writer, snapshot_file, delta_file,
+                                            snapshot_every=conf.positions_snapshot_every,
+                                            snapshot_interval_seconds=conf.positions_snapshot_interval_seconds)
 
     def handle_event(self, event: dict):
         eventType = event['event_type']
-        event['event_type'] = eventType.name
-        event_destination = self.__get_event_destination(eventType)
-        data_json = json.dumps(event)
-        logger.info(f'publishing event: {data_json}')
-        m = 'w' if eventType == EventType.POSITIONS else 'a'
-        with open(event_destination, mode=m) as fw:
-            fw.write(f'{data_json}\n')
+        if eventType == EventType.POSITIONS:
+            self.__handle_positions(event)
+            return
+        if eventType == EventType.TRACE:
+            ## the file sink handles events in order, the execution of this trace is in the writer by now
+            marks = dict(event['marks'], **{trace.JOURNAL: time.time()})
+            event = dict(event, marks=marks, latency_ms=trace.breakdown(marks))
+        ## copy, the caller may keep changing its dict after the writer thread picked it up
+        event = dict(event, event_type=eventType.name)
+        self.__writer.append(self.__get_event_destination(eventType), event)
+
+    def __handle_positions(self, event: dict):
+        if event.get('op') == 'add':
+            self.__positions.add(event['version'], event['ticker'], event['position'])
+        elif event.get('op') == 'remove':
+            self.__positions.remove(event['version'], event['ticker'])
+        else:
+            logger.warning(f'unknown positions event ignored: {event}')
+
+    def close(self):
+        self.__positions.snapshot()
+        self.__writer.close()
 
     def __get_event_destination(self, eventType: EventType):
         chosen = None
@@ -46,4 +87,9 @@ class ToFileEventHandler(EventHandler):
             chosen = self.__positions_file
         elif eventType == EventType.EOD_PRICE:
             chosen = self.__eod_price_file
-        return f"{self.__target_dir}{os.sep}{chosen}_{self.__today}.json" if chosen else None
+        elif eventType == EventType.TRACE:
+            chosen = self.__trace_file
+        return self.__journal_file(chosen) if chosen else None
+
+    def __journal_file(self, name):
+        return journal_file(self.__conf, name)
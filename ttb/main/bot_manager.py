@@ -1,44 +1,77 @@
-import time
-
 from ttb.cfg.config import Config
 from ttb.control.trading_control import TradeControl
 from ttb.data.event_type import EventType
 from ttb.data.pnl_type import PnlType
+from ttb.data.position_book import Position
+from ttb.event.dispatcher import EventDispatcher, TimedQueue
+from ttb.event.event_bus import EventBus
 from ttb.event.inbound.email_reader import GmailReader
-from ttb.event.outbound.to_file_event import ToFileEventHandler
+from ttb.event.outbound.positions_journal import load_book
+from ttb.event.outbound.to_file_event import ToFileEventHandler, positions_files
+from ttb.mkt_analyzer.price_analyzer import PriceAnalyzer
+from ttb.mktdata.hist.hist_store import HistStore
+from ttb.mktdata.market_data import create_market_data
+from ttb.report.pnl_ledger import PnlLedger
 from ttb.report.pnl_report import PnlReporter
-from ttb.trading.td_client import TosTrader
+from ttb.trading.quote_cache import QuoteCache
+from ttb.trading.request_scheduler import Priority
+from ttb.trading.td_client import create_trader
 from queue import Queue, Empty
 import datetime
+import logging
+import os
 import threading
+import time
+from functools import partial
 
-from ttb.util import timeutil
+from ttb.util import timeit, timeutil, trace
 from ttb.util.app_logging import getLogger
+from ttb.util.trace import TraceContext, trace_of
 
 logger = getLogger('ttb.main.bot_manager')
+## the e-mail bot has always journaled a position's strategy as 'scanner'
+STRATEGY_KEY = 'scanner'
 
 
 class BotManager:
 
     def __init__(self, config=None):
         self.__conf = config or Config()
-        self.__event_q = Queue()
+        self.__event_q = TimedQueue()
         self.__ticker_q = Queue()
         self.__hist_price_q = Queue()
         self.__default_qty = self.__conf.trade_default_qty
         self.__per_trade_amt_limit = self.__conf.per_trade_amt_limit
         self.__daily_trade_amt_limit = self.__conf.daily_trade_amt_limit
-        self.__total_amt = 0
+        self.__enforce_trade_limits = self.__conf.enforce_trade_limits
+        self.__quote_batch_size = self.__conf.quote_batch_size
         self.__cut_off_time = timeutil.parse_time(self.__conf.trade_end_time)
-        self.__long_positions = {}
+        ## the journal keeps the day's open positions, a restarted bot carries on with the same book
+        self.__long_positions = load_book(*positions_files(self.__conf))
+        self.__total_amt = self.__long_positions.total_cost
         self.__executions = {}
-        self.__pnl = {}
+        self.__pnl = PnlLedger()
+        ## per execution alert -> execution latency breakdown (ms), see ttb.util.trace
+        self.__latency = []
         self.__persister = None  ##DBPersister()
         self.__mail_reader = GmailReader(self.__conf, self.__event_q, self.__persister)
-        self.__trader = TosTrader(self.__conf)
-        self.__event_handler = ToFileEventHandler(self.__conf)
+        self.__trader = create_trader(self.__conf)
+        self.__quotes = QuoteCache(self.__trader.get_quotes, ttl_seconds=self.__conf.quote_cache_ttl_seconds,
+                                   max_size=self.__conf.quote_cache_size)
+        self.__mktdata = create_market_data(self.__conf)
+        ## price history store, opened by start() or the first get_price_history
+        self.__hist = None
+        self.__price_analyzer = PriceAnalyzer(partial(self.__quotes.get_quotes, priority=Priority.INDICATORS),
+                                              poll_seconds=self.__conf.price_poll_freq)
+        for pos in self.__long_positions:
+            self.__price_analyzer.track(pos.version, pos.ticker, pos.price)
+        self.__event_handler = EventBus()
+        self.__event_handler.register('file', ToFileEventHandler(self.__conf),
+                                      maxsize=self.__conf.event_sink_queue_size,
+                                      overflow=self.__conf.event_sink_overflow)
         self.__reporter = PnlReporter(config=self.__conf)
         self.trade_control = TradeControl(self.__conf)
+        timeit.enable(self.__conf.instrumentation_enabled)
 
     def start(self):
 
@@ -47,32 +80,87 @@ class BotManager:
 
         thread = threading.Thread(target=self.__mail_reader.start)
         thread.start()
-        ##threading.Thread(target=self.__priceAnalyzer.start).start()
+        held = sorted(self.__long_positions.tickers())
+        if self.__mktdata:
+            ## the held tickers stream from the start, the alerts only add the tickers they quote
+            self.__mktdata.subscribe(held)
+            self.__mktdata.start()
+        threading.Thread(target=self.__price_analyzer.start, args=(self.__cut_off_time,), daemon=True).start()
+        self.__start_hist_sync(held)
         self.work()
 
+    def __start_hist_sync(self, tickers):
+        """
+        Map the stored history of the held tickers and keep the history of held and bought tickers current from a
+        daemon thread, only the bars missing on disk are downloaded.
+        """
+        self.__hist = HistStore(self.__conf.hist_dir)
+        for ticker in tickers:
+            self.__hist.warm_up([ticker])
+            self.__ticker_q.put(ticker)
+        threading.Thread(target=self.__hist.sync_worker, name='hist-sync', daemon=True,
+                         args=(self.__ticker_q, self.__trader, self.__conf.hist_sync_interval_seconds)).start()
+
+    def get_price_history(self, ticker: str, start_ts: int = None, end_ts: int = None):
+        """
+        :return: dict of column -> array of the ticker's bars, from the hist store; the bars missing on disk are
+                 fetched first, at most every hist_sync_interval_seconds
+        """
+        if self.__hist is None:
+            self.__hist = HistStore(self.__conf.hist_dir)
+        return self.__hist.price_history(ticker, self.__trader, start_ts, end_ts,
+                                         self.__conf.hist_sync_interval_seconds)
+
     def work(self):
         print('Start working ...')
         logger.info('Start working ...')
-        while datetime.datetime.now().timestamp() < self.__cut_off_time.timestamp():
-            while not self.__event_q.empty():
-                event = self.__event_q.get()
-                self.__on_event(event)
-            time.sleep(10)
+        dump_stop = self.__start_latency_dump()
+        EventDispatcher(self.__event_q, self.__on_event, self.__cut_off_time).run()
         self.eod_process()
+        if dump_stop:
+            dump_stop.set()
+        self.dump_latency()
+        logger.info(f'quote cache stats: {self.__quotes.stats()}')
+        logger.info(f'broker request stats: {self.__trader.request_stats()}')
+        if self.__mktdata:
+            logger.info(f'market data stats: {self.__mktdata.stats()}')
+            self.__mktdata.stop()
         self.gen_reports()
+        self.__ticker_q.put(None)
+        self.__event_handler.close()
+
+    def __start_latency_dump(self):
+        if timeit.enabled() and self.__conf.instrumentation_dump_seconds > 0:
+            return timeit.start_periodic_dump(self.__conf.instrumentation_dump_seconds)
+        return None
+
+    def dump_latency(self):
+        """
+        Log the per stage latency histograms and write them to the latency journal of the day.
+        """
+        if not timeit.enabled():
+            return None
+        date = self.__conf.date_today
+        return timeit.dump(path=f'{self.__conf.journal_dir}{os.sep}{date}{os.sep}'
+                                f'{self.__conf.latency_journal}_{date}.json')
 
     def __on_event(self, event):
-        (symbols, action, strategy, version, ts) = event
+        ctx = trace_of(event)
+        if ctx:
+            ctx.mark(trace.DEQUEUE)
+        (symbols, action, strategy, version, ts) = event[:5]
         self.publish_event(
             {"event_type": EventType.EMAIL_ALERT, "tickers": symbols, "action": action, "Strategy": strategy,
              "version": version, "ts": ts})
+        if self.__mktdata:
+            self.__mktdata.subscribe(symbols)
         next_move = self.next_move(action, strategy)
         source = f'#B4#[{strategy}]#{version}#'
         if next_move:
             print(f'processing event {event}')
             logger.info(f'processing event {event}')
             side = next_move
-            self.trade(symbols, side, version, source)
+            self.trade(symbols, side, version, source, ctx)
             self.show_statistics()
         else:
             logger.info(f'event ignored :{event}')
@@ -88,24 +176,33 @@ class BotManager:
             logger.info(f"Buy signal ignored!")
         return None
 
-    def trade(self, symbols, side, version, source):
+    @timeit.stage('trade')
+    def trade(self, symbols, side, version, source, ctx: TraceContext = None):
         if symbols:
+            ## quote all tickers to be traded in one go, so the last ones of a basket are not priced late
+            if side == 'BUY':
+                to_quote = [t for t in symbols if not self.__long_positions.holds(version, t)]
+            else:
+                to_quote = [t for t in symbols if self.__long_positions.holds(version, t)]
+            prices = self.get_prices(list(dict.fromkeys(to_quote))) if to_quote else {}
+            if ctx:
+                ctx.mark(trace.QUOTE)
             for ticker in symbols:
                 dt = datetime.datetime.now()
+                exec_at = time.time()
                 exec_time = dt.strftime("%Y/%m/%d-%H:%M:%S")
-                if side == 'BUY' and ticker not in self.__long_positions:
-                    price_b = self.execute_buy(ticker)
+                if side == 'BUY' and not self.__long_positions.holds(version, ticker):
+                    price_b = self.execute_buy(ticker, prices.get(ticker))
                     if price_b:
                         buy_qty = self.calc_qty(price_b)
                         if buy_qty:
-                            self.__long_positions.setdefault(version, dict())[ticker] = {'price': float(price_b),
-                                                                                         'qty': buy_qty,
-                                                                                         'exec_time': exec_time,
-                                                                                         'scanner': source}  # (float(price_b), exec_time)
-                            # self.__priceAnalyzer.add_price(ticker, price_b, dt.strftime('%H%M%S'))
+                            self.__long_positions.add(Position(ticker, version, source, float(price_b), buy_qty,
+                                                               exec_time))
+                            self.__price_analyzer.track(version, ticker, float(price_b))
                             execution_buy = dict(
                                 event_type=EventType.TRADE,
                                 ticker=ticker,
+                                version=version,
                                 price=price_b,
                                 qty=buy_qty,
                                 side=side,
@@ -116,26 +213,29 @@ class BotManager:
                             self.__total_amt += price_b*buy_qty
                             self.__ticker_q.put(ticker)
                             self.publish_event(execution_buy)
+                            self.publish_position(version, ticker)
+                            if ctx:
+                                self.publish_trace(ctx.fork().mark(trace.EXEC, exec_at), ticker, side, version)
                         else:
                             logger.info(f"# of shares < 1, skipped buy for : {ticker}")
                     else:
                         logger.error(f'failed to execute buy for : {ticker}')
-                elif side == 'SELL' and version in self.__long_positions and ticker in self.__long_positions[version]:
-                    price_s = self.execute_sell(ticker)
+                elif side == 'SELL' and self.__long_positions.holds(version, ticker):
+                    price_s = self.execute_sell(ticker, prices.get(ticker))
                     if price_s:
                         price_sold = float(price_s)
-                        exec_b = self.__long_positions[version].pop(ticker)
-                        if len(self.__long_positions[version]) == 0:
-                            self.__long_positions.pop(version)
-                        price_bought = exec_b['price']
-                        bought_time = exec_b['exec_time']
-                        buy_scanner = exec_b['scanner']
-                        qty = exec_b['qty']
+                        exec_b = self.__long_positions.remove(version, ticker)
+                        self.__price_analyzer.untrack(version, ticker)
+                        price_bought = exec_b.price
+                        bought_time = exec_b.exec_time
+                        buy_scanner = exec_b.strategy
+                        qty = exec_b.qty
                         pct_chg = round(100 * (price_sold - price_bought) / price_bought, ndigits=4)
                         exec_time = datetime.datetime.now().strftime("%Y/%m/%d-%H:%M:%S")
                         execution_sell = dict(
                             event_type=EventType.TRADE,
                             ticker=ticker,
+                            version=version,
                             price=price_sold,
                             qty=qty,
                             side=side,
@@ -156,10 +256,13 @@ class BotManager:
                             version=version,
                             pnl_type=PnlType.REALIZED.name
                         )
-                        self.__pnl.setdefault(ticker, list()).append(pnl)
+                        self.__pnl.append(pnl)
                         # self.__persister.insert_execution(execution_sell)
                         self.publish_event(execution_sell)
+                        self.publish_position(version, ticker)
                         self.publish_event(pnl)
+                        if ctx:
+                            self.publish_trace(ctx.fork().mark(trace.EXEC, exec_at), ticker, side, version)
                     else:
                         logger.error(f'failed to execute sell for: {ticker}')
                 else:
@@ -167,16 +270,21 @@ class BotManager:
         else:
             logger.warning('invalid event')
 
-    def execute_buy(self, ticker):
-        return self.get_price(ticker)
+    def execute_buy(self, ticker, price=None):
+        return price or self.get_price(ticker)
 
-    def execute_sell(self, ticker):
-        return self.get_price(ticker)
+    def execute_sell(self, ticker, price=None):
+        return price or self.get_price(ticker)
 
+    @timeit.stage('quote')
     def get_price(self, ticker):
         logger.info(f'getting price for {ticker}')
+        if self.__mktdata:
+            price = self.__mktdata.last_price(ticker)
+            if price:
+                return price
         try:
-            quotes = self.__trader.get_quotes([ticker])
+            quotes = self.__quotes.get_quotes([ticker])
             if quotes:
                 for t, q in quotes.items():
                     return q['lastPrice']
@@ -184,80 +292,102 @@ class BotManager:
             logger.exception(f'error getting price for {ticker}')
         return None
 
-    def get_prices(self, tickers: list):
+    @timeit.stage('quote')
+    def get_prices(self, tickers: list, priority: Priority = Priority.TRADE):
         logger.info(f'getting price for {tickers}')
-        prices = {}
-        try:
-            quotes = self.__trader.get_quotes(tickers)
-            if quotes:
-                for t, q in quotes.items():
-                    prices[t] = q['lastPrice']
-        except Exception:
-            logger.exception(f'error getting price for {tickers}')
+        prices = self.__mktdata.last_prices(tickers) if self.__mktdata else {}
+        ## every price the bot gets is a sample of the held positions' indicators, quotes with their volume
+        samples = dict(prices)
+        tickers = [t for t in tickers if t not in prices]
+        for i in range(0, len(tickers), self.__quote_batch_size):
+            batch = tickers[i:i + self.__quote_batch_size]
+            try:
+                quotes = self.__quotes.get_quotes(batch, priority=priority)
+                if quotes:
+                    for t, q in quotes.items():
+                        prices[t] = q['lastPrice']
+                    samples.update(quotes)
+            except Exception:
+                logger.exception(f'error getting price for {batch}')
+        self.__price_analyzer.update(samples)
         return prices
 
+    @timeit.stage('publish')
     def publish_event(self, event: dict):
-        e_type = event['event_type']
         self.__event_handler.handle_event(event)
-        if e_type == EventType.TRADE:
-            payload = dict(event_type=EventType.POSITIONS, positions=self.__long_positions)
-            self.__event_handler.handle_event(payload)
+
+    def publish_position(self, version, ticker):
+        """
+        Publish the change of one position (a delta), not the whole book.
+        """
+        pos = self.__long_positions.get(version, ticker)
+        self.publish_event(dict(event_type=EventType.POSITIONS, op='add' if pos else 'remove', version=version,
+                                ticker=ticker, position=pos.to_dict(STRATEGY_KEY) if pos else None))
+
+    def publish_trace(self, ctx: TraceContext, ticker, side, version):
+        """
+        Keep the latency breakdown of one execution for the report and journal its stage time stamps.
+        """
+        self.__latency.append(dict(ticker=ticker, side=side, version=version, alert_ts=ctx.alert_ts,
+                                   **trace.breakdown(ctx.marks)))
+        self.publish_event(dict(event_type=EventType.TRACE, ticker=ticker, side=side, version=version,
+                                alert_ts=ctx.alert_ts, marks=ctx.marks))
 
     def show_statistics(self):
-        logger.info(f'current positions : {self.__long_positions}')
-        logger.info('current PNLs summary ...')
-        pnl_display = ""
-        for (t, pnls) in self.__pnl.items():
-            for pnl in pnls:
-                pnl_display += str(pnl) + '\n'
-        if pnl_display:
-            logger.info(f'\n{pnl_display}')
+        ## formatting the whole book is costly, skip it when nobody reads it (replays)
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(f'current positions ({len(self.__long_positions)}, cost {self.__long_positions.total_cost:.2f}) : '
+                    f'{self.__long_positions.to_dict(STRATEGY_KEY)}')
+        logger.info(f'current PNLs summary : {self.__pnl.summary()}')
 
     def gen_reports(self):
         logger.info('generating report ...')
-        data = []
-        for (t, pnls) in self.__pnl.items():
-            data.extend(pnls)
-
-        self.__reporter.gen_report(data)
+        self.__reporter.gen_report(self.__pnl.columns(), latency=self.__latency)
 
     def eod_process(self):
         if len(self.__long_positions) > 0:
-            for (ver, positions) in self.__long_positions.items():
-                tickers = list(positions.keys())
-                eod_prices = self.get_prices(tickers)
-                for t, p in eod_prices.items():
-                    price_bought = positions[t]['price']
-                    qty = positions[t]['qty']
-                    pct_chg = round(100 * (p - price_bought) / price_bought, ndigits=4)
-                    pnl = dict(
-                        event_type=EventType.PNL,
-                        ticker=t,
-                        price_bought=price_bought,
-                        price_sold=p,
-                        price_chg_pct=pct_chg,
-                        qty=qty,
-                        time_bought=positions[t]['exec_time'],
-                        time_sold='EOD',
-                        buy_scanner=positions[t]['scanner'],
-                        sell_scanner='EOD',
-                        version=ver,
-                        pnl_type=PnlType.UN_REALIZED.name
-                    )
-                    self.__pnl.setdefault(t, list()).append(pnl)
+            eod_prices = self.get_prices(self.__long_positions.tickers(), priority=Priority.EOD)
+            for pos in self.__long_positions:
+                t = pos.ticker
+                if t not in eod_prices:
+                    continue
+                p = eod_prices[t]
+                price_bought = pos.price
+                pct_chg = round(100 * (p - price_bought) / price_bought, ndigits=4)
+                pnl = dict(
+                    event_type=EventType.PNL,
+                    ticker=t,
+                    price_bought=price_bought,
+                    price_sold=p,
+                    price_chg_pct=pct_chg,
+                    qty=pos.qty,
+                    time_bought=pos.exec_time,
+                    time_sold='EOD',
+                    buy_scanner=pos.strategy,
+                    sell_scanner='EOD',
+                    version=pos.version,
+                    pnl_type=PnlType.UN_REALIZED.name
+                )
+                self.__pnl.append(pnl)
+        ## after the EOD quotes, they are the last sample
+        self.__price_analyzer.stop()
+        logger.info(f'EOD indicators: {self.__price_analyzer.indicators()}')
 
     def add_pnl(self, pnl: dict):
-        self.__pnl.setdefault(pnl['ticker'], list()).append(pnl)
+        self.__pnl.append(pnl)
 
     def get_pnl(self):
         return self.__pnl
 
     def add_position(self, pos: dict):
-        self.__long_positions.update(pos)
+        self.__long_positions.load(pos)
 
     def calc_qty(self, price_b):
+        if not self.__enforce_trade_limits:
+            return self.__default_qty
         max_buy_amt = min(self.__per_trade_amt_limit, self.__daily_trade_amt_limit-self.__total_amt)
-        return min(self.__default_qty, max_buy_amt//price_b)
+        return max(min(self.__default_qty, int(max_buy_amt // price_b)), 0)
 
 
 if __name__ == "__main__":
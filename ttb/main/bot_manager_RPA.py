@@ -1,46 +1,94 @@
-import time
-
 from ttb.cfg.config import Config
 from ttb.control.trading_control import TradeControl
 from ttb.data.event_type import EventType
 from ttb.data.pnl_type import PnlType
+from ttb.data.position_book import Position, PositionBook
 from ttb.db.db_persist import DBPersister
+from ttb.event.dispatcher import EventDispatcher, TimedQueue
+from ttb.event.event_bus import EventBus
 from ttb.event.inbound.rpa_alert_reader import AlertReader
-from ttb.event.outbound.to_file_event import ToFileEventHandler
+from ttb.event.outbound.to_db_event import ToDBEventHandler
+from ttb.event.outbound.positions_journal import load_book
+from ttb.event.outbound.to_file_event import ToFileEventHandler, positions_files
+from ttb.mkt_analyzer.price_analyzer import PriceAnalyzer
+from ttb.mktdata.hist.hist_store import HistStore
+from ttb.mktdata.market_data import create_market_data
+from ttb.report.pnl_ledger import PnlLedger
 from ttb.report.pnl_report import PnlReporter
-from ttb.trading.td_client import TosTrader
+from ttb.trading.quote_cache import QuoteCache
+from ttb.trading.request_scheduler import Priority
+from ttb.trading.td_client import create_trader
 from queue import Queue, Empty
-import datetime
+import logging
+import os
 import threading
+import time
+from functools import partial
 
-from ttb.util import timeutil
+from ttb.util import timeit, timeutil, trace
 from ttb.util.app_logging import getLogger_rpa
+from ttb.util.clock import Clock
+from ttb.util.trace import TraceContext, trace_of
 
 logger = getLogger_rpa('ttb.main.bot_manager_rpa')
 
 class BotManager:
 
-    def __init__(self, config=None):
+    def __init__(self, config=None, trader=None, clock: Clock = None, sinks: dict = None, persister=None):
+        """
+        :param trader: broker (by default the one of the broker setting), anything with get_quotes and
+                       request_stats
+        :param clock: time source of executions, wall clock by default
+        :param sinks: event sinks by name; by default the file journal and the DB, with the given or a new
+                      DBPersister
+        """
         self.__conf = config or Config()
+        self.__clock = clock or Clock()
         self.cob_date = self.__conf.date_today
         self.default_acct = self.__conf.default_acct
-        self.__event_q = Queue()
+        self.__event_q = TimedQueue()
         self.__ticker_q = Queue()
         self.__hist_price_q = Queue()
         self.__default_qty = self.__conf.trade_default_qty
         self.__per_trade_amt_limit = self.__conf.per_trade_amt_limit
         self.__daily_trade_amt_limit = self.__conf.daily_trade_amt_limit
+        self.__enforce_trade_limits = self.__conf.enforce_trade_limits
+        self.__trade_versions = self.__conf.trade_versions
+        self.__quote_batch_size = self.__conf.quote_batch_size
         self.__total_amt = 0
-        self.trading_end_time = timeutil.parse_time(self.__conf.trade_end_time)
-        self.long_positions = {}
+        self.trading_end_time = timeutil.parse_time(self.__conf.trade_end_time, self.cob_date)
+        self.long_positions = PositionBook()
         self.__executions = {}
-        self.__pnl = {}
-        self.__persister = DBPersister()
+        self.__pnl = PnlLedger()
+        ## per execution alert -> execution latency breakdown (ms), see ttb.util.trace
+        self.__latency = []
+        if sinks is None:
+            ## the journal keeps the day's open positions, a restarted bot carries on with the same book
+            self.long_positions = load_book(*positions_files(self.__conf))
+            self.__total_amt = self.long_positions.total_cost
+            persister = persister or DBPersister(self.__conf)
+            sinks = {'file': (ToFileEventHandler(self.__conf), self.__conf.event_sink_overflow),
+                     'db': (ToDBEventHandler(persister, self.cob_date, self.default_acct),
+                            self.__conf.db_sink_overflow)}
+        self.__persister = persister
         self.__alert_reader = AlertReader(self.__conf, self.__event_q, self.__persister)
-        self.__trader = TosTrader(self.__conf)
-        self.__event_handler = ToFileEventHandler(self.__conf)
+        self.__trader = trader or create_trader(self.__conf, clock=self.__clock)
+        self.__quotes = QuoteCache(self.__trader.get_quotes, ttl_seconds=self.__conf.quote_cache_ttl_seconds,
+                                   max_size=self.__conf.quote_cache_size)
+        self.__mktdata = create_market_data(self.__conf)
+        ## price history store, opened by start() or the first get_price_history
+        self.__hist = None
+        self.__price_analyzer = PriceAnalyzer(partial(self.__quotes.get_quotes, priority=Priority.INDICATORS),
+                                              poll_seconds=self.__conf.price_poll_freq)
+        for pos in self.long_positions:
+            self.__price_analyzer.track(pos.version, pos.ticker, pos.price)
+        self.__event_handler = EventBus()
+        for name, sink in sinks.items():
+            handler, overflow = sink if isinstance(sink, tuple) else (sink, self.__conf.event_sink_overflow)
+            self.__event_handler.register(name, handler, maxsize=self.__conf.event_sink_queue_size, overflow=overflow)
         self.__reporter = PnlReporter(config=self.__conf)
         self.trade_control = TradeControl(self.__conf)
+        timeit.enable(self.__conf.instrumentation_enabled)
 
     def start(self):
 
@@ -48,30 +96,97 @@ class BotManager:
 
         thread = threading.Thread(target=self.__alert_reader.start)
         thread.start()
-        ##threading.Thread(target=self.__priceAnalyzer.start).start()
+        held = sorted(self.long_positions.tickers())
+        if self.__mktdata:
+            ## the held tickers stream from the start, the alerts only add the tickers they quote
+            self.__mktdata.subscribe(held)
+            self.__mktdata.start()
+        threading.Thread(target=self.__price_analyzer.start, args=(self.trading_end_time,), daemon=True).start()
+        self.__start_hist_sync(held)
         self.work()
 
+    def __start_hist_sync(self, tickers):
+        """
+        Map the stored history of the held tickers and keep the history of held and bought tickers current from a
+        daemon thread, only the bars missing on disk are downloaded.
+        """
+        self.__hist = HistStore(self.__conf.hist_dir)
+        for ticker in tickers:
+            self.__hist.warm_up([ticker])
+            self.__ticker_q.put(ticker)
+        threading.Thread(target=self.__hist.sync_worker, name='hist-sync', daemon=True,
+                         args=(self.__ticker_q, self.__trader, self.__conf.hist_sync_interval_seconds)).start()
+
+    def get_price_history(self, ticker: str, start_ts: int = None, end_ts: int = None):
+        """
+        :return: dict of column -> array of the ticker's bars, from the hist store; the bars missing on disk are
+                 fetched first, at most every hist_sync_interval_seconds
+        """
+        if self.__hist is None:
+            self.__hist = HistStore(self.__conf.hist_dir)
+        return self.__hist.price_history(ticker, self.__trader, start_ts, end_ts,
+                                         self.__conf.hist_sync_interval_seconds)
+
     def work(self):
         logger.info('Start working ...')
-        while datetime.datetime.now().timestamp() < self.trading_end_time.timestamp():
-            while not self.__event_q.empty():
-                event = self.__event_q.get()
-                self.__on_event(event)
-            time.sleep(5)
+        dump_stop = self.__start_latency_dump()
+        EventDispatcher(self.__event_q, self.__on_event, self.trading_end_time).run()
         self.eod_process()
+        if dump_stop:
+            dump_stop.set()
+        self.dump_latency()
+        logger.info(f'quote cache stats: {self.__quotes.stats()}')
+        logger.info(f'broker request stats: {self.__trader.request_stats()}')
+        if self.__mktdata:
+            logger.info(f'market data stats: {self.__mktdata.stats()}')
+            self.__mktdata.stop()
         self.gen_reports()
+        self.close()
+
+    def __start_latency_dump(self):
+        if timeit.enabled() and self.__conf.instrumentation_dump_seconds > 0:
+            return timeit.start_periodic_dump(self.__conf.instrumentation_dump_seconds)
+        return None
+
+    def dump_latency(self):
+        """
+        Log the per stage latency histograms and write them to the latency journal of the day.
+        """
+        if not timeit.enabled():
+            return None
+        return timeit.dump(path=f'{self.__conf.journal_dir}{os.sep}{self.cob_date}{os.sep}'
+                                f'{self.__conf.latency_journal}_{self.cob_date}.json')
+
+    def close(self):
+        self.__ticker_q.put(None)
+        self.__event_handler.close()
+        if self.__persister:
+            self.__persister.close()
+
+    def on_event(self, event):
+        """
+        Process one alert (symbols, action, version, ts[, TraceContext]) as if it came from the alert reader.
+        """
+        self.__on_event(event)
 
     def __on_event(self, event):
-        (symbols, action, version, ts) = event
+        ctx = trace_of(event)
+        if ctx:
+            ctx.mark(trace.DEQUEUE)
+        (symbols, action, version, ts) = event[:4]
         self.publish_event(
             {"event_type": EventType.RPA_ALERT, "tickers": symbols, "action": action,
              "version": version, "ts": ts})
+        if self.__mktdata:
+            self.__mktdata.subscribe(symbols)
         next_move = self.next_move(action)
+        if next_move and self.__trade_versions and version not in self.__trade_versions:
+            next_move = None
         source = f'#B4#{version}#'
         if next_move:
             logger.info(f'processing event {event}')
             side = next_move
-            self.trade(symbols, side, version, source, ts)
+            self.trade(symbols, side, version, source, ts, ctx)
             self.show_statistics()
         else:
             logger.info(f'event ignored :{event}')
@@ -83,27 +198,34 @@ class BotManager:
             return "SELL"
         return None
 
-    def trade(self, symbols, side, version, source, ts):
+    @timeit.stage('trade')
+    def trade(self, symbols, side, version, source, ts, ctx: TraceContext = None):
         if symbols:
+            ## quote all tickers to be traded in one go, so the last ones of a basket are not priced late
+            if side == 'BUY':
+                to_quote = [t for t in symbols if not self.long_positions.holds(version, t)]
+            else:
+                to_quote = [t for t in symbols if self.long_positions.holds(version, t)]
+            prices = self.get_prices(list(dict.fromkeys(to_quote))) if to_quote else {}
+            if ctx:
+                ctx.mark(trace.QUOTE)
             for ticker in symbols:
                 execution = None
                 pnl = None
-                exec_time = ''.join(datetime.datetime.now(tz=datetime.datetime.now().astimezone().tzinfo).isoformat(
-                    timespec='milliseconds').rsplit(':', 1))
-                if side == 'BUY' and (version not in self.long_positions or ticker not in self.long_positions[version]):
-                    price_b = self.execute_buy(ticker)
+                exec_time = ''.join(self.__clock.now().astimezone().isoformat(timespec='milliseconds').rsplit(':', 1))
+                exec_at = time.time()
+                if side == 'BUY' and not self.long_positions.holds(version, ticker):
+                    price_b = self.execute_buy(ticker, prices.get(ticker))
                     if price_b:
                         buy_qty = self.calc_qty(price_b)
                         if buy_qty:
-                            self.long_positions.setdefault(version, dict())[ticker] = {'price': float(price_b),
-                                                                                         'qty': buy_qty,
-                                                                                         'exec_time': exec_time,
-                                                                                         'alert_buy_ts': ts,
-                                                                                         'strategy': source}  # (float(price_b), exec_time)
-                            # self.__priceAnalyzer.add_price(ticker, price_b, dt.strftime('%H%M%S'))
+                            self.long_positions.add(Position(ticker, version, source, float(price_b), buy_qty,
+                                                             exec_time, alert_buy_ts=ts))
+                            self.__price_analyzer.track(version, ticker, float(price_b))
                             execution = dict(
                                 event_type=EventType.TRADE,
                                 ticker=ticker,
+                                version=version,
                                 price=price_b,
                                 qty=buy_qty,
                                 side=side,
@@ -117,22 +239,22 @@ class BotManager:
                             logger.info(f"# of shares < 1, skipped buy for : {ticker}")
                     else:
                         logger.error(f'failed to execute buy for : {ticker}')
-                elif side == 'SELL' and version in self.long_positions and ticker in self.long_positions[version]:
-                    price_s = self.execute_sell(ticker)
+                elif side == 'SELL' and self.long_positions.holds(version, ticker):
+                    price_s = self.execute_sell(ticker, prices.get(ticker))
                     if price_s:
                         price_sold = float(price_s)
-                        exec_b = self.long_positions[version].pop(ticker)
-                        if len(self.long_positions[version]) == 0:
-                            self.long_positions.pop(version)
-                        price_bought = exec_b['price']
-                        bought_time = exec_b['exec_time']
-                        alert_b_ts = exec_b['alert_buy_ts']
-                        buy_strategy = exec_b['strategy']
-                        qty = exec_b['qty']
+                        exec_b = self.long_positions.remove(version, ticker)
+                        self.__price_analyzer.untrack(version, ticker)
+                        price_bought = exec_b.price
+                        bought_time = exec_b.exec_time
+                        alert_b_ts = exec_b.alert_buy_ts
+                        buy_strategy = exec_b.strategy
+                        qty = exec_b.qty
                         pct_chg = round(100 * (price_sold - price_bought) / price_bought, ndigits=4)
                         execution = dict(
                             event_type=EventType.TRADE,
                             ticker=ticker,
+                            version=version,
                             price=price_sold,
                             qty=qty,
                             side=side,
@@ -156,7 +278,7 @@ class BotManager:
                             version=version,
                             pnl_type=PnlType.REALIZED.name
                         )
-                        self.__pnl.setdefault(ticker, list()).append(pnl)
+                        self.__pnl.append(pnl)
                     else:
                         logger.error(f'failed to execute sell for: {ticker}')
                 else:
@@ -164,23 +286,29 @@ class BotManager:
 
                 if execution:
                     self.publish_event(execution)
-                    self.__persister.insert_execution(self.enrich(execution))
+                    self.publish_position(version, ticker)
+                    if ctx:
+                        self.publish_trace(ctx.fork().mark(trace.EXEC, exec_at), ticker, side, version)
                 if pnl:
                     self.publish_event(pnl)
-                    self.__persister.insert_pnl(self.enrich(pnl))
         else:
             logger.warning('invalid event')
 
-    def execute_buy(self, ticker):
-        return self.get_price(ticker)
+    def execute_buy(self, ticker, price=None):
+        return price or self.get_price(ticker)
 
-    def execute_sell(self, ticker):
-        return self.get_price(ticker)
+    def execute_sell(self, ticker, price=None):
+        return price or self.get_price(ticker)
 
+    @timeit.stage('quote')
     def get_price(self, ticker):
         logger.info(f'getting price for {ticker}')
+        if self.__mktdata:
+            price = self.__mktdata.last_price(ticker)
+            if price:
+                return price
         try:
-            quotes = self.__trader.get_quotes([ticker])
+            quotes = self.__quotes.get_quotes([ticker])
             if quotes:
                 for t, q in quotes.items():
                     return q['lastPrice']
@@ -188,94 +316,110 @@ class BotManager:
             logger.exception(f'error getting price for {ticker}')
         return None
 
-    def get_prices(self, tickers: list):
+    @timeit.stage('quote')
+    def get_prices(self, tickers: list, priority: Priority = Priority.TRADE):
         logger.info(f'getting price for {tickers}')
-        prices = {}
-        try:
-            quotes = self.__trader.get_quotes(tickers)
-            if quotes:
-                for t, q in quotes.items():
-                    prices[t] = q['lastPrice']
-        except Exception:
-            logger.exception(f'error getting price for {tickers}')
+        prices = self.__mktdata.last_prices(tickers) if self.__mktdata else {}
+        ## every price the bot gets is a sample of the held positions' indicators, quotes with their volume
+        samples = dict(prices)
+        tickers = [t for t in tickers if t not in prices]
+        for i in range(0, len(tickers), self.__quote_batch_size):
+            batch = tickers[i:i + self.__quote_batch_size]
+            try:
+                quotes = self.__quotes.get_quotes(batch, priority=priority)
+                if quotes:
+                    for t, q in quotes.items():
+                        prices[t] = q['lastPrice']
+                    samples.update(quotes)
+            except Exception:
+                logger.exception(f'error getting price for {batch}')
+        self.__price_analyzer.update(samples)
         return prices
 
+    @timeit.stage('publish')
     def publish_event(self, event: dict):
-        e_type = event['event_type']
         self.__event_handler.handle_event(event)
 
-        if e_type == EventType.TRADE:
-            ## also update positions
-            payload = dict(event_type=EventType.POSITIONS, positions=self.long_positions)
-            self.__event_handler.handle_event(payload)
+    def publish_position(self, version, ticker):
+        """
+        Publish the change of one position (a delta), not the whole book.
+        """
+        pos = self.long_positions.get(version, ticker)
+        self.publish_event(dict(event_type=EventType.POSITIONS, op='add' if pos else 'remove', version=version,
+                                ticker=ticker, position=pos.to_dict() if pos else None))
+
+    def publish_trace(self, ctx: TraceContext, ticker, side, version):
+        """
+        Keep the latency breakdown of one execution for the report and journal its stage time stamps.
+        """
+        self.__latency.append(dict(ticker=ticker, side=side, version=version, alert_ts=ctx.alert_ts,
+                                   **trace.breakdown(ctx.marks)))
+        self.publish_event(dict(event_type=EventType.TRACE, ticker=ticker, side=side, version=version,
+                                alert_ts=ctx.alert_ts, marks=ctx.marks))
+
+    def get_latency(self):
+        return self.__latency
 
     def show_statistics(self):
-        logger.info(f'current positions : {self.long_positions}')
-        logger.info('current PNLs summary ...')
-        pnl_display = ""
-        for (t, pnls) in self.__pnl.items():
-            for pnl in pnls:
-                pnl_display += str(pnl) + '\n'
-        if pnl_display:
-            logger.info(f'\n{pnl_display}')
+        ## formatting the whole book is costly, skip it when nobody reads it (replays)
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(f'current positions ({len(self.long_positions)}, cost {self.long_positions.total_cost:.2f}) : '
+                    f'{self.long_positions.to_dict()}')
+        logger.info(f'current PNLs summary : {self.__pnl.summary()}')
 
     def gen_reports(self):
         logger.info('generating report ...')
-        data = []
-        for (t, pnls) in self.__pnl.items():
-            data.extend(pnls)
-
-        self.__reporter.gen_report(data)
+        self.__reporter.gen_report(self.__pnl.columns(), latency=self.__latency)
 
     def eod_process(self):
         logger.info('eod process ...')
         eod_price_list = {'event_type': EventType.EOD_PRICE, "eod_prices": {}}
-        tickers = set()
-        for (ver, positions) in self.long_positions.items():
-            tickers.update(positions.keys())
-        eod_prices = self.get_prices(list(tickers))
-        for (ver, positions) in self.long_positions.items():
-            for t, pos in positions.items():
-                price_bought = pos['price']
-                p = eod_prices.get(t) or price_bought
-                qty = pos['qty']
-                alert_b_ts = pos['alert_buy_ts']
-                pct_chg = round(100 * (p - price_bought) / price_bought, ndigits=4)
-                pnl = dict(
-                    event_type=EventType.PNL,
-                    ticker=t,
-                    price_bought=price_bought,
-                    price_sold=p,
-                    price_chg_pct=pct_chg,
-                    qty=qty,
-                    time_bought=pos['exec_time'],
-                    time_sold='EOD',
-                    alert_buy_ts=alert_b_ts,
-                    alert_sell_ts="N/A",
-                    buy_strategy=pos['strategy'],
-                    sell_strategy='EOD',
-                    version=ver,
-                    pnl_type=PnlType.UN_REALIZED.name
-                )
-                self.__pnl.setdefault(t, list()).append(pnl)
-                eod_price_list['eod_prices'][t] = p
+        tickers = self.long_positions.tickers()
+        eod_prices = self.get_prices(tickers, priority=Priority.EOD)
+        ## after the EOD quotes, they are the last sample
+        self.__price_analyzer.stop()
+        logger.info(f'EOD indicators: {self.__price_analyzer.indicators()}')
+        for pos in self.long_positions:
+            t = pos.ticker
+            price_bought = pos.price
+            p = eod_prices.get(t) or price_bought
+            pct_chg = round(100 * (p - price_bought) / price_bought, ndigits=4)
+            pnl = dict(
+                event_type=EventType.PNL,
+                ticker=t,
+                price_bought=price_bought,
+                price_sold=p,
+                price_chg_pct=pct_chg,
+                qty=pos.qty,
+                time_bought=pos.exec_time,
+                time_sold='EOD',
+                alert_buy_ts=pos.alert_buy_ts,
+                alert_sell_ts="N/A",
+                buy_strategy=pos.strategy,
+                sell_strategy='EOD',
+                version=pos.version,
+                pnl_type=PnlType.UN_REALIZED.name
+            )
+            self.__pnl.append(pnl)
+            eod_price_list['eod_prices'][t] = p
         if tickers:
             self.publish_event(eod_price_list)
-            self.__persister.insert_eod_prices(self.enrich(eod_price_list))
 
     def add_pnl(self, pnl: dict):
-        self.__pnl.setdefault(pnl['ticker'], list()).append(pnl)
+        self.__pnl.append(pnl)
 
     def get_pnl(self):
         return self.__pnl
 
     def add_position(self, pos: dict):
-        self.long_positions.update(pos)
+        self.long_positions.load(pos)
 
     def calc_qty(self, price_b):
-        return self.__default_qty
-        #max_buy_amt = min(self.__per_trade_amt_limit, self.__daily_trade_amt_limit-self.__total_amt)
-        #return min(self.__default_qty, max_buy_amt//price_b)
+        if not self.__enforce_trade_limits:
+            return self.__default_qty
+        max_buy_amt = min(self.__per_trade_amt_limit, self.__daily_trade_amt_limit-self.__total_amt)
+        return max(min(self.__default_qty, int(max_buy_amt // price_b)), 0)
 
     def enrich(self, data: dict):
         data['cob_date'] = self.cob_date
@@ -285,23 +429,11 @@ class BotManager:
 
 '''
 def test_eod_price():
-    botManager.long_positions = {}
-    botManager.long_positions['V5.4'] = {}
-    botManager.long_positions['V5.4']['LIT'] = {}
-    botManager.long_positions['V5.4']['LIT']['price'] = 116.0
-    botManager.long_positions['V5.4']['LIT']['qty'] = 100
-    botManager.long_positions['V5.4']['LIT']['version'] = 'V5.4'
-    botManager.long_positions['V5.4']['LIT']['alert_buy_ts'] = '2022/05/13-09:57:14'
-    botManager.long_positions['V5.4']['LIT']['exec_time'] = '2022/05/13-09:57:14'
-    botManager.long_positions['V5.4']['LIT']['strategy'] = '#B4#V5.4#'
-
-    botManager.long_positions['V5.4']['LCID'] = {}
-    botManager.long_positions['V5.4']['LCID']['price'] = 17.1
-    botManager.long_positions['V5.4']['LCID']['qty'] = 100
-    botManager.long_positions['V5.4']['LCID']['version'] = 'V5.4'
-    botManager.long_positions['V5.4']['LCID']['alert_buy_ts'] = '2022/05/13-09:57:14'
-    botManager.long_positions['V5.4']['LCID']['exec_time'] = '2022/05/13-09:57:14'
-    botManager.long_positions['V5.4']['LCID']['strategy'] = '#B4#V5.4#'
+    botManager.long_positions = PositionBook()
+    botManager.long_positions.add(Position('LIT', 'V5.4', '#B4#V5.4#', 116.0, 100, '2022/05/13-09:57:14',
+                                           alert_buy_ts='2022/05/13-09:57:14'))
+    botManager.long_positions.add(Position('LCID', 'V5.4', '#B4#V5.4#', 17.1, 100, '2022/05/13-09:57:14',
+                                           alert_buy_ts='2022/05/13-09:57:14'))
     botManager.eod_process()
 '''
 
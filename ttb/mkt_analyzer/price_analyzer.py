@@ -0,0 +1,181 @@
+import datetime
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PriceAnalyzer:
+    """
+    Rolling intraday indicators for all tracked (held) positions at once.
+
+    Each position, (version, symbol) as in the PositionBook, owns one row of 2D NumPy arrays holding its last
+    `window` price samples, so a symbol held by several versions keeps each entry price. A quote batch is applied
+    with one vectorized update over all rows in the batch, indicators are computed column-wise over all rows:
+      - vwap over the window (volume = change of the quote's totalVolume between samples)
+      - ema of price, ATR as Wilder smoothing of the absolute sample-to-sample change
+      - % change from entry price and drawdown % from the peak since entry
+
+    The bot hands its own quote batches to `update`, the poll every `poll_seconds` only quotes the tracked symbols
+    no batch sampled within that time.
+    """
+
+    def __init__(self, price_source=None, window: int = 120, ema_span: int = 20, atr_span: int = 14,
+                 poll_seconds: float = 180, capacity: int = 64):
+        self.price_source = price_source
+        self.window = window
+        self.ema_alpha = 2.0 / (ema_span + 1)
+        self.atr_span = atr_span
+        self.poll_seconds = poll_seconds
+        self.__slots = {}  ## (version, symbol) -> row
+        self.__rows = {}  ## symbol -> rows of its positions
+        self.__free = []
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__alloc(capacity)
+
+    def __alloc(self, capacity):
+        self.capacity = capacity
+        self.prices = np.full((capacity, self.window), np.nan)
+        self.volumes = np.zeros((capacity, self.window))
+        self.samples = np.zeros(capacity, dtype=np.int64)
+        self.last_price = np.full(capacity, np.nan)
+        self.last_cum_volume = np.full(capacity, np.nan)
+        self.ema = np.full(capacity, np.nan)
+        self.atr = np.full(capacity, np.nan)
+        self.entry = np.full(capacity, np.nan)
+        self.peak = np.full(capacity, np.nan)
+        self.sampled_at = np.full(capacity, -np.inf)  ## monotonic time of the last sample
+
+    def __grow(self):
+        old = (self.prices, self.volumes, self.samples, self.last_price, self.last_cum_volume, self.ema, self.atr,
+               self.entry, self.peak, self.sampled_at)
+        n = self.capacity
+        self.__alloc(n * 2)
+        for new, prev in zip((self.prices, self.volumes, self.samples, self.last_price, self.last_cum_volume,
+                              self.ema, self.atr, self.entry, self.peak, self.sampled_at), old):
+            new[:n] = prev
+
+    def track(self, version: str, symbol: str, entry_price: float):
+        with self.__lock:
+            key = (version, symbol)
+            row = self.__slots.get(key)
+            if row is None:
+                if self.__free:
+                    row = self.__free.pop()
+                else:
+                    row = len(self.__slots)
+                    if row >= self.capacity:
+                        self.__grow()
+                self.__slots[key] = row
+                self.__rows.setdefault(symbol, []).append(row)
+                self.__reset(row)
+            self.entry[row] = entry_price
+            self.peak[row] = np.fmax(self.peak[row], entry_price)
+
+    def untrack(self, version: str, symbol: str):
+        with self.__lock:
+            row = self.__slots.pop((version, symbol), None)
+            if row is not None:
+                rows = self.__rows[symbol]
+                rows.remove(row)
+                if not rows:
+                    del self.__rows[symbol]
+                self.__reset(row)
+                self.__free.append(row)
+
+    def __reset(self, row):
+        self.prices[row] = np.nan
+        self.volumes[row] = 0
+        self.samples[row] = 0
+        self.last_price[row] = self.last_cum_volume[row] = np.nan
+        self.ema[row] = self.atr[row] = self.entry[row] = self.peak[row] = np.nan
+        self.sampled_at[row] = -np.inf
+
+    def symbols(self):
+        return list(self.__rows.keys())
+
+    def stale_symbols(self, max_age_seconds: float):
+        """
+        :return: tracked symbols with a position not sampled in the last max_age_seconds
+        """
+        cutoff = time.monotonic() - max_age_seconds
+        with self.__lock:
+            return [s for s, rows in self.__rows.items() if self.sampled_at[rows].min() <= cutoff]
+
+    def update(self, quotes: dict):
+        """
+        :param quotes: symbol -> TD quote dict (lastPrice, totalVolume) or price; untracked symbols are ignored
+        """
+        with self.__lock:
+            items = [(row, q) for s, q in quotes.items() for row in self.__rows.get(s, ())]
+            if not items:
+                return
+            rows = np.fromiter((r for r, _ in items), dtype=np.int64, count=len(items))
+            p = np.fromiter((q['lastPrice'] if isinstance(q, dict) else q for _, q in items), dtype=np.float64,
+                            count=len(items))
+            cum_v = np.fromiter((q.get('totalVolume', np.nan) if isinstance(q, dict) else np.nan for _, q in items),
+                                dtype=np.float64, count=len(items))
+
+            prev_p = self.last_price[rows]
+            first = np.isnan(prev_p)
+            vol = np.nan_to_num(np.maximum(cum_v - self.last_cum_volume[rows], 0))
+            tr = np.where(first, 0.0, np.abs(p - prev_p))
+
+            cols = self.samples[rows] % self.window
+            self.prices[rows, cols] = p
+            self.volumes[rows, cols] = vol
+            self.samples[rows] += 1
+            self.last_price[rows] = p
+            self.last_cum_volume[rows] = np.where(np.isnan(cum_v), self.last_cum_volume[rows], cum_v)
+            self.ema[rows] = np.where(first, p, self.ema_alpha * p + (1 - self.ema_alpha) * self.ema[rows])
+            self.atr[rows] = np.where(first, tr, (self.atr[rows] * (self.atr_span - 1) + tr) / self.atr_span)
+            self.peak[rows] = np.fmax(self.peak[rows], p)
+            self.sampled_at[rows] = time.monotonic()
+
+    def indicators(self):
+        """
+        :return: dict of (version, symbol) -> dict(price, vwap, ema, atr, chg_from_entry_pct, drawdown_pct)
+        """
+        with self.__lock:
+            if not self.__slots:
+                return {}
+            keys = list(self.__slots.keys())
+            rows = np.fromiter(self.__slots.values(), dtype=np.int64, count=len(keys))
+            prices = self.prices[rows]
+            volumes = self.volumes[rows]
+            total_vol = volumes.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ## without volume fall back to the plain average price
+                avg = np.nansum(prices, axis=1) / (~np.isnan(prices)).sum(axis=1)
+                vwap = np.where(total_vol > 0, np.nansum(prices * volumes, axis=1) / total_vol, avg)
+                last = self.last_price[rows]
+                chg = 100 * (last - self.entry[rows]) / self.entry[rows]
+                dd = 100 * (last - self.peak[rows]) / self.peak[rows]
+            cols = dict(price=last, vwap=vwap, ema=self.ema[rows], atr=self.atr[rows], chg_from_entry_pct=chg,
+                        drawdown_pct=dd)
+            return {key: {k: round(float(v[i]), 4) for k, v in cols.items()} for i, key in enumerate(keys)}
+
+    def start(self, stop_time: datetime.datetime):
+        logger.info(f'price analyzer started, refresh every {self.poll_seconds} seconds')
+        while not self.__stopped.wait(self.poll_seconds):
+            if datetime.datetime.now().timestamp() >= stop_time.timestamp():
+                break
+            self.refresh()
+
+    def refresh(self):
+        symbols = self.stale_symbols(self.poll_seconds)
+        if not symbols or not self.price_source:
+            return
+        try:
+            self.update(self.price_source(symbols))
+        except Exception:
+            logger.exception(f'failed to refresh prices for {symbols}')
+            return
+        logger.info(f'indicators: {self.indicators()}')
+
+    def stop(self):
+        self.__stopped.set()
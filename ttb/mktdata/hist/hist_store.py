@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import threading
+import time
+from queue import Queue
+from urllib.parse import quote, unquote
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+DTYPES = {'ts': np.int64, 'open': np.float64, 'high': np.float64, 'low': np.float64, 'close': np.float64,
+          'volume': np.float64}
+
+
+class HistStore:
+    """
+    On-disk OHLCV bars, one .npy file per column per symbol (<root>/<symbol>/<column>.npy).
+
+    Column files are preallocated and grow by doubling, meta.json holds the # of bars written. Reads return
+    read-only memory mapped slices, no copy is made. Bars are kept in ts (epoch millis) order, appends only
+    accept bars newer than the last one stored. Symbols are percent-encoded in the path (BRK/B -> BRK%2FB).
+    """
+
+    def __init__(self, root_dir: str, initial_capacity: int = 1024):
+        self.root_dir = root_dir
+        self.initial_capacity = initial_capacity
+        self.__readers = {}  ## symbol -> (capacity, {column: memmap})
+        self.__synced = {}  ## symbol -> monotonic time of the last sync
+        self.__lock = threading.RLock()
+        if not os.path.exists(root_dir):
+            os.makedirs(root_dir)
+
+    def __dir(self, symbol):
+        name = quote(symbol, safe='$^')
+        if name in ('', '.', '..'):
+            raise ValueError(f'invalid symbol: {symbol!r}')
+        return f'{self.root_dir}{os.sep}{name}'
+
+    def __meta(self, symbol):
+        meta_file = f'{self.__dir(symbol)}{os.sep}meta.json'
+        if not os.path.exists(meta_file):
+            return dict(count=0, capacity=0)
+        with open(meta_file, 'r') as f:
+            return json.load(f)
+
+    def __save_meta(self, symbol, meta):
+        meta_file = f'{self.__dir(symbol)}{os.sep}meta.json'
+        with open(f'{meta_file}.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(f'{meta_file}.tmp', meta_file)
+
+    def __column_file(self, symbol, col):
+        return f'{self.__dir(symbol)}{os.sep}{col}.npy'
+
+    def symbols(self):
+        return sorted(unquote(d) for d in os.listdir(self.root_dir) if os.path.isdir(f'{self.root_dir}{os.sep}{d}'))
+
+    def count(self, symbol):
+        return self.__meta(symbol)['count']
+
+    def last_ts(self, symbol):
+        n = self.count(symbol)
+        return int(self.__columns(symbol)['ts'][n - 1]) if n else None
+
+    def append(self, symbol: str, bars: dict):
+        """
+        :param bars: dict of column -> array like, same length for all columns, in any order; of bars with the
+                     same ts the last one is kept
+        :return: # of bars appended
+        """
+        with self.__lock:
+            meta = self.__meta(symbol)
+            count, capacity = meta['count'], meta['capacity']
+            ts = np.asarray(bars['ts'], dtype=np.int64)
+            order = np.argsort(ts, kind='stable')
+            ts = ts[order]
+            keep = np.append(ts[1:] != ts[:-1], True) if len(ts) else np.ones(0, dtype=bool)
+            if count:
+                keep &= ts > self.last_ts(symbol)
+            n = int(keep.sum())
+            if n == 0:
+                return 0
+            order = order[keep]
+            if count + n > capacity:
+                capacity = self.__grow(symbol, count, max(capacity * 2, self.initial_capacity, count + n))
+            for col in COLUMNS:
+                out = open_memmap(self.__column_file(symbol, col), mode='r+')
+                out[count:count + n] = np.asarray(bars[col], dtype=DTYPES[col])[order]
+                out.flush()
+                del out
+            self.__save_meta(symbol, dict(count=count + n, capacity=capacity))
+            return n
+
+    def __grow(self, symbol, count, capacity):
+        d = self.__dir(symbol)
+        if not os.path.exists(d):
+            os.makedirs(d)
+        for col in COLUMNS:
+            path = self.__column_file(symbol, col)
+            tmp = f'{path}.tmp'
+            out = open_memmap(tmp, mode='w+', dtype=DTYPES[col], shape=(capacity,))
+            if count:
+                out[:count] = np.load(path, mmap_mode='r')[:count]
+            out.flush()
+            del out
+            os.replace(tmp, path)
+        self.__readers.pop(symbol, None)
+        logger.info(f'{symbol}: history capacity grown to {capacity} bars')
+        return capacity
+
+    def __columns(self, symbol):
+        with self.__lock:
+            capacity = self.__meta(symbol)['capacity']
+            cached = self.__readers.get(symbol)
+            if cached is None or cached[0] != capacity:
+                cached = (capacity, {col: np.load(self.__column_file(symbol, col), mmap_mode='r')
+                                     for col in COLUMNS})
+                self.__readers[symbol] = cached
+            return cached[1]
+
+    def bars(self, symbol: str, start_ts: int = None, end_ts: int = None):
+        """
+        :return: dict of column -> read-only array view of bars with start_ts <= ts <= end_ts
+        """
+        ## count and columns read together, an append growing the files in between would leave them apart
+        with self.__lock:
+            n = self.count(symbol)
+            if n == 0:
+                return {col: np.empty(0, dtype=DTYPES[col]) for col in COLUMNS}
+            cols = self.__columns(symbol)
+        ts = cols['ts'][:n]
+        lo = int(np.searchsorted(ts, start_ts, side='left')) if start_ts is not None else 0
+        hi = int(np.searchsorted(ts, end_ts, side='right')) if end_ts is not None else n
+        return {col: cols[col][lo:hi] for col in COLUMNS}
+
+    def warm_up(self, symbols: list = None):
+        for symbol in symbols or self.symbols():
+            if self.count(symbol):
+                self.__columns(symbol)
+
+    def sync(self, symbol: str, trader):
+        """
+        Download only the symbol's bars newer than the last one on disk (the full history the first time).
+
+        :param trader: TosTrader or anything with get_price_history(symbol, start_ts=None) returning TD candles
+        :return: # of bars appended
+        """
+        last = self.last_ts(symbol)
+        history = trader.get_price_history(symbol, start_ts=last + 1 if last is not None else None)
+        self.__synced[symbol] = time.monotonic()
+        candles = (history or {}).get('candles') or []
+        if not candles:
+            return 0
+        bars = {col: [c['datetime' if col == 'ts' else col] for c in candles] for col in COLUMNS}
+        n = self.append(symbol, bars)
+        logger.info(f'{symbol}: {n} new bars stored')
+        return n
+
+    def refresh(self, symbol: str, trader, max_age_seconds: float = 300):
+        """
+        sync the symbol unless it was synced in the last max_age_seconds; broker errors are logged, not raised.
+
+        :return: # of bars appended
+        """
+        synced = self.__synced.get(symbol)
+        if synced is not None and time.monotonic() - synced < max_age_seconds:
+            return 0
+        try:
+            return self.sync(symbol, trader)
+        except Exception:
+            logger.exception(f'{symbol}: history sync failed, the bars on disk are served')
+            return 0
+
+    def price_history(self, symbol: str, trader=None, start_ts: int = None, end_ts: int = None,
+                      max_age_seconds: float = 300):
+        """
+        Bars of the symbol served from disk, with a trader only the bars missing on disk are fetched first.
+
+        :return: dict of column -> read-only array view, as bars()
+        """
+        if trader is not None:
+            self.refresh(symbol, trader, max_age_seconds)
+        return self.bars(symbol, start_ts, end_ts)
+
+    def sync_worker(self, tickers: Queue, trader, max_age_seconds: float = 300):
+        """
+        Keep the history of the tickers put on the queue current, until None is put.
+        """
+        while True:
+            symbol = tickers.get()
+            if symbol is None:
+                break
+            self.refresh(symbol, trader, max_age_seconds)
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+from ttb.cfg.config import Config
+from ttb.mktdata.tick_buffer import TickRingBuffer
+from ttb.mktdata.transport import QuoteTransport, SocketTransport
+
+logger = logging.getLogger(__name__)
+
+
+class MarketDataService:
+    """
+    Keeps the latest ticks of subscribed symbols in memory, fed by a streaming QuoteTransport.
+
+    `last_price` is a memory lookup, it returns None when the symbol has not ticked within `max_age_seconds`
+    so callers can fall back to a REST quote.
+    """
+
+    def __init__(self, transport: QuoteTransport, depth: int = 256, max_age_seconds: float = 5,
+                 reconnect_seconds: float = 5):
+        self.transport = transport
+        self.buffer = TickRingBuffer(depth=depth)
+        self.max_age_seconds = max_age_seconds
+        self.reconnect_seconds = reconnect_seconds
+        self.__symbols = set()
+        self.__lock = threading.Lock()
+        self.__connected = False
+        self.__stopped = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        threading.Thread(target=self.__run, name='market-data', daemon=True).start()
+
+    def stop(self):
+        self.__stopped.set()
+
+    def subscribe(self, symbols: list):
+        with self.__lock:
+            new_symbols = [s for s in symbols if s not in self.__symbols]
+            self.__symbols.update(new_symbols)
+            connected = self.__connected
+        if new_symbols and connected:
+            try:
+                self.transport.subscribe(new_symbols)
+            except Exception:
+                logger.exception(f'failed to subscribe {new_symbols}')
+
+    def unsubscribe(self, symbols: list):
+        with self.__lock:
+            symbols = [s for s in symbols if s in self.__symbols]
+            self.__symbols.difference_update(symbols)
+            connected = self.__connected
+        if symbols and connected:
+            try:
+                self.transport.unsubscribe(symbols)
+            except Exception:
+                logger.exception(f'failed to unsubscribe {symbols}')
+
+    def last_price(self, symbol: str, max_age_seconds: float = None):
+        tick = self.buffer.last(symbol)
+        max_age = self.max_age_seconds if max_age_seconds is None else max_age_seconds
+        if tick is None or time.time() - tick[0] > max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return float(tick[1])
+
+    def last_prices(self, symbols: list, max_age_seconds: float = None):
+        prices = {}
+        for s in symbols:
+            p = self.last_price(s, max_age_seconds)
+            if p is not None:
+                prices[s] = p
+        return prices
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            try:
+                self.transport.connect()
+                with self.__lock:
+                    self.__connected = True
+                    symbols = list(self.__symbols)
+                if symbols:
+                    self.transport.subscribe(symbols)
+                while not self.__stopped.is_set():
+                    for symbol, price, ts in self.transport.recv(timeout=1):
+                        self.buffer.append(symbol, price, ts)
+            except Exception:
+                logger.exception(f'quote feed failed, reconnecting in {self.reconnect_seconds} seconds')
+                self.__stopped.wait(self.reconnect_seconds)
+            finally:
+                with self.__lock:
+                    self.__connected = False
+                self.transport.close()
+
+    def stats(self):
+        return dict(symbols=len(self.__symbols), hits=self.hits, misses=self.misses)
+
+
+def create_market_data(conf: Config):
+    """
+    :return: MarketDataService for the configured transport, None if streaming is disabled
+    """
+    if conf.mktdata_transport == 'socket':
+        transport = SocketTransport(conf.mktdata_host, conf.mktdata_port)
+    else:
+        return None
+    return MarketDataService(transport, depth=conf.mktdata_depth, max_age_seconds=conf.mktdata_max_age_seconds)
@@ -0,0 +1,71 @@
+import threading
+
+import numpy as np
+
+
+class TickRingBuffer:
+    """
+    Latest `depth` ticks (time, price) per symbol in preallocated NumPy arrays.
+
+    Each symbol owns one row of the arrays, rows are allocated on first use and the arrays only grow (doubling)
+    when more symbols are seen than `capacity`.
+    """
+
+    def __init__(self, depth: int = 256, capacity: int = 512):
+        self.depth = depth
+        self.capacity = capacity
+        self.prices = np.full((capacity, depth), np.nan)
+        self.times = np.zeros((capacity, depth))
+        self.counts = np.zeros(capacity, dtype=np.int64)  ## total # of ticks written per row
+        self.__rows = {}
+        self.__lock = threading.Lock()
+
+    def __row(self, symbol):
+        row = self.__rows.get(symbol)
+        if row is None:
+            row = len(self.__rows)
+            if row >= self.capacity:
+                self.__grow()
+            self.__rows[symbol] = row
+        return row
+
+    def __grow(self):
+        extra = self.capacity
+        self.prices = np.vstack([self.prices, np.full((extra, self.depth), np.nan)])
+        self.times = np.vstack([self.times, np.zeros((extra, self.depth))])
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        self.capacity += extra
+
+    def append(self, symbol: str, price: float, ts: float):
+        with self.__lock:
+            row = self.__row(symbol)
+            i = self.counts[row] % self.depth
+            self.prices[row, i] = price
+            self.times[row, i] = ts
+            self.counts[row] += 1
+
+    def last(self, symbol: str):
+        """
+        :return: (ts, price) of the latest tick, None if the symbol never ticked
+        """
+        with self.__lock:
+            row = self.__rows.get(symbol)
+            if row is None or self.counts[row] == 0:
+                return None
+            i = (self.counts[row] - 1) % self.depth
+            return self.times[row, i], self.prices[row, i]
+
+    def ticks(self, symbol: str):
+        """
+        :return: (times, prices) arrays of the buffered ticks, oldest first
+        """
+        with self.__lock:
+            row = self.__rows.get(symbol)
+            if row is None:
+                return np.empty(0), np.empty(0)
+            n = int(min(self.counts[row], self.depth))
+            order = (np.arange(self.counts[row] - n, self.counts[row])) % self.depth
+            return self.times[row, order], self.prices[row, order]
+
+    def symbols(self):
+        return list(self.__rows.keys())
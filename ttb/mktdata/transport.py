@@ -0,0 +1,133 @@
+import json
+import logging
+import select
+import socket
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteTransport:
+    """
+    Streaming quote feed used by MarketDataService.
+
+    `recv` returns the ticks received so far as a list of (symbol, price, ts), waiting at most `timeout` seconds.
+    """
+
+    def connect(self):
+        pass
+
+    def subscribe(self, symbols: list):
+        pass
+
+    def unsubscribe(self, symbols: list):
+        pass
+
+    def recv(self, timeout: float):
+        return []
+
+    def close(self):
+        pass
+
+
+class SocketTransport(QuoteTransport):
+    """
+    Newline delimited JSON over TCP.
+
+    Sends {"op": "subscribe"|"unsubscribe", "symbols": [...]}, receives {"symbol": .., "price": .., "ts": ..}.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.__sock = None
+        self.__buf = b''
+        self.__lock = threading.Lock()
+
+    def connect(self):
+        self.__sock = socket.create_connection((self.host, self.port))
+        self.__sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__buf = b''
+        logger.info(f'connected to quote feed {self.host}:{self.port}')
+
+    def __send(self, msg: dict):
+        with self.__lock:
+            self.__sock.sendall(f'{json.dumps(msg)}\n'.encode())
+
+    def subscribe(self, symbols: list):
+        self.__send({'op': 'subscribe', 'symbols': list(symbols)})
+
+    def unsubscribe(self, symbols: list):
+        self.__send({'op': 'unsubscribe', 'symbols': list(symbols)})
+
+    def recv(self, timeout: float):
+        readable, _, _ = select.select([self.__sock], [], [], timeout)
+        if not readable:
+            return []
+        data = self.__sock.recv(64 * 1024)
+        if not data:
+            raise ConnectionError(f'quote feed {self.host}:{self.port} closed the connection')
+        complete, _, self.__buf = (self.__buf + data).rpartition(b'\n')
+        ticks = []
+        for line in complete.split(b'\n'):
+            if line:
+                tick = json.loads(line)
+                ticks.append((tick['symbol'], float(tick['price']), float(tick.get('ts') or time.time())))
+        return ticks
+
+    def close(self):
+        if self.__sock:
+            self.__sock.close()
+            self.__sock = None
+
+
+class LocalQuoteFeed:
+    """
+    Local stand-in for a streaming quote server speaking the SocketTransport protocol, for tests and dry runs.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        feed = self
+        self._clients = {}  ## handler -> set of subscribed symbols
+        self._lock = threading.Lock()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with feed._lock:
+                    feed._clients[self] = set()
+                try:
+                    for line in self.rfile:
+                        msg = json.loads(line)
+                        with feed._lock:
+                            if msg['op'] == 'subscribe':
+                                feed._clients[self].update(msg['symbols'])
+                            elif msg['op'] == 'unsubscribe':
+                                feed._clients[self].difference_update(msg['symbols'])
+                finally:
+                    with feed._lock:
+                        feed._clients.pop(self, None)
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='local-quote-feed', daemon=True).start()
+        return self
+
+    def subscribers(self, symbol: str):
+        with self._lock:
+            return sum(1 for symbols in self._clients.values() if symbol in symbols)
+
+    def publish(self, symbol: str, price: float, ts: float = None):
+        line = f'{json.dumps({"symbol": symbol, "price": price, "ts": ts or time.time()})}\n'.encode()
+        with self._lock:
+            for client, symbols in self._clients.items():
+                if symbol in symbols:
+                    client.wfile.write(line)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
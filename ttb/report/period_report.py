@@ -0,0 +1,182 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from ttb.cfg.config import Config
+from ttb.report.pnl_ledger import PnlAggregate
+from ttb.util import timeutil
+from ttb.util.strategy import version_of
+
+logger = logging.getLogger(__name__)
+
+## aggregates are cached as PnlAggregate.values()
+CACHE_VERSION = 2
+DIMENSIONS = ('version', 'strategy', 'ticker')
+
+
+def day_sources(journal_dir: str, cob_date: str, conf: Config):
+    day_dir = f'{journal_dir}{os.sep}{cob_date}'
+    return {kind: f'{day_dir}{os.sep}{name}_{cob_date}.json'
+            for kind, name in (('pnl', conf.pnl_journal), ('trades', conf.trades_journal))}
+
+
+def source_stamp(sources: dict):
+    return {path: [st.st_size, st.st_mtime] for path, st in
+            ((p, os.stat(p)) for p in sources.values() if os.path.exists(p))}
+
+
+def read_lines(path: str):
+    if not os.path.exists(path):
+        return []
+    docs = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                docs.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f'skipped invalid line in {path}: {line.rstrip()}')
+    return docs
+
+
+def aggregate_day(cob_date: str, sources: dict):
+    """
+    Parse one day's pnl and trades journals into aggregates. Runs in the worker processes.
+
+    :return: dict(cob_date, trades={version: #}, and per dimension {key: PnlAggregate.values()})
+    """
+    agg = {d: {} for d in DIMENSIONS}
+    for p in read_lines(sources['pnl']):
+        keys = dict(version=p.get('version') or 'UNKOWN',
+                    strategy=p.get('buy_strategy') or p.get('buy_scanner') or 'UNKOWN', ticker=p['ticker'])
+        for d in DIMENSIONS:
+            agg[d].setdefault(keys[d], PnlAggregate()).add_pnl(p)
+    trades = {}
+    for t in read_lines(sources['trades']):
+        version = version_of(t) or 'UNKOWN'
+        trades[version] = trades.get(version, 0) + 1
+    return dict(cob_date=cob_date, trades=trades,
+                **{d: {key: a.values() for key, a in agg[d].items()} for d in DIMENSIONS})
+
+
+class PeriodReport:
+    """
+    PnL over many days of journals. Each day is reduced to an aggregate cached in cache_dir, keyed by the size
+    and mtime of its journal files; only new or changed days are parsed, in a process pool.
+    """
+
+    def __init__(self, journal_dir: str, cache_dir: str, workers: int = None, conf: Config = None):
+        self.journal_dir = journal_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.conf = conf or Config()
+        self.parsed = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def __cache_file(self, cob_date):
+        return f'{self.cache_dir}{os.sep}{cob_date}.json'
+
+    def __cached(self, cob_date, stamp):
+        path = self.__cache_file(cob_date)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                cached = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if cached.get('cache_version') != CACHE_VERSION or cached.get('sources') != stamp:
+            return None
+        return cached['aggregate']
+
+    def __save(self, cob_date, stamp, aggregate):
+        path = self.__cache_file(cob_date)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(dict(cache_version=CACHE_VERSION, sources=stamp, aggregate=aggregate), f)
+        os.replace(f'{path}.tmp', path)
+
+    def day_aggregates(self, start: str = None, end: str = None):
+        days = timeutil.cob_dates(self.journal_dir, start, end)
+        aggregates = {}
+        stale = {}
+        for cob_date in days:
+            sources = day_sources(self.journal_dir, cob_date, self.conf)
+            ## json turns the stamp's tuples into lists, compare in that form
+            stamp = json.loads(json.dumps(source_stamp(sources)))
+            cached = self.__cached(cob_date, stamp)
+            if cached is None:
+                stale[cob_date] = (sources, stamp)
+            else:
+                aggregates[cob_date] = cached
+        if len(stale) > 1 and self.workers != 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = {d: pool.submit(aggregate_day, d, s) for d, (s, _) in stale.items()}
+                parsed = {d: f.result() for d, f in futures.items()}
+        else:
+            parsed = {d: aggregate_day(d, s) for d, (s, _) in stale.items()}
+        for cob_date, aggregate in parsed.items():
+            self.__save(cob_date, stale[cob_date][1], aggregate)
+            aggregates[cob_date] = aggregate
+        self.parsed = len(parsed)
+        logger.info(f'{len(days)} days, {len(parsed)} parsed, {len(days) - len(parsed)} from cache')
+        return [aggregates[d] for d in days]
+
+    def run(self, start: str = None, end: str = None):
+        """
+        :return: dict of DataFrames: by_version, by_strategy, by_ticker and by_day
+        """
+        days = self.day_aggregates(start, end)
+        merged = {d: {} for d in DIMENSIONS}
+        trades = {}
+        by_day = {}
+        for day in days:
+            total = by_day[day['cob_date']] = PnlAggregate()
+            for d in DIMENSIONS:
+                for key, values in day[d].items():
+                    a = PnlAggregate.from_values(values)
+                    merged[d].setdefault(key, PnlAggregate()).merge(a)
+                    if d == 'version':
+                        total.merge(a)
+            for version, n in day['trades'].items():
+                trades[version] = trades.get(version, 0) + n
+        report = {f'by_{d}': to_frame(merged[d], d).sort_values('gross_pnl', ascending=False) for d in DIMENSIONS}
+        report['by_version']['trades'] = report['by_version'].index.map(lambda v: trades.get(v, 0))
+        report['by_day'] = to_frame(by_day, 'cob_date')
+        return report
+
+
+def to_frame(aggregates: dict, name: str):
+    """
+    :param aggregates: key -> PnlAggregate
+    :return: one row per key of PnlAggregate.to_dict()
+    """
+    df = pd.DataFrame.from_dict({key: a.to_dict() for key, a in aggregates.items()}, orient='index',
+                                columns=list(PnlAggregate().to_dict()))
+    df.index.name = name
+    return df
+
+
+if __name__ == "__main__":
+    conf = Config()
+    parser = argparse.ArgumentParser(description='PnL over a period of journal days')
+    parser.add_argument('--journal-dir', default=conf.journal_dir)
+    parser.add_argument('--cache-dir', default=conf.period_report_cache_dir)
+    parser.add_argument('--start', help='first cob date YYYYMMDD')
+    parser.add_argument('--end', help='last cob date YYYYMMDD')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', help='directory to write the reports to as csv')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    rpt = PeriodReport(args.journal_dir, args.cache_dir, args.workers, conf).run(args.start, args.end)
+    for name, df in rpt.items():
+        print(f'\n== {name}')
+        print(df.to_string())
+        if args.out:
+            if not os.path.exists(args.out):
+                os.makedirs(args.out)
+            df.to_csv(f'{args.out}{os.sep}{name}.csv')
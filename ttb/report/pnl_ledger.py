@@ -0,0 +1,164 @@
+import numpy as np
+
+from ttb.data.pnl_type import PnlType
+
+NUMERIC_COLUMNS = ('price_bought', 'price_sold', 'qty', 'price_chg_pct', 'pnl', 'transc_amt')
+CODED_COLUMNS = ('ticker', 'version', 'buy_strategy', 'sell_strategy')
+TEXT_COLUMNS = ('time_bought', 'time_sold', 'alert_buy_ts', 'alert_sell_ts')
+
+
+class PnlAggregate:
+    __slots__ = ('count', 'wins', 'losses', 'gross_pnl', 'transc_amt', 'sum_pct')
+
+    def __init__(self):
+        self.count = 0
+        self.wins = 0
+        self.losses = 0
+        self.gross_pnl = 0.0
+        self.transc_amt = 0.0
+        self.sum_pct = 0.0
+
+    def add(self, pnl: float, amt: float, pct: float):
+        self.count += 1
+        self.wins += pct > 0
+        self.losses += pct < 0
+        self.gross_pnl += pnl
+        self.transc_amt += amt
+        self.sum_pct += pct
+
+    def add_pnl(self, pnl: dict):
+        """
+        :param pnl: PNL event dict as published by the BotManagers (or read back from the pnl journal)
+        """
+        price_b = float(pnl['price_bought'])
+        qty = float(pnl['qty'])
+        self.add((float(pnl['price_sold']) - price_b) * qty, price_b * qty, float(pnl['price_chg_pct']))
+
+    def merge(self, other):
+        for field in self.__slots__:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def values(self):
+        """
+        :return: the raw sums in __slots__ order, e.g. to cache them as JSON
+        """
+        return [getattr(self, field) for field in self.__slots__]
+
+    @classmethod
+    def from_values(cls, values: list):
+        agg = cls()
+        for field, v in zip(cls.__slots__, values):
+            setattr(agg, field, v)
+        return agg
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count if self.count else 0.0
+
+    @property
+    def avg_pct(self):
+        return self.sum_pct / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return dict(count=self.count, wins=self.wins, losses=self.losses, win_rate=round(self.win_rate, 4),
+                    gross_pnl=round(self.gross_pnl, 2), transc_amt=round(self.transc_amt, 2),
+                    avg_pct=round(self.avg_pct, 4))
+
+
+class PnlLedger:
+    """
+    Realized and unrealized PnL rows of the day stored column-wise.
+
+    Numeric columns are NumPy float arrays, ticker/version/strategy columns are int codes into a shared vocabulary,
+    time stamps are kept as lists. Arrays are preallocated and grow by doubling. Aggregates per version, per
+    strategy and in total are updated on append, so statistics never rescan the rows.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.capacity = capacity
+        self.num = {c: np.zeros(capacity) for c in NUMERIC_COLUMNS}
+        self.codes = {c: np.zeros(capacity, dtype=np.int32) for c in CODED_COLUMNS}
+        self.pnl_type = np.zeros(capacity, dtype=np.int8)
+        self.text = {c: [] for c in TEXT_COLUMNS}
+        self.vocab = []
+        self.__vocab_idx = {}
+        self.total = PnlAggregate()
+        self.by_version = {}
+        self.by_strategy = {}
+
+    def __len__(self):
+        return self.size
+
+    def __code(self, value):
+        code = self.__vocab_idx.get(value)
+        if code is None:
+            code = len(self.vocab)
+            self.vocab.append(value)
+            self.__vocab_idx[value] = code
+        return code
+
+    def __grow(self):
+        self.capacity *= 2
+        for cols in (self.num, self.codes):
+            for c, arr in cols.items():
+                cols[c] = np.resize(arr, self.capacity)
+        self.pnl_type = np.resize(self.pnl_type, self.capacity)
+
+    def append(self, pnl: dict):
+        """
+        :param pnl: PNL event dict as published by the BotManagers
+        """
+        if self.size == self.capacity:
+            self.__grow()
+        i = self.size
+        price_b = float(pnl['price_bought'])
+        price_s = float(pnl['price_sold'])
+        qty = float(pnl['qty'])
+        pct = float(pnl['price_chg_pct'])
+        version = pnl.get('version') or 'UNKOWN'
+        buy_strategy = pnl.get('buy_strategy') or pnl.get('buy_scanner')
+        values = dict(price_bought=price_b, price_sold=price_s, qty=qty, price_chg_pct=pct,
+                      pnl=(price_s - price_b) * qty, transc_amt=price_b * qty)
+        for c, v in values.items():
+            self.num[c][i] = v
+        self.codes['ticker'][i] = self.__code(pnl['ticker'])
+        self.codes['version'][i] = self.__code(version)
+        self.codes['buy_strategy'][i] = self.__code(buy_strategy)
+        self.codes['sell_strategy'][i] = self.__code(pnl.get('sell_strategy') or pnl.get('sell_scanner'))
+        self.pnl_type[i] = PnlType[pnl['pnl_type']].value
+        for c in TEXT_COLUMNS:
+            self.text[c].append(pnl.get(c))
+        self.size += 1
+
+        for agg in (self.total, self.by_version.setdefault(version, PnlAggregate()),
+                    self.by_strategy.setdefault(buy_strategy, PnlAggregate())):
+            agg.add(values['pnl'], values['transc_amt'], pct)
+
+    def columns(self):
+        """
+        :return: dict of column -> array (views of the filled part, codes decoded for the text like columns)
+        """
+        n = self.size
+        vocab = np.array(self.vocab, dtype=object)
+        cols = {c: self.num[c][:n] for c in NUMERIC_COLUMNS}
+        for c in CODED_COLUMNS:
+            cols[c] = vocab[self.codes[c][:n]] if n else np.empty(0, dtype=object)
+        for c in TEXT_COLUMNS:
+            cols[c] = np.array(self.text[c], dtype=object)
+        cols['pnl_type'] = np.array([t.name for t in PnlType], dtype=object)[self.pnl_type[:n] - 1]
+        return cols
+
+    def records(self):
+        """
+        :return: rows as PNL dicts
+        """
+        cols = self.columns()
+        return [{c: (v[i].item() if isinstance(v, np.ndarray) and v.dtype != object else v[i])
+                 for c, v in cols.items()} for i in range(self.size)]
+
+    def summary(self):
+        return dict(total=self.total.to_dict(),
+                    by_version={k: v.to_dict() for k, v in self.by_version.items()},
+                    by_strategy={k: v.to_dict() for k, v in self.by_strategy.items()})
@@ -1,56 +1,161 @@
+import logging
 import os
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
-import openpyxl
+from openpyxl import Workbook
 
 d_fmt = "%Y%m%d"
 
 from ttb.cfg.config import Config
+from ttb.util import trace
+
+logger = logging.getLogger(__name__)
 
 PNL_RPT_HEADER = ['ticker', 'price_bought', 'price_sold', 'qty', 'price_chg_%', 'PNL', 'transc_amt', 'time_bought', 'time_sold','alert_buy_ts','alert_sell_ts',  'buy_scanner', 'sell_scanner', 'pnl_type', 'pnl_count']
+SUMMARY_HEADER = ['version', 'count', 'wins', 'losses', 'win_rate', 'PNL', 'transc_amt', 'avg_chg_%']
+LATENCY_HEADER = ['stage', 'count', 'avg_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+## PNL journal/ledger columns the report is built from
+SOURCE_COLUMNS = ('version', 'ticker', 'price_bought', 'price_sold', 'qty', 'price_chg_pct', 'time_bought',
+                  'time_sold', 'alert_buy_ts', 'alert_sell_ts', 'buy_strategy', 'sell_strategy', 'pnl_type')
+
+
 class PnlReporter:
     def __init__(self, config: Config = None):
         self.conf = config or Config()
         self.__today = self.conf.date_today
         self.output_dir = f'{self.conf.report_out_dir}{os.sep}{self.__today}'
         self.pnl_file_name = "pnl_report"
+        self.formats = self.conf.report_formats
 
-    def gen_report(self, data: list):
-        rpt_data = transform(data)
+    def gen_report(self, data, formats=None, latency: list = None):
+        """
+        :param data: PnL rows as a list of dicts or as columns (dict of column -> array, see PnlLedger.columns)
+        :param formats: any of 'xlsx', 'csv', 'parquet', defaults to config report_formats
+        :param latency: per execution latency breakdowns (ttb.util.trace.breakdown), summarized in a latency sheet
+        :return: list of files written
+        """
+        df = transform(data)
+        summary = summarize(df)
+        latency_summary = summarize_latency(latency) if latency else None
         report_time = datetime.now().strftime("%Y%m%d%H%M")
-        out_file = f'{self.output_dir}/{self.pnl_file_name}_{report_time}.xlsx'
+        out_file = f'{self.output_dir}/{self.pnl_file_name}_{report_time}'
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
-        with pd.ExcelWriter(out_file) as writer:
-            for version, v_data in rpt_data.items():
-                df = pd.DataFrame(v_data, columns=PNL_RPT_HEADER)
-                df.to_excel(writer, sheet_name=f'{version}')
-                ##df2.to_excel(writer, sheet_name='sheet2')
-
-
-def transform(data: list):
-    rs = {}
-    for r in data:
-        price_b = float(r['price_bought'])
-        price_s = float(r['price_sold'])
-        qty = float(r['qty'])
-        version = r.get('version') or 'UNKOWN'
-        rs.setdefault(version, list()).append([
-            r['ticker'],
-            price_b,
-            price_s,
-            qty,
-            r['price_chg_pct'],
-            (price_s - price_b) * qty,
-            price_b * qty,
-            r['time_bought'],
-            r['time_sold'],
-            r['alert_buy_ts'],
-            r['alert_sell_ts'],
-            r['buy_strategy'],
-            r['sell_strategy'],
-            r['pnl_type'],
-            1 if r['price_chg_pct'] > 0 else -1 if r['price_chg_pct'] < 0 else 0
-        ])
-    return rs
+        written = []
+        for fmt in formats or self.formats:
+            if fmt == 'xlsx':
+                write_excel(f'{out_file}.xlsx', df, summary, latency_summary)
+            elif fmt == 'csv':
+                df.to_csv(f'{out_file}.csv', index=False)
+                summary.to_csv(f'{out_file}_summary.csv', index=False)
+                if latency_summary is not None:
+                    latency_summary.to_csv(f'{out_file}_latency.csv', index=False)
+            elif fmt == 'parquet':
+                try:
+                    df.to_parquet(f'{out_file}.parquet', index=False)
+                except ImportError:
+                    logger.warning('parquet needs pyarrow or fastparquet, report not written as parquet')
+                    continue
+            else:
+                logger.warning(f'unknown report format: {fmt}')
+                continue
+            written.append(f'{out_file}.{fmt}')
+        logger.info(f'reports written: {written}')
+        return written
+
+
+def transform(data):
+    """
+    Build the report frame column-wise: PNL, transc_amt and pnl_count are computed over whole columns.
+
+    :param data: PnlLedger.columns() (column -> array) or a list of PNL dicts, of which only the report's
+                 columns are picked
+    :return: DataFrame with a version column followed by the PNL_RPT_HEADER columns
+    """
+    if isinstance(data, list):
+        cols = {c: [r.get(c) for r in data] for c in SOURCE_COLUMNS}
+    else:
+        cols = dict(data)
+    if not len(cols.get('ticker', ())):
+        return pd.DataFrame(columns=['version'] + PNL_RPT_HEADER)
+    price_b = np.asarray(cols['price_bought'], dtype=np.float64)
+    price_s = np.asarray(cols['price_sold'], dtype=np.float64)
+    qty = np.asarray(cols['qty'], dtype=np.float64)
+    pct = np.asarray(cols['price_chg_pct'], dtype=np.float64)
+    version = cols.get('version')
+    version = pd.Series(version, dtype=object).fillna('UNKOWN').to_numpy() if version is not None else 'UNKOWN'
+    return pd.DataFrame({
+        'version': version,
+        'ticker': cols['ticker'],
+        'price_bought': price_b,
+        'price_sold': price_s,
+        'qty': qty,
+        'price_chg_%': pct,
+        'PNL': (price_s - price_b) * qty,
+        'transc_amt': price_b * qty,
+        'time_bought': cols['time_bought'],
+        'time_sold': cols['time_sold'],
+        'alert_buy_ts': cols.get('alert_buy_ts'),
+        'alert_sell_ts': cols.get('alert_sell_ts'),
+        'buy_scanner': cols['buy_strategy'],
+        'sell_scanner': cols['sell_strategy'],
+        'pnl_type': cols['pnl_type'],
+        ## rows without a % change (NaN) count as neither win nor loss
+        'pnl_count': np.sign(np.nan_to_num(pct, nan=0.0)).astype(np.int64),
+    })
+
+
+def summarize(df: pd.DataFrame):
+    """
+    :return: one row per version: count, wins, losses, win rate, PNL, transc_amt and average % change
+    """
+    if df.empty:
+        return pd.DataFrame(columns=SUMMARY_HEADER)
+    g = df.assign(wins=df['pnl_count'] > 0, losses=df['pnl_count'] < 0).groupby('version', sort=True)
+    summary = g.agg(count=('PNL', 'size'), wins=('wins', 'sum'), losses=('losses', 'sum'), PNL=('PNL', 'sum'),
+                    transc_amt=('transc_amt', 'sum'), **{'avg_chg_%': ('price_chg_%', 'mean')})
+    summary['win_rate'] = summary['wins'] / summary['count']
+    return summary.reset_index()[SUMMARY_HEADER]
+
+
+def summarize_latency(latency: list):
+    """
+    :param latency: per execution breakdowns, ms per stage plus 'pipeline' and 'total' (both up to the execution,
+                    as in the trace journal)
+    :return: one row per stage in pipeline order: count, average and p50/p95/p99/max in ms
+    """
+    df = pd.DataFrame(latency)
+    rows = []
+    for stage in trace.STAGES[1:] + ('pipeline', 'total'):
+        if stage not in df:
+            continue
+        ms = df[stage].dropna().to_numpy(dtype=np.float64)
+        if len(ms):
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            rows.append([stage, len(ms), ms.mean(), p50, p95, p99, ms.max()])
+    return pd.DataFrame(rows, columns=LATENCY_HEADER).round(3)
+
+
+def write_excel(out_file: str, df: pd.DataFrame, summary: pd.DataFrame, latency_summary: pd.DataFrame = None):
+    """
+    Stream the rows into a write-only workbook, one sheet per version plus a summary and a latency sheet.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('summary')
+    ws.append(SUMMARY_HEADER)
+    for row in summary.itertuples(index=False, name=None):
+        ws.append(row)
+    if latency_summary is not None:
+        ws = wb.create_sheet('latency')
+        ws.append(LATENCY_HEADER)
+        for row in latency_summary.itertuples(index=False, name=None):
+            ws.append(row)
+    for version, v_data in df.groupby('version', sort=True):
+        ws = wb.create_sheet(f'{version}'[:31])
+        ws.append(PNL_RPT_HEADER)
+        for row in v_data[PNL_RPT_HEADER].itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(out_file)
+
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from ttb.trading.request_scheduler import Priority
+
+logger = logging.getLogger(__name__)
+
+
+class _InFlight:
+    def __init__(self, priority: Priority):
+        self.priority = priority
+        self.done = threading.Event()
+        self.quotes = {}
+
+
+class QuoteCache:
+    """
+    Quote cache with a freshness TTL and LRU eviction, in front of a quote source (e.g. TosTrader.get_quotes).
+
+    Symbols with a quote younger than `ttl_seconds` are served from memory. Symbols already being fetched by
+    another thread at the same or a more urgent priority are not requested again, the caller waits for that fetch
+    instead (and fetches itself if it times out); a less urgent fetch may be queued behind the broker throttle, so
+    it is not waited for. Everything else is fetched in one upstream call. A TTL <= 0 disables caching (replays,
+    where quotes depend on the simulated time).
+    """
+
+    def __init__(self, fetch, ttl_seconds: float = 1.0, max_size: int = 1000, wait_timeout_seconds: float = 10):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.wait_timeout_seconds = wait_timeout_seconds
+        self.__cache = OrderedDict()  ## symbol -> (fetched_at, quote)
+        self.__in_flight = {}  ## symbol -> _InFlight
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.hit_age_total = 0.0
+        self.hit_age_max = 0.0
+
+    def get_quotes(self, symbols: list, **kwargs):
+        """
+        :param kwargs: passed to the upstream fetch on a miss (priority, Priority.TRADE if not given)
+        :return: dict of symbol -> quote, symbols without a quote are left out
+        """
+        priority = kwargs.get('priority', Priority.TRADE)
+        rs = {}
+        to_fetch = []
+        waits = {}
+        with self.__lock:
+            now = time.monotonic()
+            for s in dict.fromkeys(symbols):
+                entry = self.__cache.get(s)
+                if entry and self.ttl_seconds > 0 and now - entry[0] <= self.ttl_seconds:
+                    age = now - entry[0]
+                    self.hits += 1
+                    self.hit_age_total += age
+                    self.hit_age_max = max(self.hit_age_max, age)
+                    self.__cache.move_to_end(s)
+                    rs[s] = entry[1]
+                elif s in self.__in_flight and self.__in_flight[s].priority <= priority:
+                    self.coalesced += 1
+                    waits[s] = self.__in_flight[s]
+                else:
+                    self.misses += 1
+                    to_fetch.append(s)
+            flight = self.__register(to_fetch, priority)
+
+        if to_fetch:
+            rs.update(self.__fetch(to_fetch, flight, kwargs))
+
+        missed = []
+        for s, other in waits.items():
+            if not other.done.wait(self.wait_timeout_seconds):
+                missed.append(s)
+            elif s in other.quotes:
+                rs[s] = other.quotes[s]
+        if missed:
+            logger.warning(f'concurrent request for {missed} timed out, fetching them')
+            with self.__lock:
+                flight = self.__register(missed, priority)
+            rs.update(self.__fetch(missed, flight, kwargs))
+        return rs
+
+    def __register(self, symbols, priority):
+        """
+        Make a fetch the in-flight request of the symbols, concurrent callers of the same or a less urgent priority
+        wait for it. Called under the lock.
+        """
+        flight = _InFlight(priority)
+        for s in symbols:
+            self.__in_flight[s] = flight
+        return flight
+
+    def __fetch(self, symbols, flight, kwargs):
+        try:
+            flight.quotes = self.fetch(symbols, **kwargs) or {}
+        finally:
+            with self.__lock:
+                fetched_at = time.monotonic()
+                for s in symbols:
+                    ## a more urgent caller may have taken the symbol over meanwhile
+                    if self.__in_flight.get(s) is flight:
+                        del self.__in_flight[s]
+                for s, q in flight.quotes.items():
+                    self.__cache[s] = (fetched_at, q)
+                    self.__cache.move_to_end(s)
+                while len(self.__cache) > self.max_size:
+                    self.__cache.popitem(last=False)
+            flight.done.set()
+        return flight.quotes
+
+    def invalidate(self, symbol=None):
+        with self.__lock:
+            if symbol:
+                self.__cache.pop(symbol, None)
+            else:
+                self.__cache.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses + self.coalesced
+        return dict(
+            size=len(self.__cache),
+            hits=self.hits,
+            misses=self.misses,
+            coalesced=self.coalesced,
+            hit_rate=round(self.hits / requests, 4) if requests else 0,
+            avg_hit_age_ms=round(1000 * self.hit_age_total / self.hits, 1) if self.hits else 0,
+            max_hit_age_ms=round(1000 * self.hit_age_max, 1),
+        )
@@ -0,0 +1,88 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from enum import IntEnum
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    TRADE = 0
+    EOD = 1
+    WATCHLIST = 2
+    INDICATORS = 3
+    HISTORY = 4
+
+
+class RequestScheduler:
+    """
+    Token bucket shared by all broker API calls.
+
+    Callers block in `acquire` until a token is available. Waiting callers are served by priority (then FIFO),
+    so trade-path quotes go out before EOD marking, watchlist syncs, indicator polls and history downloads queued at
+    the same time.
+    """
+
+    def __init__(self, rate_per_minute: int = 120, burst: int = 10):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.__tokens = float(self.capacity)
+        self.__last_refill = time.monotonic()
+        self.__cond = threading.Condition()
+        self.__waiters = []
+        self.__seq = itertools.count()
+        self.__depth = {p: 0 for p in Priority}
+        self.__count = {p: 0 for p in Priority}
+        self.__wait_total = {p: 0.0 for p in Priority}
+        self.__wait_max = {p: 0.0 for p in Priority}
+
+    def acquire(self, priority: Priority = Priority.TRADE):
+        """
+        Block until the caller may send one request.
+
+        :return: seconds spent waiting
+        """
+        with self.__cond:
+            entry = (priority, next(self.__seq))
+            heapq.heappush(self.__waiters, entry)
+            self.__depth[priority] += 1
+            start = time.monotonic()
+            while True:
+                self.__refill()
+                if self.__waiters[0] == entry:
+                    if self.__tokens >= 1:
+                        break
+                    self.__cond.wait((1 - self.__tokens) / self.rate)
+                else:
+                    self.__cond.wait()
+            heapq.heappop(self.__waiters)
+            self.__tokens -= 1
+            self.__depth[priority] -= 1
+            waited = time.monotonic() - start
+            self.__count[priority] += 1
+            self.__wait_total[priority] += waited
+            self.__wait_max[priority] = max(self.__wait_max[priority], waited)
+            self.__cond.notify_all()
+        if waited > 1:
+            logger.info(f'{priority.name} request throttled for {waited:.2f} seconds')
+        return waited
+
+    def __refill(self):
+        now = time.monotonic()
+        self.__tokens = min(self.capacity, self.__tokens + (now - self.__last_refill) * self.rate)
+        self.__last_refill = now
+
+    def queue_depth(self, priority: Priority = None):
+        with self.__cond:
+            return self.__depth[priority] if priority is not None else len(self.__waiters)
+
+    def stats(self):
+        with self.__cond:
+            return {p.name: dict(requests=self.__count[p],
+                                 queued=self.__depth[p],
+                                 avg_wait_ms=round(1000 * self.__wait_total[p] / self.__count[p], 1)
+                                 if self.__count[p] else 0,
+                                 max_wait_ms=round(1000 * self.__wait_max[p], 1))
+                    for p in Priority}
@@ -0,0 +1,250 @@
+import datetime
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+import requests
+
+from ttb.cfg.config import Config
+from ttb.trading.request_scheduler import Priority, RequestScheduler
+from ttb.trading.td_client import TosTrader
+from ttb.util.clock import Clock
+
+logger = logging.getLogger(__name__)
+
+SIM_ACCOUNT = 'SIM000001'
+SECONDS_PER_YEAR = 252 * 6.5 * 3600
+
+
+class LatencyModel:
+    """
+    Response time distribution given as '<kind>:<args in ms>':
+    'fixed:20', 'uniform:10:50', 'normal:30:10' (mean, sd) or 'lognormal:30:10' (mean, sd of the latency itself).
+    """
+
+    def __init__(self, spec: str, seed: int = None):
+        parts = spec.split(':')
+        self.kind = parts[0]
+        self.args = [float(a) / 1000 for a in parts[1:]]
+        self.__rnd = random.Random(seed)
+        if self.kind == 'lognormal':
+            mean, sd = self.args
+            sigma2 = np.log(1 + (sd / mean) ** 2)
+            self.__mu, self.__sigma = np.log(mean) - sigma2 / 2, np.sqrt(sigma2)
+        elif self.kind not in ('fixed', 'uniform', 'normal'):
+            raise ValueError(f'unknown latency distribution: {spec}')
+
+    def sample(self):
+        """
+        :return: seconds
+        """
+        if self.kind == 'fixed':
+            return self.args[0]
+        if self.kind == 'uniform':
+            return self.__rnd.uniform(*self.args)
+        if self.kind == 'normal':
+            return max(self.__rnd.gauss(*self.args), 0.0)
+        return self.__rnd.lognormvariate(self.__mu, self.__sigma)
+
+
+class PricePaths:
+    """
+    Deterministic geometric Brownian motion price path per symbol, one step per second from midnight of the
+    start day. The path of a symbol only depends on the seed and the symbol, so runs are reproducible.
+    """
+
+    def __init__(self, seed: int = 7, volatility: float = 0.4, start: datetime.datetime = None):
+        self.seed = seed
+        self.sigma = volatility / np.sqrt(SECONDS_PER_YEAR)
+        start = start or datetime.datetime.now()
+        self.t0 = datetime.datetime(start.year, start.month, start.day).timestamp()
+        self.__paths = {}
+        self.__lock = threading.Lock()
+
+    def __path(self, symbol, n):
+        with self.__lock:
+            path = self.__paths.get(symbol)
+            if path is None or len(path) < n:
+                rng = np.random.default_rng([self.seed, zlib.crc32(symbol.encode())])
+                p0 = rng.uniform(5, 300)
+                ## regenerate the whole path from the seed, a longer path keeps the same prefix
+                size = max(n, 2 * len(path) if path is not None else 24 * 3600)
+                steps = rng.standard_normal(size) * self.sigma - self.sigma ** 2 / 2
+                path = np.round(p0 * np.exp(np.cumsum(steps)), 2)
+                self.__paths[symbol] = path
+            return path
+
+    def price(self, symbol: str, t: float):
+        i = max(int(t - self.t0), 0)
+        return float(self.__path(symbol, i + 1)[i])
+
+    def candles(self, symbol: str, end: float, minutes: int):
+        """
+        :return: TD style 1 minute candles of the `minutes` before `end`
+        """
+        end_i = max(int(end - self.t0), 0)
+        start_i = max(end_i - minutes * 60, 0)
+        path = self.__path(symbol, end_i + 1)
+        candles = []
+        for i in range(start_i, end_i - 59, 60):
+            bar = path[i:i + 60]
+            candles.append(dict(open=float(bar[0]), high=float(bar.max()), low=float(bar.min()),
+                                close=float(bar[-1]), volume=1000 * (1 + i % 7),
+                                datetime=int((self.t0 + i) * 1000)))
+        return candles
+
+
+class SimSession:
+    """
+    Stands in for TDSession: answers the TD REST endpoints TosTrader uses from memory, after a sampled
+    latency, with injected errors (error_rate, HTTP 500) and the broker's rate limit (HTTP 429). Requests are
+    throttled by the client side RequestScheduler first, like the real session.
+    """
+
+    def __init__(self, prices: PricePaths, clock: Clock = None, latency: LatencyModel = None,
+                 error_rate: float = 0.0, rate_limit_per_minute: int = 120, scheduler: RequestScheduler = None,
+                 seed: int = None):
+        self.prices = prices
+        self.clock = clock or Clock()
+        self.latency = latency or LatencyModel('fixed:0')
+        self.error_rate = error_rate
+        self.scheduler = scheduler or RequestScheduler()
+        self.__rate = rate_limit_per_minute / 60.0
+        self.__tokens = float(rate_limit_per_minute)
+        self.__last_refill = time.monotonic()
+        self.__rnd = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__watchlists = {}
+        self.__volumes = {}
+        self.counts = {}
+        self.errors = 0
+        self.rate_limited = 0
+        self.latency_total = 0.0
+        self.routes = [
+            ('GET', re.compile(r'marketdata/quotes'), self.__quotes),
+            ('GET', re.compile(r'marketdata/(?P<symbol>[^/]+)/pricehistory'), self.__price_history),
+            ('GET', re.compile(r'instruments/(?P<cusip>[^/]+)'), self.__instrument),
+            ('GET', re.compile(r'accounts'), self.__accounts),
+            ('GET', re.compile(r'accounts/(?P<account>[^/]+)/watchlists'), self.__watchlist_list),
+            ('GET', re.compile(r'accounts/(?P<account>[^/]+)/watchlists/(?P<wl_id>[^/]+)'), self.__watchlist),
+            ('POST', re.compile(r'accounts/(?P<account>[^/]+)/watchlists'), self.__create_watchlist),
+        ]
+
+    def login(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get(self, endpoint: str, params: dict = None, priority: Priority = Priority.TRADE):
+        return self.request('GET', endpoint, params=params, priority=priority)
+
+    def post(self, endpoint: str, json_body: dict = None, priority: Priority = Priority.TRADE):
+        return self.request('POST', endpoint, json_body=json_body, priority=priority)
+
+    def request(self, method: str, endpoint: str, params: dict = None, json_body: dict = None,
+                priority: Priority = Priority.TRADE):
+        self.scheduler.acquire(priority)
+        delay = self.latency.sample()
+        time.sleep(delay)
+        with self.__lock:
+            self.counts[endpoint.split('/')[0]] = self.counts.get(endpoint.split('/')[0], 0) + 1
+            self.latency_total += delay
+            if not self.__take_token():
+                self.rate_limited += 1
+                raise self.__http_error(429, method, endpoint)
+            if self.error_rate and self.__rnd.random() < self.error_rate:
+                self.errors += 1
+                raise self.__http_error(500, method, endpoint)
+            for m, pattern, handler in self.routes:
+                match = pattern.fullmatch(endpoint)
+                if m == method and match:
+                    return handler(params=params or {}, body=json_body, **match.groupdict())
+        raise self.__http_error(404, method, endpoint)
+
+    def __take_token(self):
+        now = time.monotonic()
+        self.__tokens = min(self.__tokens + (now - self.__last_refill) * self.__rate, self.__rate * 60)
+        self.__last_refill = now
+        if self.__tokens < 1:
+            return False
+        self.__tokens -= 1
+        return True
+
+    @staticmethod
+    def __http_error(status, method, endpoint):
+        resp = requests.Response()
+        resp.status_code = status
+        resp.url = endpoint
+        return requests.HTTPError(f'{status} Error: simulated for {method} {endpoint}', response=resp)
+
+    def __quotes(self, params, body):
+        t = self.clock.time()
+        quotes = {}
+        for symbol in params.get('symbol', '').split(','):
+            if not symbol:
+                continue
+            p = self.prices.price(symbol, t)
+            volume = self.__volumes[symbol] = self.__volumes.get(symbol, 0) + 100 * self.__rnd.randint(1, 50)
+            quotes[symbol] = dict(symbol=symbol, lastPrice=p, bidPrice=round(p - 0.01, 2),
+                                  askPrice=round(p + 0.01, 2), totalVolume=volume,
+                                  quoteTimeInLong=int(t * 1000))
+        return quotes
+
+    def __price_history(self, params, body, symbol):
+        candles = self.prices.candles(symbol, self.clock.time(), 390)
+        if params and 'startDate' in params:
+            candles = [c for c in candles if c['datetime'] >= int(params['startDate'])]
+        return dict(candles=candles, symbol=symbol, empty=not candles)
+
+    def __instrument(self, params, body, cusip):
+        return [dict(cusip=cusip, symbol=cusip, description=f'simulated {cusip}', exchange='SIM',
+                     assetType='EQUITY')]
+
+    def __accounts(self, params, body):
+        return [{'securitiesAccount': {'type': 'CASH', 'accountId': SIM_ACCOUNT}}]
+
+    def __watchlist_list(self, params, body, account):
+        return [dict(wl) for wl in self.__watchlists.values() if wl['accountId'] == account]
+
+    def __watchlist(self, params, body, account, wl_id):
+        return self.__watchlists.get(wl_id)
+
+    def __create_watchlist(self, params, body, account):
+        wl_id = str(len(self.__watchlists) + 1)
+        self.__watchlists[wl_id] = dict(name=body['name'], watchlistId=wl_id, accountId=account,
+                                        watchlistItems=body.get('watchlistItems') or [])
+        return None
+
+    def stats(self):
+        with self.__lock:
+            n = sum(self.counts.values())
+            return dict(requests=self.counts, errors=self.errors, rate_limited=self.rate_limited,
+                        avg_latency_ms=round(1000 * self.latency_total / n, 3) if n else 0.0)
+
+
+class SimTosTrader(TosTrader):
+    """
+    TosTrader on a SimSession: the full TosTrader surface without a TD account, see the sim_* settings.
+    """
+
+    def __init__(self, config=None, clock: Clock = None):
+        conf = config or Config()
+        clock = clock or Clock()
+        session = SimSession(
+            prices=PricePaths(seed=conf.sim_seed, volatility=conf.sim_volatility, start=clock.now()),
+            clock=clock,
+            latency=LatencyModel(conf.sim_latency, seed=conf.sim_seed),
+            error_rate=conf.sim_error_rate,
+            rate_limit_per_minute=conf.sim_rate_limit_per_minute,
+            scheduler=RequestScheduler(conf.td_rate_limit_per_minute, conf.td_rate_limit_burst),
+            seed=conf.sim_seed,
+        )
+        super().__init__(conf, session=session)
+
+    def sim_stats(self):
+        return self.session.stats()
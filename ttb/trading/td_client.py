@@ -1,43 +1,84 @@
 import time
 
-from td.client import TDClient
-
 from ttb.cfg.config import Config
-from ttb.trading import watchlist_utils
+from ttb.trading.request_scheduler import Priority, RequestScheduler
+from ttb.trading.td_session import TDSession
+
+
+def create_trader(conf: Config, clock=None):
+    """
+    :return: the broker selected by the broker setting, 'td' (TosTrader) or 'sim' (SimTosTrader)
+    """
+    if conf.broker == 'sim':
+        from ttb.trading.sim_broker import SimTosTrader
+        return SimTosTrader(conf, clock=clock)
+    return TosTrader(conf)
 
 
 class TosTrader:
-    def __init__(self, config=None):
+    def __init__(self, config=None, session=None):
         self.conf = config or Config()
         self.long_pos_wl_name = self.conf.long_watch_list_name
         self.__wl_id = None
         self.__wl_inst_cache = None
-        self.tdClient = TDClient(
+        self.session = session or TDSession(
             client_id=self.conf.td_client_id,
             redirect_uri=self.conf.td_call_back_url,
-            credentials_path=self.conf.td_credentials_path
+            credentials_path=self.conf.td_credentials_path,
+            api_url=self.conf.td_api_url,
+            refresh_margin_seconds=self.conf.td_token_refresh_margin_seconds,
+            pool_size=self.conf.td_http_pool_size,
+            scheduler=RequestScheduler(self.conf.td_rate_limit_per_minute, self.conf.td_rate_limit_burst),
         )
-        # self.tdSession.login()
 
-    def get_quotes(self, instruments: list):
-        self.tdClient.login()
-        return self.tdClient.get_quotes(instruments=instruments)
+    def login(self):
+        self.session.login()
+
+    def close(self):
+        self.session.close()
+
+    def request_stats(self):
+        return self.session.scheduler.stats()
 
-    def get_price_history(self, symbol, ):
-        return self.tdClient.get_price_history(symbol, period_type="day")
+    def get_quotes(self, instruments: list, priority: Priority = Priority.TRADE):
+        return self.session.get('marketdata/quotes', params={'symbol': ','.join(instruments)}, priority=priority)
+
+    def get_price_history(self, symbol, priority: Priority = Priority.HISTORY, start_ts: int = None):
+        """
+        :param start_ts: epoch millis, only the 1 minute bars from then until now; default: the broker's default period
+        """
+        params = {'periodType': 'day'}
+        if start_ts is not None:
+            params.update(frequencyType='minute', frequency=1, startDate=int(start_ts),
+                          endDate=int(time.time() * 1000))
+        return self.session.get(f'marketdata/{symbol}/pricehistory', params=params, priority=priority)
 
     def get_instrument(self, cusip: str):
-        return self.tdClient.get_instruments(cusip)
+        return self.session.get(f'instruments/{cusip}', priority=Priority.HISTORY)
+
+    def get_accounts(self):
+        return self.session.get('accounts', priority=Priority.WATCHLIST)
+
+    def get_watchlist_accounts(self, account):
+        return self.session.get(f'accounts/{account}/watchlists', priority=Priority.WATCHLIST)
+
+    def get_watchlist(self, account, watchlist_id):
+        return self.session.get(f'accounts/{account}/watchlists/{watchlist_id}', priority=Priority.WATCHLIST)
+
+    def create_watchlist(self, account, name, watchlistItems):
+        return self.session.post(f'accounts/{account}/watchlists', json_body={'name': name,
+                                                                               'watchlistItems': watchlistItems},
+                                 priority=Priority.WATCHLIST)
 
     def get_account_id(self, type='CASH'):
-        accounts = self.tdClient.get_accounts()
+        accounts = self.get_accounts()
         for acct in accounts:
             if 'securitiesAccount' in acct and acct['securitiesAccount']['type'] == type:
                 return acct['securitiesAccount']['accountId']
         return None
 
     def get_wlid_by_wlname(self, wl_name, account):
-        watch_lists = self.tdClient.get_watchlist_accounts(account=account)
+        watch_lists = self.get_watchlist_accounts(account=account)
         for watch_list in watch_lists:
             if watch_list['name'] == wl_name:
                 return watch_list['watchlistId']
@@ -45,7 +86,7 @@ class TosTrader:
 
     def get_watchlist_instruments(self, wl_name, account):
         instruemnts = []
-        watch_lists = self.tdClient.get_watchlist_accounts(account=account)
+        watch_lists = self.get_watchlist_accounts(account=account)
         for watch_list in watch_lists:
             if watch_list['name'] == wl_name:
                 watch_list_items = watch_list['watchlistItems']
@@ -65,19 +106,22 @@ class TosTrader:
             self.__update_watchlist(symbols, wl_name, watchlst_id, acct)
 
     def __create_new_watchlist(self, symbs, wl_name, acct):
+        ## only the watchlist calls need it, quoting and the offline tools must import without it
+        from ttb.trading import watchlist_utils
         items = watchlist_utils.create_watch_list_items(symbs)
-        self.tdClient.create_watchlist(account='252191256', name=wl_name, watchlistItems=items)
+        self.create_watchlist(account='252191256', name=wl_name, watchlistItems=items)
         self.__wl_inst_cache = set(symbs)
 
     def __update_watchlist(self, symbols, wl_name, wl_id, acct):
         existing_symbols = self.__wl_inst_cache or self._get_symbols_in_wl(watchlst_id=wl_id, acct=acct)
         all_symbols = set(existing_symbols.extend(symbols))
         self.__wl_inst_cache = all_symbols
+        from ttb.trading import watchlist_utils
         items = watchlist_utils.create_watch_list_items(symbols)
-        rs = self.tdClient.create_watchlist(account=acct, name=wl_name, watchlistItems=items)
+        rs = self.create_watchlist(account=acct, name=wl_name, watchlistItems=items)
 
     def _get_symbols_in_wl(self, watchlst_id, acct):
-        wl = self.tdClient.get_watchlist(account=acct, watchlist_id=watchlst_id)
+        wl = self.get_watchlist(account=acct, watchlist_id=watchlst_id)
         rs = set()
         if wl:
             wl_items = wl['watchlistItems']
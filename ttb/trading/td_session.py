@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ttb.trading.request_scheduler import Priority, RequestScheduler
+
+logger = logging.getLogger(__name__)
+
+TD_API_URL = 'https://api.tdameritrade.com/v1'
+CLIENT_ID_SUFFIX = '@AMER.OAUTHAP'
+
+
+class TDSession:
+    """
+    Long lived, authenticated session for the TD Ameritrade REST API.
+
+    Logs in once using the credentials file maintained by td.client.TDClient, keeps track of the access token
+    expiry and refreshes the token in a background thread before it expires. All calls go through one pooled
+    requests.Session so connections are kept alive between calls, and are throttled by a RequestScheduler.
+    """
+
+    def __init__(self, client_id: str, redirect_uri: str, credentials_path: str, api_url: str = TD_API_URL,
+                 refresh_margin_seconds: int = 300, pool_size: int = 10, timeout_seconds: float = 10,
+                 scheduler: RequestScheduler = None):
+        self.client_id = client_id if client_id.endswith(CLIENT_ID_SUFFIX) else client_id + CLIENT_ID_SUFFIX
+        self.redirect_uri = redirect_uri
+        self.credentials_path = credentials_path
+        self.api_url = api_url.rstrip('/')
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.timeout_seconds = timeout_seconds
+        self.scheduler = scheduler or RequestScheduler()
+        self.state = {}
+        self.__lock = threading.RLock()
+        self.__logged_in = False
+        self.__closed = threading.Event()
+        self.__refresher = None
+        self.__http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.__http.mount('https://', adapter)
+        self.__http.mount('http://', adapter)
+
+    @property
+    def access_token_expires_in(self):
+        return self.state.get('access_token_expires_at', 0) - time.time()
+
+    def login(self):
+        if self.__logged_in:
+            return
+        with self.__lock:
+            if self.__logged_in:
+                return
+            self.__load_state()
+            if not self.state.get('refresh_token') or self.state.get('refresh_token_expires_at', 0) < time.time():
+                self.__interactive_login()
+            if self.access_token_expires_in < self.refresh_margin_seconds:
+                self.refresh()
+            self.__logged_in = True
+            self.__refresher = threading.Thread(target=self.__refresh_loop, name='td-token-refresh', daemon=True)
+            self.__refresher.start()
+            logger.info(f'logged in, access token expires in {self.access_token_expires_in:.0f} seconds')
+
+    def refresh(self):
+        with self.__lock:
+            resp = self.__http.post(f'{self.api_url}/oauth2/token', timeout=self.timeout_seconds, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': self.state['refresh_token'],
+                'client_id': self.client_id,
+            })
+            resp.raise_for_status()
+            token = resp.json()
+            now = time.time()
+            self.state['access_token'] = token['access_token']
+            self.state['access_token_expires_at'] = now + token.get('expires_in', 1800)
+            if 'refresh_token' in token:
+                self.state['refresh_token'] = token['refresh_token']
+                self.state['refresh_token_expires_at'] = now + token.get('refresh_token_expires_in', 7776000)
+            self.__save_state()
+            logger.info(f'access token refreshed, expires in {self.access_token_expires_in:.0f} seconds')
+
+    def request(self, method: str, endpoint: str, params: dict = None, json_body: dict = None,
+                priority: Priority = Priority.TRADE):
+        self.login()
+        resp = self.__send(method, endpoint, params, json_body, priority)
+        if resp.status_code == 401:
+            logger.warning(f'{method} {endpoint} unauthorized, refreshing token')
+            self.refresh()
+            resp = self.__send(method, endpoint, params, json_body, priority)
+        resp.raise_for_status()
+        return resp.json() if resp.content else None
+
+    def get(self, endpoint: str, params: dict = None, priority: Priority = Priority.TRADE):
+        return self.request('GET', endpoint, params=params, priority=priority)
+
+    def post(self, endpoint: str, json_body: dict = None, priority: Priority = Priority.TRADE):
+        return self.request('POST', endpoint, json_body=json_body, priority=priority)
+
+    def close(self):
+        self.__closed.set()
+        self.__http.close()
+
+    def __send(self, method, endpoint, params, json_body, priority):
+        self.scheduler.acquire(priority)
+        headers = {'Authorization': f"Bearer {self.state['access_token']}"}
+        return self.__http.request(method, f'{self.api_url}/{endpoint}', params=params, json=json_body,
+                                   headers=headers, timeout=self.timeout_seconds)
+
+    def __refresh_loop(self):
+        while not self.__closed.is_set():
+            wait = max(self.access_token_expires_in - self.refresh_margin_seconds, 1)
+            if self.__closed.wait(wait):
+                break
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('failed to refresh access token, retrying')
+                self.__closed.wait(30)
+
+    def __interactive_login(self):
+        # the OAuth flow (browser, redirect url) is left to TDClient, which saves the tokens to credentials_path
+        from td.client import TDClient
+        TDClient(client_id=self.client_id, redirect_uri=self.redirect_uri,
+                 credentials_path=self.credentials_path).login()
+        self.__load_state()
+
+    def __load_state(self):
+        if os.path.exists(self.credentials_path) and os.path.getsize(self.credentials_path) > 0:
+            with open(self.credentials_path, 'r') as f:
+                self.state = json.load(f)
+
+    def __save_state(self):
+        tmp = f'{self.credentials_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.credentials_path)
@@ -1,23 +1,30 @@
 import logging
 import logging.config
+import os
+
 import yaml
 
-def getLogger(name, level=logging.INFO):
-    #logging.basicConfig(level=level, filename='../../logs/trading_bot.log', format='%(asctime)s - t%(thread)d - %(name)s - %(levelname)s - %(message)s', )
-    ##logging.config('config/')
-    with open('../../config/log_config.yml', 'r') as stream:
-        config = yaml.load(stream, Loader=yaml.FullLoader)
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'config')
+
+
+def __configure(config_file, level):
+    ## log files in the config are relative to ttb/main, where the bots are started from; when run from
+    ## anywhere else (replay, tools) and they cannot be opened, log to the console instead
+    try:
+        with open(os.path.join(CONFIG_DIR, config_file), 'r') as stream:
+            config = yaml.load(stream, Loader=yaml.FullLoader)
+        logging.config.dictConfig(config)
+    except (OSError, ValueError):
+        logging.basicConfig(level=level,
+                            format='%(asctime)s [t%(thread)d] %(name)s - %(levelname)s : %(message)s')
 
-    logging.config.dictConfig(config)
+
+def getLogger(name, level=logging.INFO):
+    __configure('log_config.yml', level)
     logger = logging.getLogger(name)
     return logger
 
 def getLogger_rpa(name, level=logging.INFO):
-    #logging.basicConfig(level=level, filename='../../logs/trading_bot.log', format='%(asctime)s - t%(thread)d - %(name)s - %(levelname)s - %(message)s', )
-    ##logging.config('config/')
-    with open('../../config/log_config_rpa.yml', 'r') as stream:
-        config = yaml.load(stream, Loader=yaml.FullLoader)
-
-    logging.config.dictConfig(config)
+    __configure('log_config_rpa.yml', level)
     logger = logging.getLogger(name)
-    return logger
\ No newline at end of file
+    return logger
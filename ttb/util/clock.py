@@ -0,0 +1,35 @@
+import datetime
+import time
+
+
+class Clock:
+    """
+    Wall clock. The bot asks its clock for the time, so a replay can run it on simulated time.
+    """
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def time(self):
+        return time.time()
+
+
+class SimClock(Clock):
+    """
+    Clock that only moves when told to, e.g. to the time stamp of the alert being replayed.
+    """
+
+    def __init__(self, start: datetime.datetime = None):
+        self.__now = start or datetime.datetime.now()
+
+    def set(self, now: datetime.datetime):
+        self.__now = now
+
+    def advance(self, seconds: float):
+        self.__now += datetime.timedelta(seconds=seconds)
+
+    def now(self):
+        return self.__now
+
+    def time(self):
+        return self.__now.timestamp()
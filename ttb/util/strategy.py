@@ -0,0 +1,15 @@
+import re
+
+## #B4#<version>#, or #B4#[<side or strategy>]#<version># as written by the managers
+VERSION_IN_STRATEGY = re.compile(r'#B4#(?:\[[^\]]*\]#)?(?P<version>[^#\[\]]+)#')
+
+
+def version_of(doc: dict):
+    """
+    Trades journaled before the version was recorded carry it only in the RPA strategy tag (#B4#<version>#).
+    """
+    version = doc.get('version')
+    if not version:
+        m = VERSION_IN_STRATEGY.search(doc.get('strategy') or doc.get('scanner') or '')
+        version = m.group('version') if m else None
+    return version
@@ -2,15 +2,153 @@ import threading
 import time
 import logging
 import gc
+import json
+import math
+import os
 from functools import wraps
 
-from utils.logging import get_logger
+## stage timing is off unless enabled (config instrumentation_enabled); disabled, a decorated call costs one check
+_enabled = False
+_histograms = {}
+_registry_lock = threading.Lock()
 
 
 def hiresTimer():
     return time.perf_counter
 
 
+class LatencyHistogram:
+    """
+    Log bucketed latency histogram: buckets grow by 2^(1/8) (about 9%) from 1 microsecond, so percentiles are
+    within one bucket of the exact value at a fixed memory cost. Count, total and max are exact.
+    """
+    MIN_SECONDS = 1e-6
+    BUCKETS_PER_DOUBLING = 8
+    BUCKETS = 30 * BUCKETS_PER_DOUBLING  # up to ~1000 seconds
+
+    def __init__(self, name: str):
+        self.name = name
+        self.__counts = [0] * (self.BUCKETS + 1)
+        self.__lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        if seconds > self.MIN_SECONDS:
+            i = min(int(math.log2(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DOUBLING) + 1, self.BUCKETS)
+        else:
+            i = 0
+        with self.__lock:
+            self.__counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, p: float):
+        """
+        :param p: 0 - 100
+        :return: seconds, the upper bound of the bucket holding the p-th percentile (capped by the max)
+        """
+        with self.__lock:
+            if not self.count:
+                return 0.0
+            rank = max(math.ceil(p / 100 * self.count), 1)
+            seen = 0
+            for i, c in enumerate(self.__counts):
+                seen += c
+                if seen >= rank:
+                    return min(self.MIN_SECONDS * 2 ** (i / self.BUCKETS_PER_DOUBLING), self.max)
+        return self.max
+
+    def reset(self):
+        with self.__lock:
+            self.__counts = [0] * (self.BUCKETS + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def stats(self):
+        """
+        :return: count, avg, p50, p95, p99 and max in ms
+        """
+        return dict(count=self.count, avg_ms=round(1000 * self.total / self.count, 3) if self.count else 0.0,
+                    p50_ms=round(1000 * self.percentile(50), 3), p95_ms=round(1000 * self.percentile(95), 3),
+                    p99_ms=round(1000 * self.percentile(99), 3), max_ms=round(1000 * self.max, 3))
+
+
+def enable(flag: bool = True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def enabled():
+    return _enabled
+
+
+def histogram(name: str):
+    """
+    :return: the named histogram, created on first use
+    """
+    h = _histograms.get(name)
+    if h is None:
+        with _registry_lock:
+            h = _histograms.setdefault(name, LatencyHistogram(name))
+    return h
+
+
+def record(name: str, seconds: float):
+    """
+    Add a latency measured elsewhere (queue wait, ingest delay) to the named histogram, when enabled.
+    """
+    if _enabled:
+        histogram(name).record(seconds)
+
+
+def stats():
+    """
+    :return: stage name -> histogram stats, of the stages that recorded anything
+    """
+    return {name: h.stats() for name, h in sorted(_histograms.items()) if h.count}
+
+
+def reset():
+    for h in list(_histograms.values()):
+        h.reset()
+
+
+def dump(log_level=logging.INFO, path: str = None):
+    """
+    Log one line per stage and optionally write the aggregates as JSON.
+    """
+    rs = stats()
+    logger = logging.getLogger('timeit')
+    for name, s in rs.items():
+        logger.log(log_level, f"{name:20s} count {s['count']:8d}  avg {s['avg_ms']:10.3f} ms  "
+                              f"p50 {s['p50_ms']:10.3f}  p95 {s['p95_ms']:10.3f}  p99 {s['p99_ms']:10.3f}  "
+                              f"max {s['max_ms']:10.3f} ms")
+    if path and rs:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(rs, f, indent=2)
+    return rs
+
+
+def start_periodic_dump(interval_seconds: float, log_level=logging.INFO):
+    """
+    Dump the aggregates every interval from a daemon thread, until the returned event is set.
+    """
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval_seconds):
+            dump(log_level)
+
+    threading.Thread(target=run, name='timeit-dump', daemon=True).start()
+    return stopped
+
+
 class ThreadLocal(threading.local):
     initialized = False
     def __init__(self, **defaults):
@@ -28,6 +166,10 @@ class Timer(object):
         self.log_level = kwargs.pop('log_level', logging.INFO)
         self.gc_off = kwargs.pop('gc_off', False)
         self.process_time = kwargs.pop('process_time', False)
+        ## name or LatencyHistogram every timing is recorded into
+        self.histogram = kwargs.pop('histogram', None)
+        if isinstance(self.histogram, str):
+            self.histogram = histogram(self.histogram)
         self.args = args
         self._elapsed = 0
         self._count = 0
@@ -59,10 +201,12 @@ class Timer(object):
         self._count += 1
         if self.parent:
             self.parent._childTime += t
-            Timer.tl.timer=self.parent
+        Timer.tl.timer = self.parent
         self._start = None
         if self.restoreGc:
             gc.enable()
+        if self.histogram is not None:
+            self.histogram.record(t)
         if self.verbose and (self._elapsed >= self.threshold):
             self._log(':%s seconds' % self.time_fmt, (self._elapsed, ))
 
@@ -74,7 +218,7 @@ class Timer(object):
         return __wrapper
 
     def _log(self, msg, args):
-        logger = get_logger(self.logname)
+        logger = logging.getLogger(self.logname)
         logger.log(self.log_level, self.fmt + msg, *(self.args+args))
 
     def name(self):
@@ -91,3 +235,21 @@ class Timer(object):
 
 def timed(func):
     return Timer(func.__name__)(func)
+
+
+def stage(name: str):
+    """
+    Decorator timing every call into the `name` histogram while instrumentation is enabled; a fresh Timer per
+    call, so decorated functions may run on several threads and nest (the outer stage's childTime grows).
+    """
+    h = histogram(name)
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Timer(name, verbose=False, histogram=h):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
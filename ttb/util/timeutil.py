@@ -1,15 +1,35 @@
 import datetime
+import os
+import re
 
 
-def parse_time(time_hh_MM: str):
+def parse_time(time_hh_MM: str, date=None):
+    """
+    :param date: day of the time, a date/datetime or 'YYYYMMDD' string; today if not given
+    """
     t_hr = int(time_hh_MM.split(":")[0])
     t_min = int(time_hh_MM.split(":")[1])
-    t_target = datetime.datetime.today().replace(hour=t_hr, minute=t_min,second=0,microsecond=0)
+    if date is None:
+        day = datetime.datetime.today()
+    elif isinstance(date, str):
+        day = datetime.datetime.strptime(date, "%Y%m%d")
+    else:
+        day = datetime.datetime(date.year, date.month, date.day)
+    t_target = day.replace(hour=t_hr, minute=t_min,second=0,microsecond=0)
     return t_target
 
 
+def cob_dates(root_dir: str, start: str = None, end: str = None):
+    """
+    :return: sorted cob dates of the <YYYYMMDD> day folders (journals, alerts) of root_dir within [start, end]
+    """
+    return sorted(d for d in os.listdir(root_dir)
+                  if re.fullmatch(r'\d{8}', d) and os.path.isdir(f'{root_dir}{os.sep}{d}')
+                  and (not start or d >= start) and (not end or d <= end))
+
 
 if __name__ == "__main__":
 
     t = parse_time("16:22")
     print(t)
+    print(parse_time("16:22", "20220513"))
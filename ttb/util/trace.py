@@ -0,0 +1,67 @@
+import time
+
+## pipeline stages in the order an alert goes through them; not every source has every stage
+ALERT = 'alert'            # alert time stamp: RPA alert ts or the e-mail Date header
+FILE_WRITE = 'file_write'  # alert file modified (RPA), only known for lines read on a file change notification
+PICKUP = 'pickup'          # read by the alert reader
+ENQUEUE = 'enqueue'        # put on the event queue
+DEQUEUE = 'dequeue'        # taken off the queue by the bot
+QUOTE = 'quote'            # quotes of the basket returned
+EXEC = 'exec'              # executed (exec_time)
+JOURNAL = 'journal'        # execution handed to the trade journal, marked by the file sink after the execution
+STAGES = (ALERT, FILE_WRITE, PICKUP, ENQUEUE, DEQUEUE, QUOTE, EXEC, JOURNAL)
+
+
+class TraceContext:
+    """
+    Wall clock time stamps (epoch seconds) of the stages one alert went through, carried as the last element of
+    the event tuple from the reader to the bot. Every execution of the alert forks its own copy.
+    """
+    __slots__ = ('alert_ts', 'marks')
+
+    def __init__(self, alert_ts: str = None, marks: dict = None):
+        self.alert_ts = alert_ts
+        self.marks = marks or {}
+
+    def mark(self, stage: str, t: float = None):
+        self.marks[stage] = time.time() if t is None else t
+        return self
+
+    def fork(self):
+        return TraceContext(self.alert_ts, dict(self.marks))
+
+    def __repr__(self):
+        return f'TraceContext({self.alert_ts}, {breakdown(self.marks)})'
+
+
+def trace_of(event: tuple):
+    """
+    :return: the TraceContext at the end of an event tuple, None for untraced events (replays, load tests)
+    """
+    return event[-1] if event and isinstance(event[-1], TraceContext) else None
+
+
+def breakdown(marks: dict):
+    """
+    :return: ms spent reaching each stage from the previous recorded one, plus 'pipeline' (first stage after the
+             alert to the execution, the delay the bot itself adds) and 'total' (alert to the execution). Both end
+             at EXEC when it is marked, so the trace journal (which also has JOURNAL) and the report agree
+    """
+    rs = {}
+    prev = None
+    for stage in STAGES:
+        t = marks.get(stage)
+        if t is None:
+            continue
+        if prev is not None:
+            rs[stage] = round(1000 * (t - prev), 3)
+        prev = t
+    recorded = [s for s in STAGES if s in marks]
+    if EXEC in marks:
+        recorded = recorded[:recorded.index(EXEC) + 1]
+    if len(recorded) > 1:
+        first = recorded[1] if recorded[0] == ALERT else recorded[0]
+        rs['pipeline'] = round(1000 * (marks[recorded[-1]] - marks[first]), 3)
+        if ALERT in marks:
+            rs['total'] = round(1000 * (marks[recorded[-1]] - marks[ALERT]), 3)
+    return rs